@@ -0,0 +1,99 @@
+"""Compare the single-pass edit engine with the previous per-edit implementation.
+
+Run from src/: python -m benchmarks.edit_bench --lines 20000 --edits 40
+"""
+import argparse
+import random
+import re
+import statistics
+import time
+
+from tools.edit_engine import apply_edits
+
+
+def legacy_apply_edits(content: str, edits: list[dict[str, str]]) -> str:
+    """The algorithm apply_file_edits used before the edit engine, kept for comparison"""
+    modified_content = content
+    for edit in edits:
+        normalized_old = edit['oldText']
+        normalized_new = edit['newText']
+        if normalized_old in modified_content:
+            modified_content = modified_content.replace(normalized_old, normalized_new)
+            continue
+        old_lines = normalized_old.split('\n')
+        content_lines = modified_content.split('\n')
+        match_found = False
+        for i in range(len(content_lines) - len(old_lines) + 1):
+            potential_match = content_lines[i:i + len(old_lines)]
+            is_match = all(
+                old_line.strip() == content_line.strip()
+                for old_line, content_line in zip(old_lines, potential_match)
+            )
+            if is_match:
+                original_indent = re.match(r"^\s*", content_lines[i])[0] if content_lines[i] else ''
+                new_lines = normalized_new.split('\n')
+                transformed_new_lines = []
+                for j, line in enumerate(new_lines):
+                    if j == 0:
+                        transformed_new_lines.append(original_indent + line.lstrip())
+                    else:
+                        old_indent = re.match(r"^\s*", old_lines[j])[0] if j < len(old_lines) and old_lines[j] else ''
+                        new_indent = re.match(r"^\s*", line)[0] if line else ''
+                        if old_indent and new_indent:
+                            relative_indent = len(new_indent) - len(old_indent)
+                            transformed_new_lines.append(original_indent + ' ' * max(0, relative_indent) + line.lstrip())
+                        else:
+                            transformed_new_lines.append(line)
+                content_lines[i:i + len(old_lines)] = transformed_new_lines
+                modified_content = '\n'.join(content_lines)
+                match_found = True
+                break
+        if not match_found:
+            raise Exception(f"Could not find exact match for edit:\n{edit['oldText']}")
+    return modified_content
+
+
+def synthetic_do_file(lines: int, edits: int, seed: int = 0) -> tuple[str, list[dict[str, str]]]:
+    """A .do file with unique regression blocks and edits, half of them with reindented oldText"""
+    rng = random.Random(seed)
+    blocks = []
+    for n in range(lines // 4):
+        blocks.append(
+            f"* specification {n}\n"
+            f"    regress y{n} x{n} controls_{rng.randint(0, 9)}, robust\n"
+            f"    estimates store m{n}\n"
+        )
+    content = "".join(blocks)
+    chosen = sorted(rng.sample(range(lines // 4 - 1), edits))
+    edit_list = []
+    for k, n in enumerate(chosen):
+        old = f"    estimates store m{n}\n" if k % 2 else f"estimates store m{n}\n  * specification {n + 1}"
+        edit_list.append({'oldText': old, 'newText': f"    estimates store spec{n}\n" if k % 2 else f"estimates store spec{n}"})
+    return content, edit_list
+
+
+def time_it(func, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--edits", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    content, edits = synthetic_do_file(args.lines, args.edits)
+    for name, func in (("legacy", legacy_apply_edits), ("engine", apply_edits)):
+        timings = time_it(lambda: func(content, edits), args.repeat)
+        print(f"{name:>7}: median {statistics.median(timings) * 1000:9.2f} ms  "
+              f"min {min(timings) * 1000:9.2f} ms  ({args.lines} lines, {args.edits} edits)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""Benchmark the filesystem hot paths on a synthetic research project tree.
+
+Generates a tree of do-files, CSVs, logs and datasets (plus a few large CSV and
+log files) in a temporary directory, points the file index and path validator
+at it, and times search_files, build_tree, read_multiple_files, apply_file_edits
+and validate_path. Each case reports p50/p99 latency, throughput and peak
+traced memory. Results are written as JSON; pass --compare with an earlier
+result file to print the change per case and exit non-zero on regressions.
+
+Run from src/: python -m benchmarks.fs_bench --files 20000 --out fs_bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Awaitable, Callable
+
+import numpy as np
+
+from benchmarks.report import compare, git_revision
+import tools.filesystem_manager as fm
+from tools.file_index import File_index
+from tools.path_validator import Path_validator
+
+_KINDS = (".do", ".do", ".csv", ".log", ".dta", ".txt", ".md")
+_DIR_NAMES = ("data", "raw", "clean", "analysis", "output", "tables", "figures", "logs", "scripts", "archive", "wave")
+
+
+def generate_tree(root: str, files: int, depth: int, fanout: int, large_files: int, large_mb: int, seed: int = 0) -> dict:
+    """Write a synthetic project below `root`; returns what was created"""
+    rng = random.Random(seed)
+    directories = [root]
+    frontier = [root]
+    for level in range(depth):
+        next_frontier = []
+        for parent in frontier:
+            for n in range(fanout):
+                path = os.path.join(parent, f"{_DIR_NAMES[(level + n) % len(_DIR_NAMES)]}_{level}_{n}")
+                next_frontier.append(path)
+        directories += next_frontier
+        frontier = next_frontier
+        if len(directories) * 8 > files:
+            break
+    for path in directories:
+        os.makedirs(path, exist_ok=True)
+
+    do_files = []
+    for number in range(files):
+        directory = directories[rng.randrange(len(directories))]
+        extension = _KINDS[number % len(_KINDS)]
+        path = os.path.join(directory, f"spec_{number}{extension}")
+        if extension == ".do":
+            content = "".join(
+                f"* specification {number}.{k}\nregress y{k} x{k} controls_{rng.randint(0, 9)}, robust\nestimates store m{number}_{k}\n"
+                for k in range(8)
+            )
+            do_files.append(path)
+        elif extension == ".csv":
+            content = "id,year,y,x\n" + "".join(f"{i},{2000 + i % 20},{rng.random():.4f},{rng.random():.4f}\n" for i in range(20))
+        else:
+            content = f"file {number}\n"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    large = []
+    block = "".join(f"{i},{2000 + i % 20},{i * 0.37:.4f},{i * 1.13:.4f},region_{i % 50}\n" for i in range(20000)).encode()
+    for number in range(large_files):
+        extension = ".csv" if number % 2 == 0 else ".log"
+        path = os.path.join(directories[rng.randrange(len(directories))], f"large_{number}{extension}")
+        with open(path, "wb") as f:
+            written = 0
+            while written < large_mb * 1024 * 1024:
+                f.write(block)
+                written += len(block)
+        large.append(path)
+    return {"directories": directories, "do_files": do_files, "large_files": large}
+
+
+async def measure(name: str, func: Callable[[], Awaitable[int]], repeat: int, warmup: int = 1) -> dict:
+    """Time `func` (which returns the number of items it processed) and trace its peak memory once"""
+    for _ in range(warmup):
+        await func()
+    timings = []
+    items = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        items = await func()
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        await func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    values = np.array(timings)
+    p50, p99 = np.percentile(values, [50, 99]).tolist()
+    result = {
+        "p50_ms": p50 * 1000,
+        "p99_ms": p99 * 1000,
+        "mean_ms": float(values.mean()) * 1000,
+        "items": items,
+        "items_per_s": items / p50 if p50 > 0 else None,
+        "peak_mb": peak / (1024 * 1024),
+        "repeat": repeat,
+    }
+    print(f"{name:>28}: p50 {result['p50_ms']:9.2f} ms  p99 {result['p99_ms']:9.2f} ms  "
+          f"{result['items_per_s'] or 0:12.0f} items/s  peak {result['peak_mb']:8.2f} MB")
+    return result
+
+
+def count_entries(entries: list) -> int:
+    return sum(1 + count_entries(entry.children or []) for entry in entries)
+
+
+def use_root(root: str, index_dir: str) -> None:
+    """Point the module-level index and validator of filesystem_manager at `root`"""
+    fm.allowed_directories = [root]
+    fm.file_index = File_index([root], index_dir=index_dir)
+    fm.path_validator = Path_validator([root])
+
+
+async def run_cases(root: str, index_dir: str, created: dict, repeat: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    results = {}
+
+    async def cold_search() -> int:
+        use_root(root, None)  # no persisted index: first query scans the whole tree
+        return len(await fm.search_files(root, "spec_1"))
+
+    results["search_files_cold"] = await measure("search_files (cold index)", cold_search, max(1, repeat // 5), warmup=0)
+    use_root(root, index_dir)
+    for name, pattern, extension in (("substring", "spec_1", None), ("glob", "**/*.csv", None), ("extension", "spec", ".do")):
+        async def search(pattern=pattern, extension=extension) -> int:
+            return len(await fm.search_files(root, pattern, ["archive_*"], extension))
+        results[f"search_files_{name}"] = await measure(f"search_files ({name})", search, repeat)
+
+    async def tree() -> int:
+        return count_entries(await fm.build_tree(root, max_depth=None, max_entries=None))
+
+    async def tree_page() -> int:
+        return count_entries(await fm.build_tree(root, max_depth=3, max_entries=2000))
+
+    results["build_tree_full"] = await measure("build_tree (full)", tree, max(1, repeat // 2))
+    results["build_tree_page"] = await measure("build_tree (depth 3, 2000)", tree_page, repeat)
+
+    small = rng.sample(created["do_files"], min(20, len(created["do_files"])))
+    mixed = small[:10] + created["large_files"]
+
+    async def read_small() -> int:
+        return len(await fm.read_multiple_files.ainvoke({"path": small}))
+
+    async def read_mixed() -> int:
+        results = await fm.read_multiple_files.ainvoke({"path": mixed, "mode": "tail"})
+        return sum(item.get("bytes_read") or 0 for item in results)
+
+    results["read_multiple_files_small"] = await measure("read_multiple_files (20 do)", read_small, repeat)
+    if created["large_files"]:
+        results["read_multiple_files_large"] = await measure("read_multiple_files (bytes)", read_mixed, repeat)
+
+    target = created["do_files"][0]
+    with open(target, "r", encoding="utf-8") as f:
+        original = f.read()
+    edits = [
+        {"oldText": f"estimates store m0_{k}", "newText": f"estimates store spec0_{k}"}
+        for k in range(8)
+    ]
+
+    async def edit() -> int:
+        await fm.apply_file_edits(target, edits)
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(original)
+        return len(edits)
+
+    results["apply_file_edits"] = await measure("apply_file_edits (8 edits)", edit, repeat)
+
+    paths = [os.path.join(directory, f"spec_{rng.randrange(10 ** 6)}.do") for directory in rng.choices(created["directories"], k=1000)]
+    paths += rng.sample(created["do_files"], min(1000, len(created["do_files"])))
+
+    async def validate_cold() -> int:
+        fm.path_validator = Path_validator([root])
+        return len(fm.path_validator.validate_many(paths))
+
+    async def validate_warm() -> int:
+        for path in paths:
+            await fm.validate_path(path)
+        return len(paths)
+
+    results["validate_path_cold"] = await measure("validate_path (cold, batch)", validate_cold, repeat)
+    fm.path_validator = Path_validator([root])
+    results["validate_path_warm"] = await measure("validate_path (warm)", validate_warm, repeat)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--depth", type=int, default=6, help="maximum directory nesting")
+    parser.add_argument("--fanout", type=int, default=4, help="subdirectories per directory")
+    parser.add_argument("--large-files", type=int, default=2, help="number of large CSV/log files")
+    parser.add_argument("--large-mb", type=int, default=50, help="size of each large file")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", help="generate the tree here and keep it (default: a temporary directory)")
+    parser.add_argument("--out", default="fs_bench.json", help="where to write the results")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p50 growth reported as a regression")
+    args = parser.parse_args()
+
+    root = args.dir or tempfile.mkdtemp(prefix="era_fs_bench_")
+    index_dir = tempfile.mkdtemp(prefix="era_fs_bench_index_")
+    try:
+        started = time.perf_counter()
+        created = generate_tree(root, args.files, args.depth, args.fanout, args.large_files, args.large_mb, args.seed)
+        print(f"generated {args.files} files in {len(created['directories'])} directories "
+              f"(+{args.large_files} x {args.large_mb} MB) in {time.perf_counter() - started:.1f}s: {root}")
+        results = asyncio.run(run_cases(os.path.realpath(root), index_dir, created, args.repeat, args.seed))
+    finally:
+        if not args.dir:
+            shutil.rmtree(root, ignore_errors=True)
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "files": args.files,
+            "depth": args.depth,
+            "fanout": args.fanout,
+            "large_files": args.large_files,
+            "large_mb": args.large_mb,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("files") != args.files:
+            print("note: the baseline was run on a tree of a different size")
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
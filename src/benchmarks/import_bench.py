@@ -0,0 +1,112 @@
+"""Benchmark the cold-start cost of the entry points.
+
+Each case starts a fresh interpreter with -X importtime, so nothing is shared
+with earlier runs except the OS file cache and compiled .pyc files (one warmup
+run fills both). The wall time of the whole process is reported as p50/p99,
+together with the modules that took longest to import, by cumulative time, in
+the last run. Results use the fs_bench layout, so --compare works the same way.
+The harness itself imports nothing from the project beyond benchmarks.report.
+
+Run from src/: python -m benchmarks.import_bench --repeat 20 --out import_bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.report import compare, git_revision
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = {
+    # The CLI entry point, up to the point where it would start working
+    "main_help": [os.path.join(SRC, "main.py"), "--help"],
+    "import_main": ["-c", "import main"],
+    # What a content-search process-pool worker imports before its first batch
+    "search_worker": ["-c", "from tools.file_reader import search_file_batch"],
+    "stata_worker": [os.path.join(SRC, "tools", "stata_worker.py"), "--help"],
+    "import_agent_router": ["-c", "import core.agent_router"],
+    "load_tools": ["-c", "from core.agent_router import load_tools; load_tools()"],
+}
+
+
+def parse_importtime(stderr: str, top: int) -> list[dict]:
+    """Slowest imports by cumulative microseconds, from -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|", 2))
+        rows.append({"module": name.strip(), "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    return sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:top]
+
+
+def run_case(name: str, args: list[str], repeat: int, top: int) -> dict:
+    command = [sys.executable, "-X", "importtime", *args]
+    env = dict(os.environ, PYTHONPATH=SRC + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    timings = []
+    completed = None
+    for run in range(repeat + 1):
+        started = time.perf_counter()
+        completed = subprocess.run(command, cwd=SRC, env=env, capture_output=True, text=True)
+        if run:  # the first run compiles .pyc files and warms the file cache
+            timings.append(time.perf_counter() - started)
+    if completed.returncode != 0:
+        error = completed.stderr.strip().splitlines()[-1:] or ["?"]
+        print(f"{name:>22}: failed ({error[0]})")
+        return {"error": error[0]}
+    values = np.array(timings)
+    p50, p99 = np.percentile(values, [50, 99]).tolist()
+    imports = parse_importtime(completed.stderr, top)
+    modules = sum(1 for line in completed.stderr.splitlines() if line.startswith("import time:")) - 1
+    print(f"{name:>22}: p50 {p50 * 1000:8.1f} ms  p99 {p99 * 1000:8.1f} ms  {modules:5d} modules  "
+          f"slowest: {', '.join(row['module'] for row in imports[:3])}")
+    return {
+        "p50_ms": p50 * 1000,
+        "p99_ms": p99 * 1000,
+        "mean_ms": float(values.mean()) * 1000,
+        "modules": modules,
+        "slowest_imports": imports,
+        "repeat": repeat,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to keep per case")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--out", default="import_bench.json", help="where to write the results")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p50 growth reported as a regression")
+    args = parser.parse_args()
+
+    results = {name: run_case(name, CASES[name], args.repeat, args.top) for name in args.cases}
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "results": {name: result for name, result in results.items() if "error" not in result},
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
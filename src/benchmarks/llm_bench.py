@@ -0,0 +1,65 @@
+"""Throughput of Llm_provider under concurrent agent sessions, offline.
+
+Each session sends `--turns` sequential calls to a Fake_chat_model; all sessions
+run at once. Compares whole responses with streamed ones, optionally with
+injected rate-limit errors.
+
+Run from src/: python -m benchmarks.llm_bench --sessions 32 --turns 10
+"""
+import argparse
+import asyncio
+import time
+
+from langchain_core.messages import HumanMessage
+
+from core.llm_provider import Fake_chat_model, Llm_provider
+
+
+async def run_sessions(provider: Llm_provider, sessions: int, turns: int, stream: bool) -> float:
+    async def session(number: int) -> None:
+        for turn in range(turns):
+            messages = [HumanMessage(content=f"session {number} turn {turn}: summarize the regression " * 20)]
+            if stream:
+                async for _ in provider.astream(messages):
+                    pass
+            else:
+                await provider.ainvoke(messages)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(number) for number in range(sessions)))
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per fake model call")
+    parser.add_argument("--rpm", type=float, default=6000, help="requests per minute allowed by the limiter")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="make every Nth fake call fail with a 429")
+    args = parser.parse_args()
+
+    scenarios = [
+        ("invoke", False),
+        ("streaming", True),
+    ]
+    calls = args.sessions * args.turns
+    print(f"{args.sessions} sessions x {args.turns} turns, model latency {args.latency * 1000:.0f} ms, {args.rpm:g} rpm, concurrency {args.concurrency}")
+    for name, stream in scenarios:
+        model = Fake_chat_model(latency=args.latency, rate_limit_every=args.rate_limit_every, words_per_second=2000)
+        provider = Llm_provider(
+            model="fake", chat_model=model, requests_per_minute=args.rpm,
+            max_concurrency=args.concurrency, backoff_base=0.05,
+        )
+        elapsed = asyncio.run(run_sessions(provider, args.sessions, args.turns, stream))
+        summary = provider.metrics.summary()
+        print(
+            f"{name:>10}: {calls / elapsed:8.1f} calls/s  p50 {summary.get('latency_p50', 0) * 1000:7.1f} ms"
+            f"  p99 {summary.get('latency_p99', 0) * 1000:7.1f} ms  retries {summary['retries']}"
+            f"  rate-limited {summary['rate_limited']}  tokens {summary['input_tokens']}/{summary['output_tokens']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""Helpers shared by the benchmark scripts for their JSON reports.
+
+Only the standard library is imported here, so a benchmark that measures
+imports does not load the modules it measures.
+"""
+import subprocess
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Cases whose p50 grew by more than `threshold` (0.2 = 20%) against the baseline"""
+    regressions = []
+    print(f"\n{'case':>28}  {'baseline':>10}  {'current':>10}  change")
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        change = result["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:>28}  {before['p50_ms']:8.2f}ms  {result['p50_ms']:8.2f}ms  {change:+7.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
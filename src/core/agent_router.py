@@ -0,0 +1,284 @@
+"""LangGraph agent that routes model tool calls to the filesystem and Stata tools.
+
+The graph alternates between the model and a tool step until the model answers
+without tool calls. The tool step runs every call of a turn concurrently:
+reads share a per-tool concurrency limit, and calls that write a path wait for
+the calls before them in the turn that touch the same path (or a path below
+or above it), and for writes from other sessions that overlap it the same way.
+"""
+import asyncio
+import importlib
+import json
+import os
+import time
+import weakref
+from typing import TYPE_CHECKING, Any, NamedTuple, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage, ToolMessage
+from pydantic import BaseModel
+
+from core.context_budget import Context_budget
+from tools.instrumentation import profiled
+
+if TYPE_CHECKING:
+    from core.llm_provider import Llm_provider
+
+SYSTEM_PROMPT = (
+    "You are an economic research assistant. You can read and edit files in the allowed "
+    "directories, preview .dta/.csv/.parquet datasets without opening Stata, and run Stata "
+    "do-files. When several tool calls are independent, request them in the same turn; they "
+    "run in parallel."
+)
+
+# Tool name -> module and attribute; a module is imported the first time one of its tools is needed
+TOOL_SPECS = {
+    "read_file_tool": ("tools.filesystem_manager", "read_file"),
+    "read_multiple_files_tool": ("tools.filesystem_manager", "read_multiple_files"),
+    "write_file_tool": ("tools.filesystem_manager", "write_file"),
+    "edit_file_tool": ("tools.filesystem_manager", "edit_file"),
+    "create_directory_tool": ("tools.filesystem_manager", "create_directory"),
+    "list_directory_tool": ("tools.filesystem_manager", "list_directory"),
+    "directory_tree_tool": ("tools.filesystem_manager", "directory_tree"),
+    "move_file_tool": ("tools.filesystem_manager", "move_file"),
+    "search_files_tool": ("tools.filesystem_manager", "search_files_tool"),
+    "search_content_tool": ("tools.content_search", "search_content_tool"),
+    "get_file_info_tool": ("tools.filesystem_manager", "get_file_info"),
+    "list_allowed_directories_tool": ("tools.filesystem_manager", "list_allowed_directories"),
+    "dataset_preview_tool": ("tools.dataset_preview", "dataset_preview"),
+    "stata_interpreter_tool": ("tools.stata_interpreter", "stata_interpreter"),
+    "stata_batch_tool": ("tools.stata_interpreter", "stata_batch"),
+}
+
+_loaded_tools: dict[str, Any] = {}
+
+
+def load_tool(name: str) -> Any:
+    if name not in _loaded_tools:
+        if name not in TOOL_SPECS:
+            raise ValueError(f"unknown tool {name}; available: {', '.join(TOOL_SPECS)}")
+        module, attribute = TOOL_SPECS[name]
+        _loaded_tools[name] = getattr(importlib.import_module(module), attribute)
+    return _loaded_tools[name]
+
+
+def load_tools(names: Optional[Sequence[str]] = None) -> list:
+    return [load_tool(name) for name in (TOOL_SPECS if names is None else names)]
+
+
+class Tool_policy(NamedTuple):
+    writes: bool  # True if the tool changes the paths it is given
+    max_concurrency: int  # calls of this tool in flight at once, across sessions
+    path_arguments: tuple[str, ...]  # arguments holding the paths the call touches
+    reduction: str = "head_tail"  # how core.context_budget cuts the output to its budget
+    directories: bool = False  # True if the call touches the directories of its path arguments, not just the files
+
+
+DEFAULT_POLICY = Tool_policy(False, 8, ())
+
+TOOL_POLICIES = {
+    "read_file_tool": Tool_policy(False, 16, ("path",)),
+    "read_multiple_files_tool": Tool_policy(False, 4, ("path",), "files"),
+    "list_directory_tool": Tool_policy(False, 16, ("path",), "head"),
+    "directory_tree_tool": Tool_policy(False, 4, ("path",), "tree"),
+    "search_files_tool": Tool_policy(False, 4, ("path",), "head"),
+    "search_content_tool": Tool_policy(False, 4, ("path",), "head"),
+    "get_file_info_tool": Tool_policy(False, 16, ("path",)),
+    "list_allowed_directories_tool": Tool_policy(False, 16, ()),
+    "dataset_preview_tool": Tool_policy(False, 4, ("path",)),
+    "write_file_tool": Tool_policy(True, 8, ("path",)),
+    "edit_file_tool": Tool_policy(True, 8, ("path",)),
+    "create_directory_tool": Tool_policy(True, 8, ("path",)),
+    "move_file_tool": Tool_policy(True, 8, ("source", "destination")),
+    # A run writes its log next to the do-file, so runs of one do-file are serialized
+    "stata_interpreter_tool": Tool_policy(True, 4, ("file_path",), "log"),
+    # Wrappers go to .stata_batch/ and logs and outputs next to the do-files, so a batch claims their directories
+    "stata_batch_tool": Tool_policy(True, 1, ("do_files", "template"), "log", directories=True),
+}
+
+
+def _call_paths(policy: Tool_policy, args: dict) -> list[str]:
+    paths = []
+    for name in policy.path_arguments:
+        value = args.get(name)
+        for path in [value] if isinstance(value, str) else value or []:
+            if isinstance(path, str):
+                path = os.path.abspath(os.path.expanduser(path))
+                paths.append(os.path.dirname(path) if policy.directories else path)
+    return paths
+
+
+def _overlaps(a: str, b: str) -> bool:
+    """True if one path is the other or lies below it"""
+    return a == b or a.startswith(b.rstrip(os.sep) + os.sep) or b.startswith(a.rstrip(os.sep) + os.sep)
+
+
+def _conflicts(first: tuple[Tool_policy, list[str]], second: tuple[Tool_policy, list[str]]) -> bool:
+    if not (first[0].writes or second[0].writes):
+        return False
+    return any(_overlaps(a, b) for a in first[1] for b in second[1])
+
+
+def tool_message_content(result: Any) -> str:
+    if isinstance(result, str):
+        return result
+    if isinstance(result, BaseModel):
+        return result.model_dump_json()
+    return json.dumps(result, default=str, ensure_ascii=False)
+
+
+class _Path_claims:
+    """Paths held by writing calls; a claim waits until no held path overlaps it"""
+
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._held: list[list[str]] = []
+
+    def _free(self, paths: list[str]) -> bool:
+        return not any(_overlaps(a, b) for held in self._held for a in held for b in paths)
+
+    async def acquire(self, paths: list[str]) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._free(paths))
+            self._held.append(paths)
+
+    async def release(self, paths: list[str]) -> None:
+        async with self._condition:
+            self._held.remove(paths)
+            self._condition.notify_all()
+
+
+class Tool_router:
+    """Executes the tool calls of one model turn concurrently under per-tool limits.
+
+    Semaphores and path claims belong to the running event loop and are shared by
+    every session on it. `stats` accumulates per-turn wall time and the summed
+    time of the calls, whose ratio is the speedup over running them one by one.
+    Outputs pass through `budget` before they enter the agent state.
+    """
+
+    def __init__(
+        self,
+        tools: Optional[Sequence] = None,
+        policies: Optional[dict[str, Tool_policy]] = None,
+        budget: Optional[Context_budget] = None,
+    ):
+        self._tools = None if tools is None else {tool.name: tool for tool in tools}
+        self.policies = dict(TOOL_POLICIES if policies is None else policies)
+        self.budget = budget or Context_budget()
+        self.stats = {"turns": 0, "calls": 0, "errors": 0, "wall_time": 0.0, "tool_time": 0.0}
+        self._loop_state: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    @property
+    def tools(self) -> dict[str, Any]:
+        """Every tool in TOOL_SPECS unless the router was given its own, loaded on first access"""
+        if self._tools is None:
+            self._tools = {tool.name: tool for tool in load_tools()}
+        return self._tools
+
+    def tool_list(self) -> list:
+        # A method rather than the property, because LangGraph resolves attributes a node closes over
+        return list(self.tools.values())
+
+    def policy(self, name: str) -> Tool_policy:
+        return self.policies.get(name, DEFAULT_POLICY)
+
+    def _state(self) -> tuple[dict[str, asyncio.Semaphore], _Path_claims]:
+        loop = asyncio.get_running_loop()
+        if loop not in self._loop_state:
+            self._loop_state[loop] = ({}, _Path_claims())
+        return self._loop_state[loop]
+
+    def _semaphore(self, name: str) -> asyncio.Semaphore:
+        semaphores, _ = self._state()
+        if name not in semaphores:
+            semaphores[name] = asyncio.Semaphore(self.policy(name).max_concurrency)
+        return semaphores[name]
+
+    async def _invoke(self, call: dict, paths: list[str], after: list[asyncio.Task]) -> tuple[ToolMessage, float]:
+        if after:
+            await asyncio.wait(after)
+        name = call["name"]
+        tool = self.tools.get(name)
+        started = time.perf_counter()
+        try:
+            if tool is None:
+                raise ValueError(f"unknown tool {name}; available: {', '.join(self.tools)}")
+            async with self._semaphore(name):
+                # Held against writes from other sessions to the same path, or one below or above it
+                claimed = sorted(set(paths)) if self.policy(name).writes else []
+                if claimed:
+                    await self._state()[1].acquire(claimed)
+                try:
+                    result = await tool.ainvoke(call["args"])
+                finally:
+                    if claimed:
+                        await self._state()[1].release(claimed)
+            message = ToolMessage(content=tool_message_content(result), name=name, tool_call_id=call["id"])
+        except Exception as e:
+            self.stats["errors"] += 1
+            message = ToolMessage(content=f"Error: {type(e).__name__}: {e}", name=name, tool_call_id=call["id"], status="error")
+        return message, time.perf_counter() - started
+
+    async def run(self, tool_calls: Sequence[dict]) -> list[ToolMessage]:
+        """ToolMessages for `tool_calls`, in the order of the calls"""
+        started = time.perf_counter()
+        scheduled: list[tuple[tuple[Tool_policy, list[str]], asyncio.Task]] = []
+        for call in tool_calls:
+            policy = self.policy(call["name"])
+            footprint = (policy, _call_paths(policy, call["args"]))
+            # Conflicting calls run in the order the model asked for them
+            after = [task for earlier, task in scheduled if _conflicts(earlier, footprint)]
+            task = asyncio.ensure_future(self._invoke(call, footprint[1], after))
+            scheduled.append((footprint, task))
+        results = await asyncio.gather(*(task for _, task in scheduled))
+        self.stats["turns"] += 1
+        self.stats["calls"] += len(results)
+        self.stats["wall_time"] += time.perf_counter() - started
+        self.stats["tool_time"] += sum(elapsed for _, elapsed in results)
+        return [message for message, _ in results]
+
+    async def __call__(self, state: dict) -> dict:
+        last = state["messages"][-1]
+        tool_calls = last.tool_calls if isinstance(last, AIMessage) else []
+        messages = await self.run(tool_calls)
+        # Replacements for older outputs keep their ids, so add_messages updates them in place
+        return {"messages": self.budget.apply(state["messages"], messages, lambda name: self.policy(name).reduction)}
+
+
+def build_agent(
+    provider: Optional["Llm_provider"] = None,
+    tools: Optional[Sequence] = None,
+    system_prompt: str = SYSTEM_PROMPT,
+    router: Optional[Tool_router] = None,
+):
+    """Compiled LangGraph graph over MessagesState; the tools are loaded at the first model call"""
+    from langgraph.graph import END, START, MessagesState, StateGraph
+
+    from core.llm_provider import get_llm_provider
+
+    router = router or Tool_router(tools)
+
+    async def call_model(state: MessagesState) -> dict:
+        messages: list[BaseMessage] = [SystemMessage(content=system_prompt), *state["messages"]]
+        response = await (provider or get_llm_provider()).ainvoke(messages, tools=router.tool_list())
+        return {"messages": [response]}
+
+    def route(state: MessagesState) -> str:
+        last = state["messages"][-1]
+        return "tools" if isinstance(last, AIMessage) and last.tool_calls else END
+
+    graph = StateGraph(MessagesState)
+    graph.add_node("agent", call_model)
+    graph.add_node("tools", router)
+    graph.add_edge(START, "agent")
+    graph.add_conditional_edges("agent", route, ["tools", END])
+    graph.add_edge("tools", "agent")
+    return graph.compile()
+
+
+async def run_agent(prompt: str, agent=None, recursion_limit: int = 50) -> str:
+    """Answer one prompt and return the model's final message"""
+    agent = agent or build_agent()
+    with profiled("agent_run"):
+        state = await agent.ainvoke({"messages": [("user", prompt)]}, {"recursion_limit": recursion_limit})
+    return str(state["messages"][-1].content)
@@ -0,0 +1,144 @@
+"""Runtime settings, read once from defaults, a config file, the environment and the command line.
+
+Later sources win: a TOML (or JSON) config file, then ERA_* environment
+variables, then command-line options. The file is the one named by --config or
+ERA_CONFIG, else ~/.config/economic-research-assistant/config.toml when it
+exists. Every setting `name` has the variable ERA_<NAME> and the option
+--<name-with-dashes>; lists are separated by os.pathsep in the environment.
+
+Only the standard library is imported here, so the entry points can parse their
+configuration before anything heavy is loaded.
+"""
+import argparse
+import json
+import os
+import typing
+from typing import Any, Mapping, NamedTuple, Optional
+
+ENV_PREFIX = "ERA_"
+CONFIG_ENV = "ERA_CONFIG"
+DEFAULT_CONFIG_FILE = os.path.join(os.path.expanduser("~"), ".config", "economic-research-assistant", "config.toml")
+
+
+class Settings(NamedTuple):
+    allowed_directories: tuple[str, ...] = ("D:\\projects",)
+    stata_path: str = r"C:\Program Files\Stata17\StataMP-64.exe"
+    do_file: str = r"D:\projects\test\test_script.do"
+    stata_backend: str = "pystata"  # 'pystata' or 'echo'
+    stata_edition: str = "mp"
+    stata_pool_size: int = 2  # 0 launches StataMP in batch mode per call
+    stata_licensed_cores: int = 4
+    stata_cache_enabled: bool = True
+    model: str = "gemini-2.0-flash"
+    requests_per_minute: int = 60
+    llm_cache_enabled: bool = True
+    recursion_limit: int = 50
+    watch: bool = True  # follow changes below the allowed directories during a session
+    # Only inotify (Linux) by default: polling re-stats every tree every few seconds,
+    # which costs more than the index's own checks, and Windows has no native backend yet
+    watch_backend: str = "inotify"  # 'inotify' or 'poll'
+    log_level: str = "WARNING"
+    log_json: bool = True
+
+
+_TYPES = typing.get_type_hints(Settings)
+_TRUE = {"1", "true", "yes", "on"}
+_FALSE = {"0", "false", "no", "off", ""}
+
+
+def _coerce(name: str, value: Any) -> Any:
+    if name not in _TYPES:
+        raise ValueError(f"unknown setting {name!r}; known settings: {', '.join(Settings._fields)}")
+    kind = _TYPES[name]
+    try:
+        if kind is bool:
+            if isinstance(value, bool):
+                return value
+            text = str(value).strip().lower()
+            if text not in _TRUE | _FALSE:
+                raise ValueError(f"expected one of {sorted(_TRUE | _FALSE)}")
+            return text in _TRUE
+        if typing.get_origin(kind) is tuple:
+            items = value.split(os.pathsep) if isinstance(value, str) else value
+            return tuple(str(item) for item in items if str(item))
+        return kind(value)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"invalid value for setting {name!r}: {value!r} ({e})")
+
+
+def read_config_file(path: str) -> dict[str, Any]:
+    """Settings from a .toml or .json file; an unknown key is an error"""
+    with open(path, "rb") as f:
+        if path.endswith(".json"):
+            data = json.load(f)
+        else:
+            import tomllib
+
+            data = tomllib.load(f)
+    return {name: _coerce(name, value) for name, value in data.items()}
+
+
+def settings_from_env(environ: Optional[Mapping[str, str]] = None) -> dict[str, Any]:
+    environ = os.environ if environ is None else environ
+    return {
+        name: _coerce(name, environ[ENV_PREFIX + name.upper()])
+        for name in Settings._fields
+        if ENV_PREFIX + name.upper() in environ
+    }
+
+
+def load_settings(
+    config_file: Optional[str] = None,
+    environ: Optional[Mapping[str, str]] = None,
+    overrides: Optional[Mapping[str, Any]] = None,
+) -> Settings:
+    environ = os.environ if environ is None else environ
+    values: dict[str, Any] = {}
+    config_file = config_file or environ.get(CONFIG_ENV)
+    if config_file:
+        values.update(read_config_file(config_file))
+    elif os.path.isfile(DEFAULT_CONFIG_FILE):
+        values.update(read_config_file(DEFAULT_CONFIG_FILE))
+    values.update(settings_from_env(environ))
+    values.update({name: _coerce(name, value) for name, value in (overrides or {}).items()})
+    return Settings(**values)
+
+
+def argument_parser(**kwargs) -> argparse.ArgumentParser:
+    """Parser with --config and one option per setting; options left out do not override anything"""
+    parser = argparse.ArgumentParser(argument_default=argparse.SUPPRESS, **kwargs)
+    parser.add_argument("--config", help=f"settings file (default: ${CONFIG_ENV} or {DEFAULT_CONFIG_FILE})")
+    group = parser.add_argument_group("settings", f"override the config file and the {ENV_PREFIX}* environment variables")
+    for name, default in Settings._field_defaults.items():
+        option = "--" + name.replace("_", "-")
+        if _TYPES[name] is bool:
+            group.add_argument(option, dest=name, action=argparse.BooleanOptionalAction, help=f"default: {default}")
+        elif typing.get_origin(_TYPES[name]) is tuple:
+            group.add_argument(option, dest=name, nargs="+", metavar="PATH", help=f"default: {' '.join(default)}")
+        else:
+            group.add_argument(option, dest=name, type=_TYPES[name], help=f"default: {default}")
+    return parser
+
+
+def settings_from_args(args: argparse.Namespace, environ: Optional[Mapping[str, str]] = None) -> Settings:
+    overrides = {name: value for name, value in vars(args).items() if name in Settings._fields}
+    return load_settings(getattr(args, "config", None), environ, overrides)
+
+
+_settings: Optional[Settings] = None
+
+
+def configure(settings: Settings) -> Settings:
+    """Make `settings` the process-wide settings; call before importing the tools"""
+    global _settings
+    _settings = settings
+    return settings
+
+
+def get_settings() -> Settings:
+    """Process-wide settings, loaded from the config file and the environment on first use"""
+    global _settings
+    if _settings is None:
+        _settings = load_settings()
+    return _settings
+
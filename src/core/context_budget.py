@@ -0,0 +1,246 @@
+"""Token budgets for tool outputs on their way into the agent state.
+
+Every tool output is cut to a per-call budget with the reduction its tool
+declares (see Tool_policy.reduction in core.agent_router), and the tool outputs
+of a conversation together are kept under a conversation budget by shrinking
+the oldest ones. All reductions are deterministic and local: no model calls.
+"""
+import json
+import re
+from collections import Counter
+from typing import Callable, Sequence
+
+from langchain_core.messages import BaseMessage, ToolMessage
+
+# Words, numbers and single punctuation marks; long words cost one token per 6 characters
+_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+_DIGITS = re.compile(r"\d+(\.\d+)?")
+
+
+def count_tokens(text: str) -> int:
+    """Local estimate of the tokens of `text`; one regex pass, no tokenizer download"""
+    if not text:
+        return 0
+    pieces = _PIECES.findall(text)
+    return len(pieces) + sum(len(piece) // 6 for piece in pieces if len(piece) > 6)
+
+
+def _omitted(lines: int, tokens: int) -> str:
+    return f"[... {lines} lines (~{tokens} tokens) omitted to fit the context budget ...]"
+
+
+def _take(lines: list[str], budget: int) -> int:
+    """How many leading lines fit in `budget` tokens"""
+    used = 0
+    for number, line in enumerate(lines):
+        used += count_tokens(line) + 1
+        if used > budget:
+            return number
+    return len(lines)
+
+
+def head(text: str, budget: int) -> str:
+    if count_tokens(text) <= budget:
+        return text
+    lines = text.split("\n")
+    kept = _take(lines, budget)
+    if kept == 0:
+        # A single huge line: cut by characters at ~3 characters per token
+        return text[: budget * 3] + "\n" + _omitted(len(lines), count_tokens(text) - budget)
+    rest = lines[kept:]
+    return "\n".join(lines[:kept] + [_omitted(len(rest), count_tokens("\n".join(rest)))])
+
+
+def head_tail(text: str, budget: int) -> str:
+    """Keep the first two thirds and the last third of the budget"""
+    if count_tokens(text) <= budget:
+        return text
+    lines = text.split("\n")
+    first = _take(lines, budget * 2 // 3)
+    last = _take(lines[first:][::-1], budget - budget * 2 // 3)
+    if first == 0 and last == 0:
+        return head(text, budget)
+    middle = lines[first:len(lines) - last]
+    return "\n".join(lines[:first] + [_omitted(len(middle), count_tokens("\n".join(middle)))] + lines[len(lines) - last:])
+
+
+def dedupe_lines(text: str) -> str:
+    """Collapse runs of lines that differ only in their numbers, e.g. optimizer iterations.
+
+    A run keeps its first and last line with a count in between; exact repeats
+    anywhere in the text after the third occurrence are dropped.
+    """
+    lines = text.split("\n")
+    out: list[str] = []
+    seen: Counter = Counter()
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        shape = _DIGITS.sub("#", line)
+        end = index + 1
+        while end < len(lines) and lines[end].strip() and _DIGITS.sub("#", lines[end]) == shape:
+            end += 1
+        run = end - index
+        if run > 2 and line.strip():
+            out += [line, f"  [... {run - 2} similar lines ...]", lines[end - 1]]
+        else:
+            for repeated in lines[index:end]:
+                seen[repeated] += 1
+                if not repeated.strip() or seen[repeated] <= 3:
+                    out.append(repeated)
+        index = end
+    return "\n".join(out)
+
+
+def reduce_log(text: str, budget: int) -> str:
+    return head_tail(dedupe_lines(text), budget)
+
+
+def _collapse_nested(items: list[dict], depth: int) -> list[dict]:
+    collapsed = []
+    for item in items:
+        item = dict(item)
+        children = item.get("children")
+        if children:
+            if depth <= 0:
+                item["children"] = f"{len(children)} entries"
+            else:
+                item["children"] = _collapse_nested(children, depth - 1)
+        collapsed.append(item)
+    return collapsed
+
+
+def _collapse_paths(lines: list[str], depth: int) -> list[str]:
+    present = set(lines)
+    hidden: Counter = Counter()
+    kept = []
+    for line in lines:
+        parts = line.rstrip("/").split("/")
+        if len(parts) > depth + 1:
+            directory = "/".join(parts[: depth + 1]) + "/"
+            if directory not in present:
+                # The page starts below this directory; show it where its entries were
+                present.add(directory)
+                kept.append(directory)
+            hidden[directory] += 1
+        else:
+            kept.append(line)
+    return [f"{line} (+{hidden[line]} entries)" if hidden.get(line) else line for line in kept]
+
+
+def collapse_tree(text: str, budget: int) -> str:
+    """Drop the deepest levels of a directory tree until it fits, counting what was hidden.
+
+    Handles directory_tree_tool output in both its nested JSON and its compact
+    one-path-per-line form, wrapped in the tool's {"content": [{"text": ...}]}.
+    """
+    if count_tokens(text) <= budget:
+        return text
+    wrapper = None
+    try:
+        wrapper = json.loads(text)
+        tree_text = wrapper["content"][0]["text"]
+    except (ValueError, KeyError, IndexError, TypeError):
+        wrapper, tree_text = None, text
+    body, _, note = tree_text.partition("\n[truncated")
+    note = f"\n[truncated{note}" if note else ""
+    try:
+        nested = json.loads(body)
+    except ValueError:
+        nested = None
+    lines = body.split("\n")
+    max_depth = max((line.rstrip("/").count("/") for line in lines), default=0) if nested is None else 32
+    reduced = body
+    for depth in range(max_depth - 1, -1, -1):
+        if nested is not None:
+            reduced = json.dumps(_collapse_nested(nested, depth), separators=(",", ":"))
+        else:
+            reduced = "\n".join(_collapse_paths(lines, depth))
+        if count_tokens(reduced) <= budget:
+            break
+    reduced = head(reduced, budget) + note
+    if wrapper is not None:
+        wrapper["content"][0]["text"] = reduced
+        return json.dumps(wrapper, ensure_ascii=False)
+    return reduced
+
+
+def reduce_files(text: str, budget: int) -> str:
+    """Share the budget between the files of a read_multiple_files_tool result"""
+    try:
+        files = json.loads(text)
+    except ValueError:
+        return head_tail(text, budget)
+    if not isinstance(files, list) or not all(isinstance(item, dict) for item in files):
+        return head_tail(text, budget)
+    share = max(1, budget // max(1, len(files)) - 20)
+    for item in files:
+        if isinstance(item.get("content"), str):
+            item["content"] = head_tail(item["content"], share)
+    return head_tail(json.dumps(files, ensure_ascii=False), budget)
+
+
+REDUCTIONS: dict[str, Callable[[str, int], str]] = {
+    "head": head,
+    "head_tail": head_tail,
+    "log": reduce_log,
+    "tree": collapse_tree,
+    "files": reduce_files,
+}
+
+
+class Context_budget:
+    """Per-call and per-conversation token budgets for tool outputs.
+
+    A call gets at most `per_call_tokens`, and never more than its share of what
+    is left of `conversation_tokens`; when the conversation is over budget the
+    oldest tool outputs are cut to `min_call_tokens` first. `stats` counts
+    tokens before and after reduction.
+    """
+
+    def __init__(self, per_call_tokens: int = 6000, conversation_tokens: int = 100_000, min_call_tokens: int = 300):
+        self.per_call_tokens = per_call_tokens
+        self.conversation_tokens = conversation_tokens
+        self.min_call_tokens = min_call_tokens
+        self.stats = {"reduced_calls": 0, "tokens_in": 0, "tokens_out": 0, "compacted_history": 0}
+
+    def reduce(self, text: str, budget: int, strategy: str = "head_tail") -> str:
+        tokens = count_tokens(text)
+        self.stats["tokens_in"] += tokens
+        if tokens > budget:
+            text = REDUCTIONS.get(strategy, head_tail)(text, budget)
+            self.stats["reduced_calls"] += 1
+        self.stats["tokens_out"] += count_tokens(text)
+        return text
+
+    def apply(
+        self,
+        history: Sequence[BaseMessage],
+        new_messages: Sequence[ToolMessage],
+        strategy_for: Callable[[str], str],
+    ) -> list[ToolMessage]:
+        """Reduced `new_messages`, plus replacements (same ids) for older outputs to shrink"""
+        used = sum(count_tokens(str(message.content)) for message in history if isinstance(message, ToolMessage))
+        remaining = max(0, self.conversation_tokens - used)
+        share = max(self.min_call_tokens, min(self.per_call_tokens, remaining // max(1, len(new_messages))))
+        reduced = []
+        for message in new_messages:
+            content = self.reduce(str(message.content), share, strategy_for(message.name or ""))
+            reduced.append(message.model_copy(update={"content": content}))
+
+        over = used + sum(count_tokens(str(message.content)) for message in reduced) - self.conversation_tokens
+        replacements = []
+        for message in history:
+            if over <= 0:
+                break
+            if not isinstance(message, ToolMessage) or message.id is None:
+                continue
+            before = count_tokens(str(message.content))
+            if before <= self.min_call_tokens:
+                continue
+            content = REDUCTIONS.get(strategy_for(message.name or ""), head_tail)(str(message.content), self.min_call_tokens)
+            over -= before - count_tokens(content)
+            self.stats["compacted_history"] += 1
+            replacements.append(message.model_copy(update={"content": content}))
+        return replacements + reduced
+
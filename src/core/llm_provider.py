@@ -0,0 +1,619 @@
+"""Shared, rate-limited access to the chat model.
+
+Every agent session goes through one Llm_provider, which owns a single
+ChatGoogleGenerativeAI client (and so a single HTTP connection pool), paces
+requests with adaptive token buckets, retries rate-limit and transient errors
+with exponential backoff and records token and latency metrics per call.
+Pass `chat_model=Fake_chat_model(...)` to run the same code offline.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, NamedTuple, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage, message_chunk_to_message, messages_from_dict, messages_to_dict
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+from core.config import get_settings
+from core.context_budget import count_tokens
+from tools.fs_watcher import Change_event, subscribe
+from tools.file_signature import file_signature
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "economic-research-assistant", "llm_cache")
+CACHE_VERSION = 1
+
+# Tool-call arguments that name files whose contents end up in the conversation
+_PATH_ARGUMENTS = ("path", "paths", "file_path", "source", "destination", "do_files", "template")
+
+_RATE_LIMIT_MARKERS = ("429", "RESOURCE_EXHAUSTED", "ResourceExhausted", "TooManyRequests", "rate limit")
+_TRANSIENT_MARKERS = ("500", "502", "503", "504", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "timed out")
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    text = f"{type(error).__name__}: {error}"
+    return any(marker in text for marker in _RATE_LIMIT_MARKERS)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    text = f"{type(error).__name__}: {error}"
+    return any(marker in text for marker in _TRANSIENT_MARKERS)
+
+
+def estimate_tokens(messages: Sequence[BaseMessage] | str) -> int:
+    """Local token count used to pace requests before the API reports usage"""
+    if isinstance(messages, str):
+        return max(1, count_tokens(messages))
+    return max(1, sum(count_tokens(str(message.content)) for message in messages))
+
+
+class Token_bucket:
+    """Token bucket that lets callers go into debt instead of taking a lock.
+
+    `reserve` takes the tokens immediately and returns how long the caller has
+    to wait for the bucket to refill, so waiters are served in arrival order
+    and the bucket can be shared by any number of event loops. The refill rate
+    adapts: `penalize` halves it after a rate-limit error and `reward` raises it
+    back by 5% of the configured rate after each success.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, min_rate: Optional[float] = None):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 20
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        self._refill()
+        self._tokens -= min(amount, self.capacity)
+        return max(0.0, -self._tokens / self.rate)
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        wait = self.reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def penalize(self) -> None:
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._tokens = min(self._tokens, 0.0)
+
+    def reward(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class Llm_call(NamedTuple):
+    model: str
+    kind: str  # 'invoke' or 'stream'
+    input_tokens: int
+    output_tokens: int
+    latency: float  # seconds from the call to the complete response
+    first_token: Optional[float]  # seconds to the first streamed chunk
+    queued: float  # seconds spent waiting for the rate limiter
+    retries: int
+    ok: bool
+
+
+class Llm_metrics:
+    """Per-call records of the last `max_calls` calls plus running totals"""
+
+    def __init__(self, max_calls: int = 10000):
+        self.calls: deque[Llm_call] = deque(maxlen=max_calls)
+        self.totals = {"calls": 0, "errors": 0, "retries": 0, "rate_limited": 0, "input_tokens": 0, "output_tokens": 0}
+
+    def record(self, call: Llm_call) -> None:
+        self.calls.append(call)
+        self.totals["calls"] += 1
+        self.totals["errors"] += not call.ok
+        self.totals["retries"] += call.retries
+        self.totals["input_tokens"] += call.input_tokens
+        self.totals["output_tokens"] += call.output_tokens
+
+    def summary(self) -> dict:
+        import numpy as np
+
+        result: dict[str, Any] = dict(self.totals)
+        latencies = np.array([call.latency for call in self.calls if call.ok])
+        if latencies.size:
+            result["latency_p50"], result["latency_p95"], result["latency_p99"] = np.percentile(latencies, [50, 95, 99]).tolist()
+        first_tokens = np.array([call.first_token for call in self.calls if call.first_token is not None])
+        if first_tokens.size:
+            result["first_token_p50"] = float(np.percentile(first_tokens, 50))
+        result["queued_total"] = sum(call.queued for call in self.calls)
+        return result
+
+
+def _normalize_message(message: BaseMessage, call_ids: dict[str, int]) -> dict:
+    content = message.content
+    if isinstance(content, str):
+        # Line endings and trailing whitespace do not change what the model sees
+        content = "\n".join(line.rstrip() for line in content.replace("\r\n", "\n").split("\n")).strip()
+    normalized = {"type": message.type, "content": content}
+    if getattr(message, "tool_calls", None):
+        # Tool-call ids are random; number them in order so equal conversations hash alike
+        normalized["tool_calls"] = [
+            [call["name"], call["args"], call_ids.setdefault(call.get("id"), len(call_ids))] for call in message.tool_calls
+        ]
+    if isinstance(message, ToolMessage):
+        normalized["tool_call_id"] = call_ids.setdefault(message.tool_call_id, len(call_ids))
+    return normalized
+
+
+def _tool_spec(tool: Any) -> Any:
+    try:
+        return convert_to_openai_tool(tool)
+    except Exception:
+        return repr(tool)
+
+
+def _argument_paths(value: Any) -> list[str]:
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, (list, tuple)):
+        return [item for item in value if isinstance(item, str)]
+    return []
+
+
+def message_dependencies(messages: Sequence[BaseMessage]) -> list[str]:
+    """Files named by the tool calls whose results are part of the conversation"""
+    answered = {message.tool_call_id for message in messages if isinstance(message, ToolMessage)}
+    paths: list[str] = []
+    for message in messages:
+        for call in getattr(message, "tool_calls", None) or []:
+            if call.get("id") not in answered:
+                continue
+            for name in _PATH_ARGUMENTS:
+                paths.extend(_argument_paths(call["args"].get(name)))
+    return list(dict.fromkeys(os.path.abspath(path) for path in paths))
+
+
+class Llm_response_cache:
+    """Two-tier exact-match cache of model responses, in memory and on disk.
+
+    The key hashes the normalized messages, the tool specs, the model and the
+    call parameters. Each entry also records the size and mtime of the files the
+    conversation's tool calls read (read_file_tool paths, do-files, ...); a hit
+    is only served while those files are unchanged and the entry is younger
+    than `ttl` seconds. The memory tier holds `max_memory_entries` entries,
+    the disk tier is evicted least recently used beyond `max_disk_bytes`.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+        ttl: float = 24 * 3600,
+        max_memory_entries: int = 512,
+        max_disk_bytes: int = 128 * 1024 * 1024,
+    ):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "stale": 0, "stores": 0, "evictions": 0}
+        self._memory: OrderedDict[str, dict] = OrderedDict()
+        self._by_path: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def key_for(self, messages: Sequence[BaseMessage], tools: Optional[Sequence], model: str, params: dict) -> str:
+        call_ids: dict[str, int] = {}
+        payload = [
+            CACHE_VERSION,
+            model,
+            params,
+            [_tool_spec(tool) for tool in tools or []],
+            [_normalize_message(message, call_ids) for message in messages],
+        ]
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _valid(self, entry: dict) -> bool:
+        if time.time() - entry["created"] > self.ttl:
+            return False
+        return all(file_signature(path) == signature for path, signature in entry["dependencies"])
+
+    def _remember(self, key: str, entry: dict) -> None:
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            for path, _ in entry["dependencies"]:
+                self._by_path.setdefault(path, set()).add(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def _forget(self, key: str) -> None:
+        with self._lock:
+            self._memory.pop(key, None)
+        if self.cache_dir:
+            try:
+                os.remove(self._entry_path(key))
+            except FileNotFoundError:
+                pass
+
+    def get(self, key: str) -> Optional[AIMessage]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        tier = "hits"
+        if entry is None and self.cache_dir:
+            try:
+                with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                tier = "disk_hits"
+            except (OSError, ValueError):
+                entry = None
+        if entry is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        if not self._valid(entry):
+            self._forget(key)
+            with self._lock:
+                self.stats["stale"] += 1
+                self.stats["misses"] += 1
+            return None
+        if tier == "disk_hits":
+            self._remember(key, entry)
+            os.utime(self._entry_path(key))  # mtime doubles as the LRU timestamp
+        with self._lock:
+            self.stats[tier] += 1
+        return messages_from_dict(entry["response"])[0]
+
+    def put(self, key: str, response: AIMessage, dependencies: Sequence[str] = ()) -> None:
+        entry = {
+            "version": CACHE_VERSION,
+            "created": time.time(),
+            "response": messages_to_dict([response]),
+            "dependencies": [[path, file_signature(path)] for path in dependencies],
+        }
+        self._remember(key, entry)
+        with self._lock:
+            self.stats["stores"] += 1
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        target = self._entry_path(key)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, target)
+        self._evict_disk()
+
+    def invalidate_path(self, path: str) -> int:
+        """Drop the in-memory entries that depend on `path`; disk entries are checked on read"""
+        with self._lock:
+            keys = self._by_path.pop(os.path.abspath(path), set())
+            for key in keys:
+                self._memory.pop(key, None)
+        return len(keys)
+
+    def apply_changes(self, events: Sequence[Change_event]) -> None:
+        """Subscriber for tools.fs_watcher: release the entries whose files changed"""
+        for event in events:
+            if event.kind != "rescan":
+                self.invalidate_path(event.path)
+
+    def _evict_disk(self) -> None:
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for item in it:
+                if item.name.endswith(".json"):
+                    st = item.stat()
+                    entries.append((st.st_mtime, st.st_size, item.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            with self._lock:
+                self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._by_path.clear()
+        if self.cache_dir and os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+
+def _usage(message: BaseMessage) -> tuple[int, int]:
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+
+class Llm_provider:
+    """Rate-limited, instrumented access to one shared chat model.
+
+    `requests_per_minute` and `tokens_per_minute` feed two token buckets;
+    `max_concurrency` caps requests in flight per event loop. Every call takes
+    its own request token and concurrency slot: the Gemini client has no batch
+    endpoint, so its `abatch` is only a fan-out of separate requests. With a
+    `cache`, deterministic calls (temperature 0) are answered from it when the
+    same conversation was seen before.
+    """
+
+    def __init__(
+        self,
+        model: str = DEFAULT_MODEL,
+        temperature: float = 0.0,
+        requests_per_minute: float = 60,
+        tokens_per_minute: float = 1_000_000,
+        max_concurrency: int = 8,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        request_timeout: Optional[float] = 120,
+        base_url: Optional[str] = None,
+        chat_model: Optional[BaseChatModel] = None,
+        cache: Optional[Llm_response_cache] = None,
+    ):
+        self.model = model
+        self.temperature = temperature
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.request_timeout = request_timeout
+        self.base_url = base_url
+        self.request_bucket = Token_bucket(requests_per_minute / 60, capacity=max(1.0, requests_per_minute / 60 * 5))
+        self.token_bucket = Token_bucket(tokens_per_minute / 60, capacity=tokens_per_minute)
+        self.metrics = Llm_metrics()
+        self._chat_model = chat_model
+        self._bound: dict[tuple, Any] = {}
+        self._semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self.cache = cache
+
+    @property
+    def chat_model(self) -> BaseChatModel:
+        """The shared client, created on first use so importing needs no API key"""
+        if self._chat_model is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            options: dict[str, Any] = {}
+            if self.base_url:
+                # A local or proxy endpoint speaking the Gemini REST API
+                options = {"client_options": {"api_endpoint": self.base_url}, "transport": "rest"}
+            self._chat_model = ChatGoogleGenerativeAI(
+                model=self.model,
+                temperature=self.temperature,
+                max_retries=0,  # retries are paced by the provider
+                timeout=self.request_timeout,
+                **options,
+            )
+        return self._chat_model
+
+    def runnable_for(self, tools: Optional[Sequence] = None) -> Any:
+        """The shared model, bound to `tools` once per distinct tool set"""
+        if not tools:
+            return self.chat_model
+        key = tuple(getattr(t, "name", None) or getattr(t, "__name__", repr(t)) for t in tools)
+        if key not in self._bound:
+            self._bound[key] = self.chat_model.bind_tools(list(tools))
+        return self._bound[key]
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def _pace(self, requests: int, tokens: int) -> float:
+        waits = await asyncio.gather(self.request_bucket.acquire(requests), self.token_bucket.acquire(tokens))
+        return max(waits)
+
+    def _on_error(self, error: BaseException) -> bool:
+        """Adapt the rate to an error; True if the call should be retried"""
+        if is_rate_limit_error(error):
+            self.metrics.totals["rate_limited"] += 1
+            self.request_bucket.penalize()
+            return True
+        return is_transient_error(error)
+
+    def _on_success(self) -> None:
+        self.request_bucket.reward()
+
+    def _backoff(self, attempt: int) -> float:
+        return min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    async def _invoke_one(self, runnable: Any, messages: list[BaseMessage], submitted: float, retries: int = 0, **kwargs) -> AIMessage:
+        estimated = estimate_tokens(messages)
+        queued = 0.0
+        attempt = retries
+        while True:
+            queued += await self._pace(1, estimated)
+            try:
+                async with self._semaphore():
+                    response = await runnable.ainvoke(messages, **kwargs)
+            except Exception as e:
+                if not self._on_error(e) or attempt >= self.max_retries:
+                    self.metrics.record(Llm_call(self.model, "invoke", estimated, 0, time.perf_counter() - submitted, None, queued, attempt, False))
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            self._on_success()
+            input_tokens, output_tokens = _usage(response)
+            self.metrics.record(Llm_call(
+                self.model, "invoke", input_tokens or estimated, output_tokens,
+                time.perf_counter() - submitted, None, queued, attempt, True,
+            ))
+            return response
+
+    def _cache_key(self, messages: Sequence[BaseMessage], tools: Optional[Sequence], kwargs: dict) -> Optional[str]:
+        if self.cache is None or self.temperature > 0:
+            return None  # sampled responses are meant to differ between calls
+        return self.cache.key_for(messages, tools, self.model, {"temperature": self.temperature, **kwargs})
+
+    async def _cached(self, cache_key: Optional[str]) -> Optional[AIMessage]:
+        if cache_key is None:
+            return None
+        response = await asyncio.to_thread(self.cache.get, cache_key)
+        if response is not None:
+            self.metrics.totals["cache_hits"] = self.metrics.totals.get("cache_hits", 0) + 1
+        return response
+
+    async def _store(self, cache_key: Optional[str], messages: Sequence[BaseMessage], response: AIMessage) -> None:
+        if cache_key is not None:
+            await asyncio.to_thread(self.cache.put, cache_key, response, message_dependencies(messages))
+
+    async def ainvoke(self, messages: Sequence[BaseMessage], tools: Optional[Sequence] = None, **kwargs) -> AIMessage:
+        """One chat completion, from the cache or sent to the model"""
+        cache_key = self._cache_key(messages, tools, kwargs)
+        response = await self._cached(cache_key)
+        if response is None:
+            response = await self._invoke_one(self.runnable_for(tools), list(messages), time.perf_counter(), **kwargs)
+            await self._store(cache_key, messages, response)
+        return response
+
+    async def abatch(self, inputs: Sequence[Sequence[BaseMessage]], tools: Optional[Sequence] = None) -> list[AIMessage]:
+        """Several completions at once, each paced and limited like a single call"""
+        return list(await asyncio.gather(*(self.ainvoke(messages, tools) for messages in inputs)))
+
+    async def astream(self, messages: Sequence[BaseMessage], tools: Optional[Sequence] = None, **kwargs) -> AsyncIterator[AIMessageChunk]:
+        """Stream a completion; errors before the first chunk are retried like ainvoke"""
+        cache_key = self._cache_key(messages, tools, kwargs)
+        cached = await self._cached(cache_key)
+        if cached is not None:
+            yield AIMessageChunk(content=cached.content, tool_calls=cached.tool_calls, usage_metadata=cached.usage_metadata)
+            return
+        runnable = self.runnable_for(tools)
+        messages = list(messages)
+        streamed: Optional[AIMessageChunk] = None
+        estimated = estimate_tokens(messages)
+        submitted = time.perf_counter()
+        queued = 0.0
+        attempt = 0
+        while True:
+            queued += await self._pace(1, estimated)
+            first_token = None
+            input_tokens = output_tokens = 0
+            try:
+                async with self._semaphore():
+                    async for chunk in runnable.astream(messages, **kwargs):
+                        if first_token is None:
+                            first_token = time.perf_counter() - submitted
+                        chunk_input, chunk_output = _usage(chunk)
+                        input_tokens += chunk_input
+                        output_tokens += chunk_output
+                        streamed = chunk if streamed is None else streamed + chunk
+                        yield chunk
+            except Exception as e:
+                if first_token is not None or not self._on_error(e) or attempt >= self.max_retries:
+                    self.metrics.record(Llm_call(self.model, "stream", estimated, output_tokens, time.perf_counter() - submitted, first_token, queued, attempt, False))
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            self._on_success()
+            self.metrics.record(Llm_call(
+                self.model, "stream", input_tokens or estimated, output_tokens,
+                time.perf_counter() - submitted, first_token, queued, attempt, True,
+            ))
+            if streamed is not None:
+                await self._store(cache_key, messages, message_chunk_to_message(streamed))
+            return
+
+
+class Fake_rate_limit_error(Exception):
+    """Raised by Fake_chat_model to imitate an HTTP 429 from the API"""
+
+
+class Fake_chat_model(BaseChatModel):
+    """Offline chat model with configurable latency, streaming speed and rate limiting.
+
+    Replies cycle through `responses`. Each call takes `latency` seconds, plus
+    one word every 1/`words_per_second` seconds when streaming. Every `rate_limit_every`-th call
+    raises Fake_rate_limit_error.
+    """
+
+    responses: list[str] = ["ok"]
+    latency: float = 0.05
+    words_per_second: float = 200.0
+    rate_limit_every: int = 0
+    _calls: int = PrivateAttr(default=0)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools: Sequence, **kwargs) -> "Fake_chat_model":
+        return self
+
+    def _reply(self, messages: list[BaseMessage]) -> AIMessage:
+        self._calls += 1
+        if self.rate_limit_every and self._calls % self.rate_limit_every == 0:
+            raise Fake_rate_limit_error("429 RESOURCE_EXHAUSTED (fake)")
+        content = self.responses[(self._calls - 1) % len(self.responses)]
+        input_tokens, output_tokens = estimate_tokens(messages), estimate_tokens(content)
+        return AIMessage(content=content, usage_metadata={
+            "input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens,
+        })
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _astream(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        reply = self._reply(messages)
+        words = str(reply.content).split(" ")
+        for number, word in enumerate(words):
+            last = number == len(words) - 1
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=word if last else word + " ",
+                usage_metadata=reply.usage_metadata if last else None,
+            ))
+            await asyncio.sleep(1 / self.words_per_second)
+
+
+_llm_provider: Llm_provider | None = None
+
+
+def get_llm_provider() -> Llm_provider:
+    """Process-wide provider shared by every agent session"""
+    global _llm_provider
+    if _llm_provider is None:
+        settings = get_settings()
+        cache = None
+        if settings.llm_cache_enabled:
+            cache = Llm_response_cache()
+            subscribe(cache.apply_changes)
+        _llm_provider = Llm_provider(model=settings.model, requests_per_minute=settings.requests_per_minute, cache=cache)
+    return _llm_provider
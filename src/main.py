@@ -1,14 +1,37 @@
-from tools.filesystem_manager import read_file,read_multiple_files,directory_tree,search_files_tool,list_allowed_directories
-from tools.stata_interpreter import stata_interpreter
 import asyncio
+import sys
+
+from core.config import argument_parser, configure, settings_from_args
 
 def main():
-   paths=r"D:\projects\cuine\src\layouts\Layout.astro"
-   log_output = asyncio.run(list_allowed_directories.ainvoke({}))
-   print(log_output)
-   
+   parser = argument_parser(description="Economic research assistant")
+   parser.add_argument("prompt", nargs="*", default=[], help="what to ask the assistant")
+   args = parser.parse_args()
+   try:
+      settings = configure(settings_from_args(args))
+   except (OSError, ValueError) as e:
+      parser.error(str(e))
+   prompt = " ".join(args.prompt) or "List the allowed directories."
+
+   # The agent, the model client and the tools are imported once the settings are known,
+   # so --help and configuration errors return without loading them
+   from core.agent_router import run_agent
+   from tools.instrumentation import configure_logging
+
+   configure_logging(settings.log_level, settings.log_json)
+   # Without inotify there is nothing to start, so the tools are not imported for it either
+   watching = settings.watch and (settings.watch_backend == "poll" or sys.platform.startswith("linux"))
+   if watching:
+      from tools.filesystem_manager import stop_watching, watch_allowed_directories
+
+      # Files changed by Stata or the user during the session reach the caches as they happen
+      watch_allowed_directories(settings.watch_backend)
+   try:
+      answer = asyncio.run(run_agent(prompt, recursion_limit=settings.recursion_limit))
+   finally:
+      if watching:
+         stop_watching()
+   print(answer)
+
 if __name__ == "__main__":
    main()
-   #path=r"D:\projects\cuine\src\layouts\Layout.astro"
-   #result=read_file(path)
-   #print(result)
\ No newline at end of file
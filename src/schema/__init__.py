@@ -1,7 +1,20 @@
 from schema.schema import (
     Stata_interpreter_schema,
+    Stata_run_result,
+    Stata_coefficient,
+    Stata_estimation,
+    Stata_summary_row,
+    Stata_summary_table,
+    Stata_tabulation_row,
+    Stata_tabulation,
+    Stata_error,
+    Stata_log_summary,
+    Stata_batch_schema,
+    Stata_batch_job_result,
+    Stata_batch_result,
     Read_file_schema,
     Read_multiple_files_schema,
+    File_read_result,
     Write_file_schema,
     Edit_file_schema,
     Edit_operation,
@@ -9,15 +22,32 @@ from schema.schema import (
     List_directory_schema,
     Directory_tree_schema,
     Move_file_schema,
+    Dataset_preview_schema,
+    Dataset_column,
+    Dataset_preview,
     Search_files_schema,
+    Search_content_schema,
     get_file_info_schema,
     File_info_schema,
     Tree_entry_schema,
     )
 ___all__ = [
     "Stata_interpreter_schema",
+    "Stata_run_result",
+    "Stata_coefficient",
+    "Stata_estimation",
+    "Stata_summary_row",
+    "Stata_summary_table",
+    "Stata_tabulation_row",
+    "Stata_tabulation",
+    "Stata_error",
+    "Stata_log_summary",
+    "Stata_batch_schema",
+    "Stata_batch_job_result",
+    "Stata_batch_result",
     "Read_file_schema",
     "Read_multiple_files_schema",
+    "File_read_result",
     "Write_file_schema",
     "Edit_file_schema",
     "Edit_operation",
@@ -25,7 +55,11 @@ ___all__ = [
     "List_directory_schema",
     "Directory_tree_schema",
     "Move_file_schema",
+    "Dataset_preview_schema",
+    "Dataset_column",
+    "Dataset_preview",
     "Search_files_schema",
+    "Search_content_schema",
     "get_file_info_schema",
     "File_info_schema",
     "Tree_entry_schema",
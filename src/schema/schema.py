@@ -4,12 +4,124 @@ from datetime import datetime
 
 class Stata_interpreter_schema(BaseModel):
     file_path:str=Field(description="path to the .do file")
+    timeout:Optional[float]=Field(default=1800, description="kill the run after this many seconds")
+    idle_timeout:Optional[float]=Field(default=None, description="kill the run if the log does not grow for this many seconds")
+    stop_on_error:bool=Field(default=False, description="stop at the first Stata error instead of running to the end")
+    use_cache:bool=Field(default=True, description="return the cached log if the do-file and its inputs are unchanged")
+    output_format:Literal['compact', 'json', 'raw']=Field(default='compact', description="'compact' renders parsed tables and errors, 'json' returns them structured, 'raw' returns the full log")
+
+class Stata_batch_schema(BaseModel):
+    do_files:Optional[List[str]]=Field(default=None, description="paths to independent .do files to run in parallel")
+    template:Optional[str]=Field(default=None, description="path to a .do file with {{name}} placeholders to run once per parameter combination")
+    param_grid:Optional[dict[str, List[str]]]=Field(default=None, description="values for each template placeholder; every combination becomes a job")
+    max_workers:Optional[int]=Field(default=None, description="maximum number of Stata processes running at once")
+    timeout:Optional[float]=Field(default=1800, description="kill a job after this many seconds")
+    use_cache:bool=Field(default=True, description="reuse cached logs for jobs whose do-file and inputs are unchanged")
+
+class Stata_batch_job_result(BaseModel):
+    job:int=Field(description="job number within the batch")
+    do_file:str=Field(description="do-file or template the job ran")
+    params:dict[str, str]=Field(default_factory=dict, description="template parameters of the job")
+    log_path:str=Field(description="path to the job's log file")
+    work_dir:str=Field(default="", description="directory the job ran in; its relative outputs are written here")
+    ok:bool=Field(description="True if the job completed without a Stata error")
+    status:str=Field(description="how the run finished")
+    elapsed:float=Field(default=0.0, description="wall-clock seconds spent on the job")
+    log_tail:str=Field(default="", description="last lines of the job's log")
+    summary:str=Field(default="", description="compact rendering of the tables and errors parsed from the log")
+
+class Stata_batch_result(BaseModel):
+    jobs:List[Stata_batch_job_result]=Field(description="one result per job, in job order")
+    succeeded:int=Field(description="number of jobs that completed without errors")
+    failed:int=Field(description="number of jobs that failed, timed out or reported a Stata error")
+    elapsed:float=Field(description="wall-clock seconds for the whole batch")
+
+class Stata_coefficient(BaseModel):
+    name:str=Field(description="term name, prefixed with its equation or factor group when there is one")
+    coef:float=Field(description="point estimate")
+    std_err:Optional[float]=Field(default=None, description="standard error")
+    stat:Optional[float]=Field(default=None, description="t or z statistic")
+    p_value:Optional[float]=Field(default=None, description="p-value")
+    ci_low:Optional[float]=Field(default=None, description="lower bound of the confidence interval")
+    ci_high:Optional[float]=Field(default=None, description="upper bound of the confidence interval")
+
+class Stata_estimation(BaseModel):
+    command:str=Field(description="command that produced the table")
+    depvar:Optional[str]=Field(default=None, description="dependent variable")
+    n:Optional[int]=Field(default=None, description="number of observations")
+    r2:Optional[float]=Field(default=None, description="R-squared, or pseudo R-squared for ML models")
+    stats:dict[str, float]=Field(default_factory=dict, description="other header statistics, e.g. 'Adj R-squared', 'F(2, 71)'")
+    coefficients:List[Stata_coefficient]=Field(default_factory=list, description="rows of the coefficient table")
+
+class Stata_summary_row(BaseModel):
+    variable:str
+    obs:Optional[float]=None
+    mean:Optional[float]=None
+    std_dev:Optional[float]=None
+    min:Optional[float]=None
+    max:Optional[float]=None
+
+class Stata_summary_table(BaseModel):
+    command:str=Field(description="summarize command")
+    rows:List[Stata_summary_row]=Field(default_factory=list)
+
+class Stata_tabulation_row(BaseModel):
+    label:str
+    values:List[Optional[float]]=Field(default_factory=list)
+
+class Stata_tabulation(BaseModel):
+    command:str=Field(description="tabulate command")
+    columns:List[str]=Field(default_factory=list, description="column headers after the row label")
+    rows:List[Stata_tabulation_row]=Field(default_factory=list)
+
+class Stata_error(BaseModel):
+    command:Optional[str]=Field(default=None, description="command that failed")
+    code:int=Field(description="Stata return code")
+    message:str=Field(default="", description="error message printed before the return code")
+    line:int=Field(default=0, description="line of the log where the error starts")
+
+class Stata_log_summary(BaseModel):
+    estimations:List[Stata_estimation]=Field(default_factory=list)
+    summaries:List[Stata_summary_table]=Field(default_factory=list)
+    tabulations:List[Stata_tabulation]=Field(default_factory=list)
+    errors:List[Stata_error]=Field(default_factory=list)
+    commands:int=Field(default=0, description="number of commands in the log")
+    lines:int=Field(default=0, description="number of lines in the log")
+
+class Stata_run_result(BaseModel):
+    do_file:str=Field(description="path to the .do file that was run")
+    log_path:str=Field(description="path to the log file written by Stata")
+    log:str=Field(default="", description="content of the log file")
+    ok:bool=Field(description="True if the do-file ran without a Stata error")
+    error:Optional[str]=Field(default=None, description="error reported by Stata or by the runner")
+    elapsed:float=Field(default=0.0, description="wall-clock seconds spent on the run")
+    worker:Optional[int]=Field(default=None, description="id of the pool session that ran the job")
 
 class Read_file_schema(BaseModel):
     path:str=Field(description="path to the file to read")
+    offset:Optional[int]=Field(default=None, description="byte offset to start reading from")
+    length:Optional[int]=Field(default=None, description="number of bytes to read from offset")
+    start_line:Optional[int]=Field(default=None, description="first line to read, 1-based")
+    end_line:Optional[int]=Field(default=None, description="last line to read, inclusive")
+    grep:Optional[str]=Field(default=None, description="regular expression; return only matching lines with context")
+    context:int=Field(default=2, description="lines of context around each grep match")
+    max_matches:int=Field(default=100, description="maximum number of matching lines returned by grep")
 
 class Read_multiple_files_schema(BaseModel):
     path:List[str]=Field(description="paths to the files to read")
+    mode:Literal['head', 'tail', 'range']=Field(default='head', description="read the start, the end, or the range starting at offset of each file")
+    offset:int=Field(default=0, description="byte offset to start reading from when mode is 'range'")
+    max_bytes_per_file:int=Field(default=256*1024, description="maximum number of bytes returned per file")
+    max_total_bytes:int=Field(default=2*1024*1024, description="maximum number of bytes returned across all files")
+
+class File_read_result(BaseModel):
+    path:str=Field(description="path of the file as requested")
+    content:Optional[str]=Field(default=None, description="decoded content, None if the file could not be read")
+    encoding:Optional[str]=Field(default=None, description="detected encoding of the file")
+    size:int=Field(default=0, description="size of the file in bytes")
+    bytes_read:int=Field(default=0, description="number of bytes returned in content")
+    truncated:bool=Field(default=False, description="True if only part of the file was returned")
+    error:Optional[str]=Field(default=None, description="error message if the file could not be read")
 
 class Write_file_schema(BaseModel):
     path:str=Field(description="path to the file to write")
@@ -35,6 +147,40 @@ class List_directory_schema(BaseModel):
 
 class Directory_tree_schema(BaseModel):
     path:str=Field(description="path to the directory to list")
+    max_depth:Optional[int]=Field(default=None, description="maximum depth to descend, unlimited if omitted")
+    max_entries:Optional[int]=Field(default=2000, description="maximum number of entries to return in one page")
+    exclude_pattern:str=Field(default="", description="comma separated glob patterns of names or paths to skip")
+    offset:int=Field(default=0, description="number of entries to skip when no cursor is given")
+    compact:bool=Field(default=False, description="return one relative path per line instead of nested JSON")
+    cursor:Optional[str]=Field(default=None, description="cursor returned by a truncated page, continues the listing where that page stopped")
+
+class Dataset_preview_schema(BaseModel):
+    path:str=Field(description="path to a .dta, .csv/.tsv or .parquet file")
+    sample_rows:int=Field(default=5, description="number of rows to return from the start of the dataset")
+    columns:Optional[List[str]]=Field(default=None, description="only describe these columns")
+    max_rows_scanned:Optional[int]=Field(default=1_000_000, description="compute summary statistics on at most this many rows; None scans everything")
+
+class Dataset_column(BaseModel):
+    name:str
+    type:str=Field(description="storage type, e.g. 'double', 'str20', 'int64'")
+    label:Optional[str]=Field(default=None, description="variable label")
+    format:Optional[str]=Field(default=None, description="display format, e.g. '%td'")
+    non_missing:int=Field(default=0, description="number of non-missing values in the scanned rows")
+    missing:int=Field(default=0, description="number of missing values in the scanned rows")
+    mean:Optional[float]=None
+    std:Optional[float]=None
+    min:Optional[Any]=None
+    max:Optional[Any]=None
+
+class Dataset_preview(BaseModel):
+    path:str
+    format:Literal['dta', 'csv', 'parquet']
+    rows:int=Field(description="number of rows in the dataset")
+    columns:List[Dataset_column]=Field(default_factory=list)
+    sample:List[dict[str, Any]]=Field(default_factory=list, description="first rows of the dataset")
+    rows_scanned:int=Field(default=0, description="rows the summary statistics were computed on")
+    dataset_label:Optional[str]=None
+    notes:List[str]=Field(default_factory=list)
 
 class Move_file_schema(BaseModel):
     source:str=Field(description="path to the source file")
@@ -44,6 +190,18 @@ class Search_files_schema(BaseModel):
     path:str=Field(description="path to the directory to search")
     pattern:str=Field(description="pattern to search for")
     exclude_pattern:str=Field(description="pattern to exclude from search")
+    extension:Optional[str]=Field(default=None, description="only return files with this extension, e.g. '.dta'")
+
+class Search_content_schema(BaseModel):
+    path:str=Field(description="directory to search below")
+    pattern:str=Field(description="regular expression to search for in file contents, e.g. 'gen(erate)?\\s+wage\\b'")
+    fixed_string:bool=Field(default=False, description="treat pattern as a literal string instead of a regular expression")
+    ignore_case:bool=Field(default=False, description="match case-insensitively")
+    include:Optional[str]=Field(default=None, description="only search files matching this glob, e.g. '*.do'")
+    exclude_pattern:str=Field(default="", description="comma-separated globs or directory names to skip")
+    context:int=Field(default=2, description="lines of context around each match")
+    max_results:int=Field(default=200, description="maximum number of matching lines returned")
+    max_file_bytes:int=Field(default=10 * 1024 * 1024, description="skip files larger than this")
 
 class get_file_info_schema(BaseModel):
     path:str=Field(description="path to the file to get info about")
@@ -0,0 +1,251 @@
+"""Search the contents of the files below a directory.
+
+Candidate files come from the file index, so include and exclude globs are
+applied without listing the directories again. Each candidate is then stat-ed,
+since the index only notices a directory's own changes and an in-place edit
+leaves the size and mtime it holds behind; the size limit and the no-match
+cache use that fresh stat. Symbolic links are not followed. Binary formats are
+skipped by extension and, for anything else, by a NUL byte in the first
+kilobytes. Each file is memory-mapped and searched with one compiled regex
+pass; line numbers and context are only computed for the files that match.
+
+Files are searched in batches on a thread pool, or on a process pool when the
+candidates add up to more than PROCESS_POOL_MIN_BYTES and there is more than one
+CPU, because the regex engine holds the GIL. Files without matches are
+remembered per pattern with their size and mtime, so a repeated search skips
+them until they change.
+"""
+import asyncio
+import multiprocessing
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from langchain_core.tools import tool
+
+from schema import Search_content_schema
+from tools import filesystem_manager
+from tools.file_reader import File_matches, search_file, search_file_batch
+from tools.fs_watcher import Change_event, subscribe
+from tools.instrumentation import count, in_context, instrumented
+
+PROCESS_POOL_MIN_BYTES = 64 * 1024 * 1024
+BATCH_FILES = 128
+BATCH_BYTES = 8 * 1024 * 1024
+NO_MATCH_PATTERNS = 64
+
+BINARY_EXTENSIONS = frozenset((
+    ".dta", ".gph", ".ster", ".sav", ".sas7bdat", ".rds", ".rdata", ".parquet", ".feather", ".pkl", ".npy", ".npz",
+    ".xls", ".xlsx", ".docx", ".pdf", ".png", ".jpg", ".jpeg", ".gif", ".zip", ".gz", ".7z", ".exe", ".dll", ".pyc",
+))
+
+
+class Content_search_result(NamedTuple):
+    files: list[File_matches]  # files with matches, in path order
+    matching_lines: int
+    truncated: bool
+    stats: dict[str, int]
+
+
+class _No_match_cache:
+    """Per pattern, the (size, mtime_ns) of the files that had no match when last searched"""
+
+    def __init__(self, max_patterns: int = NO_MATCH_PATTERNS):
+        self.max_patterns = max_patterns
+        self._patterns: OrderedDict[tuple, dict[str, tuple[int, int]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> dict[str, tuple[int, int]]:
+        with self._lock:
+            files = self._patterns.get(key)
+            if files is None:
+                files = self._patterns[key] = {}
+                while len(self._patterns) > self.max_patterns:
+                    self._patterns.popitem(last=False)
+            self._patterns.move_to_end(key)
+            return files
+
+    def update(self, key: tuple, files: dict[str, tuple[int, int]]) -> None:
+        with self._lock:
+            if key in self._patterns:
+                self._patterns[key].update(files)
+
+    def apply_changes(self, events: list[Change_event]) -> None:
+        with self._lock:
+            for event in events:
+                prefix = event.path.rstrip(os.sep) + os.sep
+                for files in self._patterns.values():
+                    for path in [p for p in files if p == event.path or p.startswith(prefix)]:
+                        del files[path]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._patterns.clear()
+
+
+no_match_cache = _No_match_cache()
+subscribe(no_match_cache.apply_changes)
+
+_executors: dict[str, Executor] = {}
+_executors_lock = threading.Lock()
+
+
+def _executor(kind: str) -> Executor:
+    with _executors_lock:
+        if kind not in _executors:
+            if kind == "process":
+                # spawn: safe next to the watcher and asyncio threads, and the only choice on Windows
+                _executors[kind] = ProcessPoolExecutor(os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+            else:
+                _executors[kind] = ThreadPoolExecutor(min(32, (os.cpu_count() or 1) + 4), thread_name_prefix="content-search")
+        return _executors[kind]
+
+
+def _batches(entries: list) -> list[list[str]]:
+    batches: list[list[str]] = []
+    batch: list[str] = []
+    size = 0
+    for entry in entries:
+        batch.append(entry.path)
+        size += entry.size
+        if len(batch) >= BATCH_FILES or size >= BATCH_BYTES:
+            batches.append(batch)
+            batch, size = [], 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def search_content(
+    root: str,
+    pattern: str,
+    fixed_string: bool = False,
+    ignore_case: bool = False,
+    include: Optional[str] = None,
+    exclude_patterns: Optional[list[str]] = None,
+    context: int = 2,
+    max_results: int = 200,
+    max_file_bytes: Optional[int] = 10 * 1024 * 1024,
+    executor: str = "auto",
+) -> Content_search_result:
+    """Matching lines with context in the files below `root`; `executor` is 'auto', 'thread' or 'process'"""
+    source = re.escape(pattern) if fixed_string else pattern
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    regex = re.compile(source.encode("utf-8"), flags)  # fails early on a bad pattern
+    entries = filesystem_manager.file_index.query(
+        root,
+        glob=include,
+        exclude_patterns=filesystem_manager.expand_exclude_patterns(exclude_patterns),
+    )
+    stats = {"files": len(entries), "searched": 0, "links": 0, "binary": 0, "too_large": 0, "unchanged": 0, "missing": 0, "errors": 0}
+    known = no_match_cache.get((regex.pattern, flags))  # read without the lock; updated at the end
+    candidates = []
+    signatures: dict[str, tuple[int, int]] = {}
+    for entry in sorted(entries, key=lambda entry: entry.path):
+        if entry.kind == "symlink":
+            stats["links"] += 1
+            continue
+        if entry.kind != "file" or os.path.splitext(entry.name)[1].lower() in BINARY_EXTENSIONS:
+            stats["binary"] += 1
+            continue
+        count("stat")
+        try:
+            st = os.stat(entry.path, follow_symlinks=False)
+        except OSError:
+            stats["missing"] += 1
+            continue
+        signature = signatures[entry.path] = (st.st_size, st.st_mtime_ns)
+        if max_file_bytes is not None and st.st_size > max_file_bytes:
+            stats["too_large"] += 1
+        elif known.get(entry.path) == signature:
+            stats["unchanged"] += 1
+        else:
+            candidates.append(entry._replace(size=st.st_size))
+    count("cache_hits", stats["unchanged"])
+    count("cache_misses", len(candidates))
+
+    total_bytes = sum(entry.size for entry in candidates)
+    if executor == "auto":
+        executor = "process" if total_bytes >= PROCESS_POOL_MIN_BYTES and (os.cpu_count() or 1) > 1 else "thread"
+    batches = _batches(candidates)
+    if executor == "process":
+        futures: list[Future] = [
+            _executor("process").submit(search_file_batch, batch, regex.pattern, flags, context, max_results) for batch in batches
+        ]
+        count("bytes_read", total_bytes)  # read in the workers, where counters do not reach
+    else:
+        futures = [
+            _executor("thread").submit(in_context(search_file_batch), batch, regex.pattern, flags, context, max_results)
+            for batch in batches
+        ]
+
+    matched: list[File_matches] = []
+    no_matches: dict[str, tuple[int, int]] = {}
+    lines = 0
+    truncated = False
+    try:
+        for result in (result for future in futures for result in future.result()):
+            stats["searched"] += 1
+            if result.status in ("none", "binary"):
+                stats["binary"] += result.status == "binary"
+                # The stat taken before the read: an edit after it only causes one more search
+                no_matches[result.path] = signatures[result.path]
+                continue
+            if result.status in ("missing", "error"):
+                stats["missing" if result.status == "missing" else "errors"] += 1
+                continue
+            if lines + result.lines > max_results:
+                # Cut the last file to the lines that are left
+                result = search_file(result.path, regex, context, max_results - lines)
+            matched.append(result)
+            lines += result.lines
+            if lines >= max_results:
+                truncated = True
+                break
+    finally:
+        for future in futures:
+            future.cancel()
+        no_match_cache.update((regex.pattern, flags), no_matches)
+    return Content_search_result(matched, lines, truncated, stats)
+
+
+def render_results(result: Content_search_result, pattern: str) -> str:
+    stats = result.stats
+    skipped = [
+        f"{stats[name]} {label}" for name, label in (
+            ("unchanged", "unchanged without matches"), ("links", "symbolic links"), ("binary", "binary"), ("too_large", "too large"),
+            ("missing", "deleted since indexed"), ("errors", "unreadable"),
+        ) if stats[name]
+    ]
+    header = f"Found {result.matching_lines} matching lines for '{pattern}' in {len(result.files)} files"
+    header += f" (searched {stats['searched']} of {stats['files']} files" + (f"; skipped {', '.join(skipped)}" if skipped else "") + ")"
+    if result.truncated:
+        header += f"\n[stopped after {result.matching_lines} matching lines; narrow the pattern or the path for more]"
+    blocks = [f"{match.path}\n{match.text}" for match in result.files]
+    return "\n\n".join([header, *blocks])
+
+
+@instrumented
+@tool("search_content_tool", args_schema=Search_content_schema)
+async def search_content_tool(
+    path: str,
+    pattern: str,
+    fixed_string: bool = False,
+    ignore_case: bool = False,
+    include: str | None = None,
+    exclude_pattern: str = "",
+    context: int = 2,
+    max_results: int = 200,
+    max_file_bytes: int = 10 * 1024 * 1024
+) -> str:
+    """Search file contents below a directory for a regular expression and return matching lines with context"""
+    valid_path = await filesystem_manager.validate_path(path)
+    exclude_patterns = exclude_pattern.split(',') if exclude_pattern else []
+    result = await asyncio.to_thread(
+        search_content, valid_path, pattern, fixed_string, ignore_case, include, exclude_patterns,
+        context, max_results, max_file_bytes,
+    )
+    return render_results(result, pattern)
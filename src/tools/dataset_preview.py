@@ -0,0 +1,508 @@
+"""Schema, row count, sample rows and column statistics of a dataset without Stata.
+
+.dta files (releases 117, 118 and 119, written by Stata 13 and later) are
+memory-mapped as a NumPy record array and aggregated in chunks of rows. CSV/TSV
+rows are counted with a vectorised newline scan over a memory map and summarised
+in chunks of parsed rows. Parquet files are read row group by row group with
+pyarrow, the optional `parquet` extra. Previews are cached by path, size and mtime.
+"""
+import asyncio
+import csv
+import datetime
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from typing import Any, Iterator, Optional
+
+import numpy as np
+from langchain_core.tools import tool
+
+from schema import Dataset_column, Dataset_preview, Dataset_preview_schema
+from tools.filesystem_manager import validate_path
+from tools.fs_watcher import Change_event, subscribe
+from tools.instrumentation import count, instrumented
+
+CHUNK_BYTES = 64 * 1024 * 1024
+CSV_CHUNK_ROWS = 100_000
+PREVIEW_CACHE_SIZE = 128
+
+_STATA_EPOCH = datetime.datetime(1960, 1, 1)
+
+# Storage type codes of .dta releases 117-119: code -> (name, NumPy type, width, largest non-missing value)
+_DTA_NUMERIC = {
+    65526: ("double", "f8", 8, 8.988465674311579e307),
+    65527: ("float", "f4", 4, 1.7014117e38),
+    65528: ("long", "i4", 4, 2147483620),
+    65529: ("int", "i2", 2, 32740),
+    65530: ("byte", "i1", 1, 100),
+}
+_DTA_STRL = 32768
+
+
+class _Column_stats:
+    """Count, mean, variance (merged chunk by chunk), min and max of a numeric column"""
+
+    def __init__(self):
+        self.n = 0
+        self.missing = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def update(self, values: np.ndarray, missing: int) -> None:
+        self.missing += missing
+        n = int(values.size)
+        if n == 0:
+            return
+        mean = float(values.mean())
+        m2 = float(np.square(values - mean).sum())
+        delta = mean - self.mean
+        total = self.n + n
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.n * n / total
+        self.n = total
+        low, high = float(values.min()), float(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def apply_to(self, column: Dataset_column) -> Dataset_column:
+        column.non_missing = self.n
+        column.missing = self.missing
+        if self.n:
+            column.mean = self.mean
+            column.std = (self.m2 / (self.n - 1)) ** 0.5 if self.n > 1 else 0.0
+            column.min, column.max = self.min, self.max
+        return column
+
+
+def _stata_date(value: Optional[float], display_format: Optional[str]) -> Any:
+    """Render %td and %tc values as dates, leave everything else as it is"""
+    if value is None or not display_format:
+        return value
+    try:
+        if display_format.startswith(("%td", "%d")):
+            return (_STATA_EPOCH + datetime.timedelta(days=value)).date().isoformat()
+        if display_format.startswith(("%tc", "%tC")):
+            return (_STATA_EPOCH + datetime.timedelta(milliseconds=value)).isoformat()
+    except (OverflowError, ValueError):
+        pass
+    return value
+
+
+class _Dta_file:
+    """Header, descriptors and a memory-mapped record array of a .dta file"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            head = f.read(64 * 1024)
+        if not head.startswith(b"<stata_dta>"):
+            raise ValueError(f"{path} is not a .dta file of release 117 or later (Stata 13+); resave it with `saveold, version(13)` or newer")
+        release = int(self._between(head, b"<release>", b"</release>"))
+        if release not in (117, 118, 119):
+            raise ValueError(f"unsupported .dta release {release}")
+        order = "<" if self._between(head, b"<byteorder>", b"</byteorder>") == b"LSF" else ">"
+        position = head.index(b"<K>") + 3
+        k_size, n_size = (4, 8) if release == 119 else (2, 8) if release == 118 else (2, 4)
+        self.columns_count = int.from_bytes(head[position:position + k_size], "little" if order == "<" else "big")
+        position = head.index(b"<N>", position) + 3
+        self.rows = int.from_bytes(head[position:position + n_size], "little" if order == "<" else "big")
+        position = head.index(b"<label>", position) + 7
+        label_size = 1 if release == 117 else 2
+        label_length = int.from_bytes(head[position:position + label_size], "little" if order == "<" else "big")
+        self.encoding = "latin-1" if release == 117 else "utf-8"
+        self.label = head[position + label_size:position + label_size + label_length].decode(self.encoding, "replace") or None
+        position = head.index(b"<map>") + 5
+        self.map = struct.unpack(f"{order}14Q", head[position:position + 14 * 8])
+        self.order = order
+        self.release = release
+
+        k = self.columns_count
+        name_width = 33 if release == 117 else 129
+        format_width = 49 if release == 117 else 57
+        label_width = 81 if release == 117 else 321
+        with open(path, "rb") as f:
+            types = struct.unpack(f"{order}{k}H", self._section(f, 2, len(b"<variable_types>"), 2 * k))
+            names = self._strings(self._section(f, 3, len(b"<varnames>"), name_width * k), name_width)
+            formats = self._strings(self._section(f, 5, len(b"<formats>"), format_width * k), format_width)
+            labels = self._strings(self._section(f, 7, len(b"<variable_labels>"), label_width * k), label_width)
+        self.types = types
+        self.names = names
+        self.formats = formats
+        self.labels = labels
+
+        numpy_formats, offsets, offset = [], [], 0
+        for code in types:
+            if code in _DTA_NUMERIC:
+                _, kind, width, _ = _DTA_NUMERIC[code]
+                numpy_formats.append(order + kind if width > 1 else kind)
+            elif code == _DTA_STRL:
+                width = 8
+                numpy_formats.append("V8")
+            elif 1 <= code <= 2045:
+                width = code
+                numpy_formats.append(f"S{code}")
+            else:
+                raise ValueError(f"unknown storage type code {code}")
+            offsets.append(offset)
+            offset += width
+        self.row_width = offset
+        self.dtype = np.dtype({"names": names, "formats": numpy_formats, "offsets": offsets, "itemsize": max(1, offset)})
+        self.data_offset = self.map[9] + len(b"<data>")
+
+    @staticmethod
+    def _between(data: bytes, start: bytes, end: bytes) -> bytes:
+        begin = data.index(start) + len(start)
+        return data[begin:data.index(end, begin)]
+
+    def _section(self, f, index: int, tag_length: int, size: int) -> bytes:
+        f.seek(self.map[index] + tag_length)
+        return f.read(size)
+
+    def _strings(self, data: bytes, width: int) -> list[str]:
+        return [data[i:i + width].split(b"\0", 1)[0].decode(self.encoding, "replace") for i in range(0, len(data), width)]
+
+    def type_name(self, code: int) -> str:
+        if code in _DTA_NUMERIC:
+            return _DTA_NUMERIC[code][0]
+        return "strL" if code == _DTA_STRL else f"str{code}"
+
+    def records(self, path: str) -> Optional[np.memmap]:
+        if self.rows == 0 or self.row_width == 0:
+            return None
+        return np.memmap(path, dtype=self.dtype, mode="r", offset=self.data_offset, shape=(self.rows,))
+
+
+def _dta_value(value: Any, code: int, encoding: str, display_format: str) -> Any:
+    if code in _DTA_NUMERIC:
+        if value > _DTA_NUMERIC[code][3]:
+            return None  # . or .a-.z
+        return _stata_date(value.item(), display_format)
+    if code == _DTA_STRL:
+        return "<strL>"
+    return bytes(value).split(b"\0", 1)[0].decode(encoding, "replace")
+
+
+def preview_dta(path: str, sample_rows: int, columns: Optional[list[str]], max_rows_scanned: Optional[int]) -> Dataset_preview:
+    dta = _Dta_file(path)
+    selected = [i for i, name in enumerate(dta.names) if columns is None or name in columns]
+    records = dta.records(path)
+    scan_rows = dta.rows if max_rows_scanned is None else min(dta.rows, max_rows_scanned)
+    stats = {i: _Column_stats() for i in selected}
+    non_empty = dict.fromkeys(selected, 0)
+    if records is not None:
+        chunk_rows = max(1, CHUNK_BYTES // dta.row_width)
+        for start in range(0, scan_rows, chunk_rows):
+            chunk = records[start:min(scan_rows, start + chunk_rows)]
+            count("bytes_read", chunk.nbytes)
+            for i in selected:
+                code = dta.types[i]
+                values = chunk[dta.names[i]]
+                if code in _DTA_NUMERIC:
+                    missing = values > _DTA_NUMERIC[code][3]
+                    stats[i].update(values[~missing].astype(np.float64), int(missing.sum()))
+                elif code != _DTA_STRL:
+                    non_empty[i] += int(np.count_nonzero(values != b""))
+
+    described = []
+    for i in selected:
+        column = Dataset_column(
+            name=dta.names[i],
+            type=dta.type_name(dta.types[i]),
+            label=dta.labels[i] or None,
+            format=dta.formats[i] or None,
+        )
+        if dta.types[i] in _DTA_NUMERIC:
+            stats[i].apply_to(column)
+            column.min = _stata_date(column.min, column.format)
+            column.max = _stata_date(column.max, column.format)
+        elif dta.types[i] != _DTA_STRL:
+            column.non_missing = non_empty[i]
+            column.missing = scan_rows - non_empty[i]
+        described.append(column)
+
+    sample = []
+    if records is not None:
+        for record in records[:sample_rows]:
+            sample.append({
+                dta.names[i]: _dta_value(record[dta.names[i]], dta.types[i], dta.encoding, dta.formats[i])
+                for i in selected
+            })
+    notes = [] if scan_rows == dta.rows else [f"statistics computed on the first {scan_rows} of {dta.rows} rows"]
+    if any(dta.types[i] == _DTA_STRL for i in selected):
+        notes.append("strL columns are not read")
+    return Dataset_preview(
+        path=path, format="dta", rows=dta.rows, columns=described, sample=sample,
+        rows_scanned=scan_rows, dataset_label=dta.label, notes=notes,
+    )
+
+
+def count_lines(path: str) -> tuple[int, bool]:
+    """Newlines in a file, counted over a memory map, and whether the file ends with one"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return 0, True
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            lines = 0
+            for start in range(0, size, CHUNK_BYTES):
+                chunk = np.frombuffer(mm, dtype=np.uint8, count=min(CHUNK_BYTES, size - start), offset=start)
+                lines += int(np.count_nonzero(chunk == 0x0A))
+                del chunk  # release the buffer before the map is closed
+            ends_with_newline = mm[size - 1] == 0x0A
+    count("bytes_read", size)
+    return lines, ends_with_newline
+
+
+def _csv_dialect(sample: str, path: str) -> type[csv.Dialect] | csv.Dialect:
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        return csv.excel_tab if path.lower().endswith(".tsv") else csv.excel
+
+
+_MISSING_TEXT = np.array(["", ".", "NA", "NaN", "nan", "null", "NULL"])
+
+
+class _Csv_column:
+    def __init__(self, name: str):
+        self.name = name
+        self.numeric = True
+        self.integral = True
+        self.stats = _Column_stats()
+        self.text_non_missing = 0
+        self.text_missing = 0
+
+    def update(self, values: list[str]) -> None:
+        array = np.array(values, dtype=str)
+        missing = np.isin(array, _MISSING_TEXT)
+        present = array[~missing]
+        self.text_missing += int(missing.sum())
+        self.text_non_missing += int(present.size)
+        if not self.numeric:
+            return
+        try:
+            numbers = present.astype(np.float64)
+        except ValueError:
+            self.numeric = False
+            return
+        self.integral = self.integral and bool(np.all(np.mod(numbers, 1) == 0))
+        self.stats.update(numbers, int(missing.sum()))
+
+    def describe(self) -> Dataset_column:
+        if self.numeric and self.stats.n:
+            return self.stats.apply_to(Dataset_column(name=self.name, type="int64" if self.integral else "float64"))
+        return Dataset_column(name=self.name, type="str", non_missing=self.text_non_missing, missing=self.text_missing)
+
+
+def _csv_rows(path: str, dialect) -> Iterator[list[str]]:
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        yield from csv.reader(f, dialect)
+
+
+def _sample_value(value: str, column: _Csv_column) -> Any:
+    if value in _MISSING_TEXT:
+        return None
+    if column.numeric and column.stats.n:
+        try:
+            number = float(value)
+            return int(number) if column.integral else number
+        except ValueError:
+            return value
+    return value
+
+
+def preview_csv(path: str, sample_rows: int, columns: Optional[list[str]], max_rows_scanned: Optional[int]) -> Dataset_preview:
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        sample_text = f.read(64 * 1024)
+    dialect = _csv_dialect(sample_text, path)
+    lines, ends_with_newline = count_lines(path)
+    rows_total = max(0, lines - 1 + (0 if ends_with_newline else 1))
+
+    reader = _csv_rows(path, dialect)
+    header = next(reader, [])
+    selected = [i for i, name in enumerate(header) if columns is None or name in columns]
+    state = [_Csv_column(header[i]) for i in selected]
+    sample: list[list[str]] = []
+    buffer: list[list[str]] = []
+    scanned = 0
+
+    def flush() -> None:
+        if buffer:
+            width = len(header)
+            padded = [row + [""] * (width - len(row)) if len(row) < width else row for row in buffer]
+            for column, i in zip(state, selected):
+                column.update([row[i] for row in padded])
+            buffer.clear()
+
+    for row in reader:
+        if max_rows_scanned is not None and scanned >= max_rows_scanned:
+            break
+        if not row:
+            continue
+        if len(sample) < sample_rows:
+            sample.append(row)
+        buffer.append(row)
+        scanned += 1
+        if len(buffer) >= CSV_CHUNK_ROWS:
+            flush()
+    flush()
+
+    notes = []
+    if max_rows_scanned is not None and scanned >= max_rows_scanned:
+        # Rows past the scan are estimated from line breaks, which quoted multi-line fields inflate
+        notes.append(f"statistics computed on the first {scanned} of ~{rows_total} rows")
+    else:
+        rows_total = scanned
+    return Dataset_preview(
+        path=path,
+        format="csv",
+        rows=rows_total,
+        columns=[column.describe() for column in state],
+        sample=[
+            {column.name: _sample_value(row[i], column) if i < len(row) else None for column, i in zip(state, selected)}
+            for row in sample
+        ],
+        rows_scanned=scanned,
+        notes=notes,
+    )
+
+
+def preview_parquet(path: str, sample_rows: int, columns: Optional[list[str]], max_rows_scanned: Optional[int]) -> Dataset_preview:
+    try:
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+        import pyarrow.types as pa_types
+    except ImportError:
+        raise ImportError("previewing .parquet files requires pyarrow, the project's optional 'parquet' extra (pip install pyarrow)")
+
+    parquet = pq.ParquetFile(path, memory_map=True)
+    schema = parquet.schema_arrow
+    names = [name for name in schema.names if columns is None or name in columns]
+    rows_total = parquet.metadata.num_rows
+    numeric = {name for name in names if pa_types.is_integer(schema.field(name).type) or pa_types.is_floating(schema.field(name).type)}
+    stats = {name: _Column_stats() for name in names}
+    other: dict[str, list] = {name: [0, 0, None, None] for name in names if name not in numeric}  # non-missing, missing, min, max
+    scanned = 0
+    sample: list[dict] = []
+    for group in range(parquet.num_row_groups):
+        if max_rows_scanned is not None and scanned >= max_rows_scanned:
+            break
+        table = parquet.read_row_group(group, columns=names)
+        if max_rows_scanned is not None and scanned + table.num_rows > max_rows_scanned:
+            table = table.slice(0, max_rows_scanned - scanned)
+        count("bytes_read", table.nbytes)
+        if len(sample) < sample_rows:
+            sample += table.slice(0, sample_rows - len(sample)).to_pylist()
+        for name in names:
+            column = table.column(name)
+            if name in numeric:
+                values = column.drop_null().to_numpy().astype(np.float64)
+                finite = values[~np.isnan(values)]
+                stats[name].update(finite, column.null_count + int(values.size - finite.size))
+            else:
+                summary = other[name]
+                summary[0] += len(column) - column.null_count
+                summary[1] += column.null_count
+                try:
+                    bounds = pc.min_max(column).as_py()
+                except Exception:
+                    continue  # nested and binary types have no ordering
+                for index, pick in ((2, min), (3, max)):
+                    found = bounds["min" if index == 2 else "max"]
+                    if found is not None:
+                        summary[index] = found if summary[index] is None else pick(summary[index], found)
+        scanned += table.num_rows
+
+    described = []
+    for name in names:
+        column = Dataset_column(name=name, type=str(schema.field(name).type))
+        if name in numeric:
+            stats[name].apply_to(column)
+        else:
+            column.non_missing, column.missing, column.min, column.max = other[name]
+        described.append(column)
+    notes = [] if scanned == rows_total else [f"statistics computed on the first {scanned} of {rows_total} rows"]
+    return Dataset_preview(
+        path=path, format="parquet", rows=rows_total, columns=described, sample=sample,
+        rows_scanned=scanned, notes=notes,
+    )
+
+
+_PREVIEWERS = {".dta": preview_dta, ".csv": preview_csv, ".tsv": preview_csv, ".txt": preview_csv, ".parquet": preview_parquet, ".pq": preview_parquet}
+
+
+class _Preview_cache:
+    """LRU of previews keyed by path, size, mtime and the preview arguments"""
+
+    def __init__(self, max_entries: int = PREVIEW_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, Dataset_preview] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[Dataset_preview]:
+        with self._lock:
+            preview = self._entries.get(key)
+            if preview is not None:
+                self._entries.move_to_end(key)
+        count("cache_hits" if preview is not None else "cache_misses")
+        return preview
+
+    def put(self, key: tuple, preview: Dataset_preview) -> None:
+        with self._lock:
+            self._entries[key] = preview
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """Drop the previews of `path` and of any file below it, or every preview"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                return
+            prefix = path.rstrip(os.sep) + os.sep
+            for key in [key for key in self._entries if key[0] == path or key[0].startswith(prefix)]:
+                del self._entries[key]
+
+    def apply_changes(self, events: list[Change_event]) -> None:
+        for event in events:
+            self.invalidate(event.path)
+
+
+preview_cache = _Preview_cache()
+subscribe(preview_cache.apply_changes)
+
+
+def preview_dataset(
+    path: str,
+    sample_rows: int = 5,
+    columns: Optional[list[str]] = None,
+    max_rows_scanned: Optional[int] = 1_000_000,
+) -> Dataset_preview:
+    extension = os.path.splitext(path)[1].lower()
+    previewer = _PREVIEWERS.get(extension)
+    if previewer is None:
+        raise ValueError(f"cannot preview {extension or 'extensionless'} files; supported: .dta, .csv, .tsv, .parquet")
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns, sample_rows, tuple(columns) if columns else None, max_rows_scanned)
+    preview = preview_cache.get(key)
+    if preview is None:
+        preview = previewer(path, sample_rows, columns, max_rows_scanned)
+        preview_cache.put(key, preview)
+    return preview
+
+
+@instrumented
+@tool("dataset_preview_tool", args_schema=Dataset_preview_schema)
+async def dataset_preview(
+    path: str,
+    sample_rows: int = 5,
+    columns: list[str] | None = None,
+    max_rows_scanned: int | None = 1_000_000
+) -> dict:
+    """Describe a .dta, .csv or .parquet dataset: variables, types, labels, row count, sample rows and summary statistics"""
+    valid_path = await validate_path(path)
+    preview = await asyncio.to_thread(preview_dataset, valid_path, sample_rows, columns, max_rows_scanned)
+    return preview.model_dump(mode="json")
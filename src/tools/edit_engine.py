@@ -0,0 +1,192 @@
+import os
+import re
+import tempfile
+from typing import Any, NamedTuple
+
+from tools.instrumentation import count
+
+_INDENT = re.compile(r"^\s*")
+
+
+class Edit_conflict_error(ValueError):
+    """An edit is missing, ambiguous, or overlaps another edit"""
+
+
+class Edit_span(NamedTuple):
+    start: int  # character offsets into the original content
+    end: int
+    replacement: str
+    edit_number: int
+
+
+def normalize_line_endings(text: str) -> str:
+    return text.replace('\r\n', '\n')
+
+
+def edit_texts(edit: Any) -> tuple[str, str]:
+    """(old, new) text of an edit given as Edit_operation or as a dict in either key style"""
+    if isinstance(edit, dict):
+        old = edit['oldText'] if 'oldText' in edit else edit['old_text']
+        new = edit['newText'] if 'newText' in edit else edit['new_text']
+    else:
+        old, new = edit.old_text, edit.new_text
+    return normalize_line_endings(old), normalize_line_endings(new)
+
+
+def _reindent(old_lines: list[str], new_text: str, first_content_line: str) -> str:
+    """Re-indent replacement lines after a whitespace-insensitive match"""
+    original_indent = _INDENT.match(first_content_line)[0] if first_content_line else ''
+    transformed: list[str] = []
+    for j, line in enumerate(new_text.split('\n')):
+        if j == 0:
+            transformed.append(original_indent + line.lstrip())
+            continue
+        # For subsequent lines, try to preserve relative indentation
+        old_indent = _INDENT.match(old_lines[j])[0] if j < len(old_lines) and old_lines[j] else ''
+        new_indent = _INDENT.match(line)[0] if line else ''
+        if old_indent and new_indent:
+            relative_indent = len(new_indent) - len(old_indent)
+            transformed.append(original_indent + ' ' * max(0, relative_indent) + line.lstrip())
+        else:
+            transformed.append(line)
+    return '\n'.join(transformed)
+
+
+class Line_index:
+    """Lines of a text with their offsets and a hash index of their stripped form"""
+
+    def __init__(self, content: str):
+        self.lines = content.split('\n')
+        self.starts: list[int] = []
+        position = 0
+        for line in self.lines:
+            self.starts.append(position)
+            position += len(line) + 1
+        self.by_stripped: dict[str, list[int]] = {}
+        for number, line in enumerate(self.lines):
+            self.by_stripped.setdefault(line.strip(), []).append(number)
+
+    def line_of(self, offset: int) -> int:
+        lo, hi = 0, len(self.starts) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.starts[mid] <= offset:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def fuzzy_matches(self, old_lines: list[str]) -> list[int]:
+        """First line numbers where `old_lines` match ignoring surrounding whitespace.
+
+        The rarest stripped line of the edit is used as the anchor, so only its few
+        occurrences are verified instead of every window of the file.
+        """
+        stripped = [line.strip() for line in old_lines]
+        anchor = min(range(len(stripped)), key=lambda k: len(self.by_stripped.get(stripped[k], ())))
+        matches = []
+        for anchor_line in self.by_stripped.get(stripped[anchor], ()):
+            first = anchor_line - anchor
+            if first < 0 or first + len(stripped) > len(self.lines):
+                continue
+            if all(self.lines[first + k].strip() == stripped[k] for k in range(len(stripped))):
+                matches.append(first)
+        return matches
+
+
+def _exact_matches(content: str, old: str) -> list[int]:
+    positions = []
+    position = content.find(old)
+    while position != -1:
+        positions.append(position)
+        position = content.find(old, position + 1)
+    return positions
+
+
+def plan_edits(content: str, edits: list[Any]) -> list[Edit_span]:
+    """Locate every edit in the original content and return non-overlapping spans.
+
+    All edits are matched against the original text, never against the output of an
+    earlier edit. An edit must match exactly one location, either verbatim or line
+    by line ignoring surrounding whitespace.
+    """
+    index = Line_index(content)
+    spans: list[Edit_span] = []
+    for number, edit in enumerate(edits, start=1):
+        old, new = edit_texts(edit)
+        if not old:
+            raise Edit_conflict_error(f"Edit {number} has empty oldText")
+
+        positions = _exact_matches(content, old)
+        if len(positions) == 1:
+            spans.append(Edit_span(positions[0], positions[0] + len(old), new, number))
+            continue
+        if len(positions) > 1:
+            lines = ', '.join(str(index.line_of(p) + 1) for p in positions[:10])
+            raise Edit_conflict_error(
+                f"Edit {number} is ambiguous, oldText matches {len(positions)} locations (lines {lines}); "
+                f"include more surrounding text:\n{old}"
+            )
+
+        old_lines = old.split('\n')
+        firsts = index.fuzzy_matches(old_lines)
+        if not firsts:
+            raise Edit_conflict_error(f"Could not find exact match for edit:\n{old}")
+        if len(firsts) > 1:
+            lines = ', '.join(str(f + 1) for f in firsts[:10])
+            raise Edit_conflict_error(
+                f"Edit {number} is ambiguous, oldText matches {len(firsts)} locations (lines {lines}); "
+                f"include more surrounding text:\n{old}"
+            )
+        first = firsts[0]
+        last = first + len(old_lines) - 1
+        start = index.starts[first]
+        end = index.starts[last] + len(index.lines[last])
+        spans.append(Edit_span(start, end, _reindent(old_lines, new, index.lines[first]), number))
+
+    spans.sort()
+    for previous, current in zip(spans, spans[1:]):
+        if current.start < previous.end:
+            raise Edit_conflict_error(
+                f"Edits {previous.edit_number} and {current.edit_number} overlap in the file"
+            )
+    return spans
+
+
+def apply_spans(content: str, spans: list[Edit_span]) -> str:
+    """Build the edited content in one pass over the sorted spans"""
+    pieces: list[str] = []
+    position = 0
+    for span in spans:
+        pieces.append(content[position:span.start])
+        pieces.append(span.replacement)
+        position = span.end
+    pieces.append(content[position:])
+    return ''.join(pieces)
+
+
+def apply_edits(content: str, edits: list[Any]) -> str:
+    return apply_spans(content, plan_edits(content, edits))
+
+
+def write_atomic(file_path: str, content: str, encoding: str = 'utf-8') -> None:
+    """Replace a file by writing a temporary sibling and renaming it over the original"""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(file_path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding=encoding) as f:
+            f.write(content)
+            f.flush()
+            count("bytes_written", f.tell())
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp_path, os.stat(file_path).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
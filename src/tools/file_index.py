@@ -0,0 +1,361 @@
+import fnmatch as std_fnmatch
+import hashlib
+import json
+import os
+import re
+import stat
+import threading
+import time
+from typing import Iterable, NamedTuple, Optional
+
+from glob2 import fnmatch
+
+from tools.fs_watcher import Change_event
+from tools.instrumentation import count
+
+INDEX_VERSION = 1
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "economic-research-assistant", "file_index")
+
+
+class File_index_entry(NamedTuple):
+    name: str
+    path: str
+    size: int
+    mtime: float
+    kind: str  # 'file', 'directory', 'symlink' or 'other'
+
+
+class _Dir_record:
+    __slots__ = ("mtime_ns", "entries")
+
+    def __init__(self, mtime_ns: int, entries: dict[str, File_index_entry]):
+        self.mtime_ns = mtime_ns
+        self.entries = entries
+
+
+_STAT_KINDS = {stat.S_IFLNK: "symlink", stat.S_IFDIR: "directory", stat.S_IFREG: "file"}
+
+
+def _entry_kind(entry: os.DirEntry) -> str:
+    if entry.is_symlink():
+        return "symlink"
+    if entry.is_dir(follow_symlinks=False):
+        return "directory"
+    if entry.is_file(follow_symlinks=False):
+        return "file"
+    return "other"
+
+
+def scan_directory(dir_path: str) -> tuple[int, dict[str, File_index_entry]]:
+    """List a single directory with os.scandir and return (mtime_ns, entries by name)"""
+    mtime_ns = os.stat(dir_path).st_mtime_ns
+    entries: dict[str, File_index_entry] = {}
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            kind = _entry_kind(entry)
+            try:
+                st = entry.stat(follow_symlinks=False)
+                size, mtime = (st.st_size if kind != "directory" else 0), st.st_mtime
+            except OSError:
+                size, mtime = 0, 0.0
+            entries[entry.name] = File_index_entry(entry.name, entry.path, size, mtime, kind)
+    count("stat", len(entries) + 1)
+    return mtime_ns, entries
+
+
+class File_index:
+    """Persistent index of the files below a set of root directories.
+
+    Every directory is stored with the mtime it had when it was scanned. A refresh
+    only stats directories and rescans the ones whose mtime changed, so keeping the
+    index current costs one stat per directory instead of a full walk. While
+    `watched` is set, a change watcher feeds every change to `apply_changes`, and
+    records below a subtree refreshed within `max_age` seconds are trusted without
+    stat'ing their directory. The periodic stat pass keeps running, because
+    watchers miss changes made over network and SMB mounts.
+    """
+
+    def __init__(self, roots: Iterable[str], index_dir: Optional[str] = DEFAULT_INDEX_DIR, max_age: float = 2.0):
+        self.roots = [os.path.normpath(os.path.realpath(os.path.expanduser(r))) for r in roots]
+        self.index_dir = index_dir
+        self.max_age = max_age
+        self._dirs: dict[str, _Dir_record] = {}
+        self._refreshed_at: dict[str, float] = {}
+        self._loaded: set[str] = set()
+        self._dirty: set[str] = set()
+        self._lock = threading.RLock()
+        self.watched = False
+
+    # -- persistence -------------------------------------------------------
+
+    def _index_file(self, root: str) -> str:
+        digest = hashlib.sha1(root.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.index_dir, f"{digest}.json")
+
+    def _load_root(self, root: str) -> None:
+        if root in self._loaded:
+            return
+        self._loaded.add(root)
+        if not self.index_dir:
+            return
+        try:
+            with open(self._index_file(root), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != INDEX_VERSION or data.get("root") != root:
+            return
+        for dir_path, (mtime_ns, rows) in data["dirs"].items():
+            entries = {
+                name: File_index_entry(name, os.path.join(dir_path, name), size, mtime, kind)
+                for name, size, mtime, kind in rows
+            }
+            self._dirs[dir_path] = _Dir_record(mtime_ns, entries)
+
+    def save(self) -> None:
+        """Write every root whose records changed since the last save"""
+        if not self.index_dir:
+            return
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            snapshots = {root: self._snapshot(root) for root in dirty}
+        os.makedirs(self.index_dir, exist_ok=True)
+        for root, dirs in snapshots.items():
+            target = self._index_file(root)
+            tmp = f"{target}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "root": root, "dirs": dirs}, f, separators=(",", ":"))
+            os.replace(tmp, target)
+
+    def _snapshot(self, root: str) -> dict:
+        return {
+            dir_path: [rec.mtime_ns, [[e.name, e.size, e.mtime, e.kind] for e in rec.entries.values()]]
+            for dir_path, rec in self._dirs.items()
+            if self._root_for(dir_path) == root
+        }
+
+    # -- maintenance -------------------------------------------------------
+
+    def _root_for(self, path: str) -> Optional[str]:
+        for root in self.roots:
+            if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+                return root
+        return None
+
+    def _drop_tree(self, dir_path: str) -> None:
+        prefix = dir_path.rstrip(os.sep) + os.sep
+        for key in [k for k in self._dirs if k == dir_path or k.startswith(prefix)]:
+            del self._dirs[key]
+
+    def _refresh_dir(self, dir_path: str, trust_watcher: bool = False) -> Optional[_Dir_record]:
+        """Rescan one directory if its mtime changed; returns None if it is gone.
+
+        With `trust_watcher` a record kept current by the watcher is returned without a stat.
+        """
+        if trust_watcher and self.watched:
+            with self._lock:
+                record = self._dirs.get(dir_path)
+            if record is not None and record.mtime_ns != -1:
+                count("cache_hits")
+                return record
+        count("stat")
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+        except OSError:
+            with self._lock:
+                self._drop_tree(dir_path)
+            return None
+        with self._lock:
+            record = self._dirs.get(dir_path)
+        if record is not None and record.mtime_ns == mtime_ns:
+            count("cache_hits")
+            return record
+        count("cache_misses")
+        try:
+            mtime_ns, entries = scan_directory(dir_path)
+        except OSError:
+            with self._lock:
+                self._drop_tree(dir_path)
+            return None
+        with self._lock:
+            if record is not None:
+                for name, old in record.entries.items():
+                    new = entries.get(name)
+                    if old.kind == "directory" and (new is None or new.kind != "directory"):
+                        self._drop_tree(old.path)
+            record = _Dir_record(mtime_ns, entries)
+            self._dirs[dir_path] = record
+            root = self._root_for(dir_path)
+            if root is not None:
+                self._dirty.add(root)
+        return record
+
+    def refresh(self, path: Optional[str] = None) -> None:
+        """Bring the index up to date below `path` (every root when omitted)"""
+        bases = [os.path.normpath(path)] if path else list(self.roots)
+        for base in bases:
+            root = self._root_for(base)
+            if root is None:
+                raise PermissionError(f"{base} is not inside an indexed directory")
+            with self._lock:
+                self._load_root(root)
+            stack = [base]
+            while stack:
+                record = self._refresh_dir(stack.pop())
+                if record is not None:
+                    stack.extend(e.path for e in record.entries.values() if e.kind == "directory")
+            self._refreshed_at[base] = time.monotonic()
+
+    def _recently_refreshed(self, path: str) -> bool:
+        now = time.monotonic()
+        for base, at in list(self._refreshed_at.items()):
+            if now - at < self.max_age and (path == base or path.startswith(base.rstrip(os.sep) + os.sep)):
+                return True
+        return False
+
+    def ensure_fresh(self, path: str) -> None:
+        """Refresh the subtree below `path` unless it was refreshed within max_age seconds"""
+        path = os.path.normpath(path)
+        if self._recently_refreshed(path):
+            return
+        self.refresh(path)
+        self.save()
+
+    def invalidate(self, path: str) -> None:
+        """Forget the directory containing `path` so the next refresh rescans it"""
+        path = os.path.normpath(path)
+        with self._lock:
+            for dir_path in (path, os.path.dirname(path)):
+                record = self._dirs.get(dir_path)
+                if record is not None:
+                    record.mtime_ns = -1
+            self._refreshed_at.clear()
+
+    def apply_changes(self, events: Iterable[Change_event]) -> None:
+        """Update the records of the changed paths in place instead of rescanning their directories.
+
+        A record takes its directory's new mtime only while `watched` is set, when
+        any other change to the directory is known to arrive as an event of its own.
+        """
+        for event in events:
+            path = os.path.normpath(event.path)
+            if event.kind == "rescan":
+                prefix = path.rstrip(os.sep) + os.sep
+                with self._lock:
+                    for dir_path, record in self._dirs.items():
+                        if dir_path == path or dir_path.startswith(prefix):
+                            record.mtime_ns = -1
+                    self._refreshed_at.clear()
+                continue
+            parent, name = os.path.split(path)
+            entry = None
+            if event.kind != "deleted":
+                count("stat")
+                try:
+                    st = os.lstat(path)
+                    kind = _STAT_KINDS.get(stat.S_IFMT(st.st_mode), "other")
+                    entry = File_index_entry(name, path, st.st_size if kind != "directory" else 0, st.st_mtime, kind)
+                except OSError:
+                    pass  # already gone again
+            parent_mtime_ns = None
+            if self.watched:
+                count("stat")
+                try:
+                    parent_mtime_ns = os.stat(parent).st_mtime_ns
+                except OSError:
+                    parent_mtime_ns = -1
+            with self._lock:
+                record = self._dirs.get(parent)
+                if entry is None or entry.kind != "directory":
+                    self._drop_tree(path)
+                if record is None:
+                    continue  # never listed; scanned when first needed
+                if entry is None:
+                    record.entries.pop(name, None)
+                else:
+                    record.entries[name] = entry
+                if parent_mtime_ns is not None:
+                    record.mtime_ns = parent_mtime_ns
+                root = self._root_for(parent)
+                if root is not None:
+                    self._dirty.add(root)
+
+    # -- queries -----------------------------------------------------------
+
+    def list_dir(self, dir_path: str) -> list[File_index_entry]:
+        """Entries of a single directory, rescanned only when its mtime changed"""
+        dir_path = os.path.normpath(dir_path)
+        root = self._root_for(dir_path)
+        if root is None:
+            raise PermissionError(f"{dir_path} is not inside an indexed directory")
+        with self._lock:
+            self._load_root(root)
+        record = self._refresh_dir(dir_path, trust_watcher=self._recently_refreshed(dir_path))
+        if record is None:
+            raise FileNotFoundError(f"Directory does not exist: {dir_path}")
+        return list(record.entries.values())
+
+    def iter_entries(self, path: str) -> Iterable[File_index_entry]:
+        """Every indexed entry strictly below `path`"""
+        path = os.path.normpath(path)
+        prefix = path.rstrip(os.sep) + os.sep
+        with self._lock:
+            records = [rec for d, rec in self._dirs.items() if d == path or d.startswith(prefix)]
+        for record in records:
+            yield from record.entries.values()
+
+    def query(
+        self,
+        path: str,
+        substring: Optional[str] = None,
+        glob: Optional[str] = None,
+        extension: Optional[str] = None,
+        kind: Optional[str] = "file",
+        exclude_patterns: Optional[list[str]] = None,
+        limit: Optional[int] = None,
+    ) -> list[File_index_entry]:
+        """Search the index below `path`.
+
+        `substring` matches file names case-insensitively, `glob` matches the name
+        (or the relative path when the pattern contains a separator), `extension`
+        matches the suffix with or without the leading dot, and `exclude_patterns`
+        are glob2 patterns applied to the path relative to `path`.
+        """
+        path = os.path.normpath(path)
+        self.ensure_fresh(path)
+        needle = substring.lower() if substring else None
+        glob_regex = None
+        glob_on_path = False
+        if glob:
+            glob_on_path = "/" in glob or os.sep in glob
+            glob_regex = re.compile(std_fnmatch.translate(os.path.normcase(glob)))
+        if extension:
+            extension = extension.lower()
+            if not extension.startswith("."):
+                extension = "." + extension
+        base_len = len(path.rstrip(os.sep)) + 1
+
+        results: list[File_index_entry] = []
+        for entry in self.iter_entries(path):
+            if kind is not None and entry.kind != kind and not (kind == "file" and entry.kind == "symlink"):
+                continue
+            if needle is not None and needle not in entry.name.lower():
+                continue
+            if extension is not None and not entry.name.lower().endswith(extension):
+                continue
+            if glob_regex is not None:
+                subject = entry.path[base_len:] if glob_on_path else entry.name
+                if not glob_regex.match(os.path.normcase(subject)):
+                    continue
+            if exclude_patterns:
+                relative = entry.path[base_len:]
+                if any(fnmatch.fnmatch(relative, p, sep=True) for p in exclude_patterns):
+                    continue
+            if kind == "file" and entry.kind == "symlink":
+                count("stat")
+                if os.path.isdir(entry.path):
+                    continue  # a link to a directory is not a file
+            results.append(entry)
+            if limit is not None and len(results) >= limit:
+                break
+        return results
@@ -0,0 +1,324 @@
+import asyncio
+import codecs
+import mmap
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, AsyncIterator, Iterable, Literal, NamedTuple, Optional
+
+from tools.instrumentation import count
+
+if TYPE_CHECKING:
+    # Imported where used: pydantic and the schemas are not needed by content-search workers
+    from schema import File_read_result
+
+Read_mode = Literal["head", "tail", "range"]
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_BYTES_PER_FILE = 256 * 1024
+DEFAULT_MAX_TOTAL_BYTES = 2 * 1024 * 1024
+LINE_INDEX_CACHE_SIZE = 64
+BINARY_SNIFF_BYTES = 8192
+_SCAN_CHUNK = 16 * 1024 * 1024
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def detect_encoding(sample: bytes) -> Optional[str]:
+    """Guess the encoding of a file from its first bytes; None means binary.
+
+    BOMs win, then UTF-8 if the sample decodes cleanly, then cp1252, which is what
+    Stata and Excel write on Windows, and finally latin-1, which never fails.
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    if b"\x00" in sample:
+        return None
+    try:
+        # A multi-byte character may be cut at the end of the sample
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    try:
+        sample.decode("cp1252")
+        return "cp1252"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def read_slice(
+    path: str,
+    max_bytes: int,
+    mode: Read_mode = "head",
+    offset: int = 0,
+) -> "File_read_result":
+    """Read at most `max_bytes` of a file without loading the rest of it.
+
+    'head' reads from the start, 'tail' reads the end of the file and 'range'
+    reads from `offset`. Partial lines at a cut are dropped so the model never
+    sees half a line.
+    """
+    from schema import File_read_result
+
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        encoding = detect_encoding(f.read(4096))
+        if encoding is None:
+            return File_read_result(path=path, size=size, truncated=size > 0, error="binary file, not read")
+        if mode == "tail":
+            start = max(0, size - max_bytes)
+        elif mode == "range":
+            start = min(max(0, offset), size)
+        else:
+            start = 0
+        f.seek(start)
+        data = f.read(max_bytes)
+    count("bytes_read", len(data))
+    end = start + len(data)
+    if start > 0 and b"\n" in data:
+        data = data[data.index(b"\n") + 1:]
+    if end < size and b"\n" in data:
+        data = data[:data.rindex(b"\n") + 1]
+    return File_read_result(
+        path=path,
+        content=data.decode(encoding, errors="replace"),
+        encoding=encoding,
+        size=size,
+        bytes_read=len(data),
+        truncated=start > 0 or end < size,
+    )
+
+
+async def iter_read_files(
+    paths: Iterable[tuple[str, str | Exception]],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_bytes_per_file: int = DEFAULT_MAX_BYTES_PER_FILE,
+    max_total_bytes: int = DEFAULT_MAX_TOTAL_BYTES,
+    mode: Read_mode = "head",
+    offset: int = 0,
+) -> AsyncIterator["File_read_result"]:
+    """Read files concurrently and yield the results in the order of `paths`.
+
+    `paths` holds (requested path, validated path or validation error) pairs. At
+    most `concurrency` files are open at once, no file contributes more than
+    `max_bytes_per_file` and all files together stay under `max_total_bytes`.
+    A failing file yields a result with `error` set and does not stop the others.
+    Later files keep reading while an earlier one is awaited; the fixed order
+    keeps the output, and so the model's prompt and its cache key, the same
+    from run to run.
+    """
+    from schema import File_read_result
+
+    semaphore = asyncio.Semaphore(concurrency)
+    budget = {"remaining": max_total_bytes}
+
+    async def _read(requested: str, valid: str | Exception) -> "File_read_result":
+        if isinstance(valid, Exception):
+            return File_read_result(path=requested, error=str(valid))
+        async with semaphore:
+            # Reserve before reading so concurrent reads cannot overshoot the total budget
+            allowance = min(max_bytes_per_file, budget["remaining"])
+            if allowance <= 0:
+                return File_read_result(path=requested, truncated=True, error="total byte budget exhausted")
+            budget["remaining"] -= allowance
+            try:
+                result = await asyncio.to_thread(read_slice, valid, allowance, mode, offset)
+            except Exception as e:
+                budget["remaining"] += allowance
+                return File_read_result(path=requested, error=str(e))
+            budget["remaining"] += allowance - result.bytes_read
+            result.path = requested
+            return result
+
+    tasks = [asyncio.create_task(_read(requested, valid)) for requested, valid in paths]
+    try:
+        for task in tasks:
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class _Line_index_cache:
+    """LRU of line start offsets per file, keyed by path and validated by mtime and size"""
+
+    def __init__(self, max_files: int = LINE_INDEX_CACHE_SIZE):
+        self.max_files = max_files
+        self._entries: OrderedDict[str, tuple[int, int, object]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, st: os.stat_result, mm: mmap.mmap):
+        with self._lock:
+            cached = self._entries.get(path)
+            if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                self._entries.move_to_end(path)
+                count("cache_hits")
+                return cached[2]
+        count("cache_misses")
+        offsets = _line_starts(mm)
+        with self._lock:
+            self._entries[path] = (st.st_mtime_ns, st.st_size, offsets)
+            while len(self._entries) > self.max_files:
+                self._entries.popitem(last=False)
+        return offsets
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+
+line_index_cache = _Line_index_cache()
+
+
+def _line_starts(mm: mmap.mmap):
+    """Byte offset of the start of every line, found with vectorised scans over the map"""
+    import numpy as np
+
+    starts = [np.zeros(1, dtype=np.int64)]
+    for chunk_start in range(0, len(mm), _SCAN_CHUNK):
+        chunk = np.frombuffer(mm, dtype=np.uint8, count=min(_SCAN_CHUNK, len(mm) - chunk_start), offset=chunk_start)
+        starts.append(np.flatnonzero(chunk == 0x0A).astype(np.int64) + (chunk_start + 1))
+        del chunk  # release the buffer export so the map can be closed
+    offsets = np.concatenate(starts)
+    if len(offsets) > 1 and offsets[-1] == len(mm):
+        offsets = offsets[:-1]  # a trailing newline does not start another line
+    return offsets
+
+
+def _decode(data: bytes, sample: bytes) -> str:
+    return data.decode(detect_encoding(sample) or "latin-1", errors="replace")
+
+
+def read_window(
+    path: str,
+    offset: Optional[int] = None,
+    length: Optional[int] = None,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+) -> str:
+    """Read a byte range or a 1-based inclusive line range through a memory map.
+
+    Line ranges use the cached line index, so after the first call on a file the
+    cost depends on the size of the window rather than the size of the file.
+    """
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        if st.st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            sample = mm[:4096]
+            if start_line is not None or end_line is not None:
+                offsets = line_index_cache.get(path, st, mm)
+                first = max(1, start_line or 1)
+                last = min(len(offsets), end_line or len(offsets))
+                if first > last:
+                    return ""
+                start = int(offsets[first - 1])
+                end = int(offsets[last]) if last < len(offsets) else st.st_size
+                count("bytes_read", end - start)
+                return _decode(mm[start:end], sample)
+            start = min(max(0, offset or 0), st.st_size)
+            end = st.st_size if length is None else min(st.st_size, start + max(0, length))
+            count("bytes_read", end - start)
+            return _decode(mm[start:end], sample)
+
+
+class File_matches(NamedTuple):
+    path: str
+    status: str  # 'match', 'none', 'binary', 'missing' (deleted since it was listed) or 'error'
+    lines: int  # matching lines found, at most max_matches
+    text: str  # grep -n -C output, or the error message
+
+
+def _grep_map(path: str, st: os.stat_result, mm: mmap.mmap, regex: re.Pattern, context: int, max_matches: int) -> tuple[str, int]:
+    """grep -n -C output of the matching lines of a mapped file, and how many there are"""
+    import numpy as np
+
+    first_match = regex.search(mm)
+    if first_match is None:
+        # Most files do not match; they cost one regex pass and no line index
+        return "", 0
+    sample = mm[:4096]
+    offsets = line_index_cache.get(path, st, mm)
+    matched: list[int] = []
+    for match in regex.finditer(mm, first_match.start()):
+        line_no = int(np.searchsorted(offsets, match.start(), side="right")) - 1
+        if not matched or matched[-1] != line_no:
+            matched.append(line_no)
+            if len(matched) >= max_matches:
+                break
+
+    matched_set = set(matched)
+    output: list[str] = []
+    last_shown = -2
+    for line_no in matched:
+        first = max(0, line_no - context, last_shown + 1)
+        last = min(len(offsets) - 1, line_no + context)
+        if first > last_shown + 1 and output:
+            output.append("--")
+        for n in range(first, last + 1):
+            start = int(offsets[n])
+            end = int(offsets[n + 1]) if n + 1 < len(offsets) else st.st_size
+            text = _decode(mm[start:end], sample).rstrip("\r\n")
+            output.append(f"{n + 1}{':' if n in matched_set else '-'}{text}")
+        last_shown = max(last_shown, last)
+    if len(matched) >= max_matches:
+        output.append(f"[stopped after {max_matches} matching lines]")
+    return "\n".join(output), len(matched)
+
+
+def grep_file(
+    path: str,
+    pattern: str,
+    context: int = 2,
+    max_matches: int = 100,
+    ignore_case: bool = False,
+) -> str:
+    """Return the lines matching a regular expression with `context` lines around them.
+
+    Output follows `grep -n -C`: 'N:line' for matches, 'N-line' for context and
+    '--' between separate groups.
+    """
+    regex = re.compile(pattern.encode("utf-8"), re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        if st.st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            count("bytes_read", st.st_size)
+            return _grep_map(path, st, mm, regex, context, max_matches)[0]
+
+
+def search_file(path: str, regex: re.Pattern, context: int = 2, max_matches: int = 100) -> File_matches:
+    """grep_file for content search: skips binary files and reports errors instead of raising"""
+    try:
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if st.st_size == 0:
+                return File_matches(path, "none", 0, "")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if detect_encoding(mm[:BINARY_SNIFF_BYTES]) is None:
+                    return File_matches(path, "binary", 0, "")
+                count("bytes_read", st.st_size)
+                text, lines = _grep_map(path, st, mm, regex, context, max_matches)
+    except FileNotFoundError as e:
+        return File_matches(path, "missing", 0, str(e))
+    except (OSError, ValueError) as e:
+        return File_matches(path, "error", 0, str(e))
+    return File_matches(path, "match" if lines else "none", lines, text)
+
+
+def search_file_batch(paths: list[str], pattern: bytes, flags: int, context: int, max_matches: int) -> list[File_matches]:
+    """search_file over several files; the unit of work sent to a worker process"""
+    regex = re.compile(pattern, flags)
+    return [search_file(path, regex, context, max_matches) for path in paths]
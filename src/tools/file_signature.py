@@ -0,0 +1,19 @@
+"""Cheap change detection for files that cached results depend on."""
+import hashlib
+import os
+
+
+def file_signature(path: str, hash_contents: bool = False) -> list:
+    """[path, size, mtime_ns] plus a sha256 of the contents when `hash_contents`; [path, None] if missing"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return [path, None]
+    signature = [path, st.st_size, st.st_mtime_ns]
+    if hash_contents:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        signature.append(digest.hexdigest())
+    return signature
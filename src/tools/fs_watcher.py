@@ -0,0 +1,373 @@
+"""Change notifications for the allowed directories.
+
+An `Fs_watcher` follows a set of root directories with inotify on Linux (through
+ctypes, no extra dependency), or by polling the trees when asked to. Polling
+stats every entry every few seconds, which costs more than the file index's own
+on-demand checks, so 'auto' does not fall back to it: where inotify is missing
+(Windows) or its watch limit is reached, starting the watcher fails and the
+caller goes without. Raw notifications are coalesced per path and
+published in batches once the tree has been quiet for `debounce` seconds, or
+after `max_delay` seconds under a steady stream of writes.
+
+Owners of in-memory state derived from the filesystem register a callback with
+`subscribe()`; it receives every batch, from the watcher thread. Tools that
+write files call `publish()` with what they changed, so the same callbacks
+update the state at once instead of waiting for the watcher.
+"""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from typing import Callable, Iterable, NamedTuple, Optional
+
+logger = logging.getLogger("era.tools.fs_watcher")
+
+
+class Change_event(NamedTuple):
+    kind: str  # 'created', 'modified', 'deleted', or 'rescan' when anything below the path may have changed
+    path: str
+    is_dir: bool = False
+
+
+_subscribers: list[Callable[[list[Change_event]], None]] = []
+_subscribers_lock = threading.Lock()
+
+
+def subscribe(callback: Callable[[list[Change_event]], None]) -> None:
+    with _subscribers_lock:
+        if callback not in _subscribers:
+            _subscribers.append(callback)
+
+
+def unsubscribe(callback: Callable[[list[Change_event]], None]) -> None:
+    with _subscribers_lock:
+        if callback in _subscribers:
+            _subscribers.remove(callback)
+
+
+def publish(events: list[Change_event]) -> None:
+    """Hand a batch of changes to every subscriber; a failing subscriber does not stop the others"""
+    if not events:
+        return
+    with _subscribers_lock:
+        callbacks = list(_subscribers)
+    for callback in callbacks:
+        try:
+            callback(events)
+        except Exception:
+            logger.warning("change subscriber failed", exc_info=True, extra={"subscriber": getattr(callback, "__qualname__", repr(callback))})
+
+
+def _merge(previous: Optional[Change_event], event: Change_event) -> Optional[Change_event]:
+    """Net effect of two changes to one path within a batch; None when they cancel out"""
+    if previous is None or event.kind == "rescan" or previous.kind == "rescan":
+        return event if previous is None or event.kind == "rescan" else previous
+    if previous.kind == "created":
+        return None if event.kind == "deleted" else previous._replace(is_dir=event.is_dir)
+    if previous.kind == "deleted" and event.kind == "created":
+        return event._replace(kind="modified")
+    return event
+
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+_WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+)
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _walk_directories(root: str) -> Iterable[str]:
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        yield directory
+        try:
+            with os.scandir(directory) as it:
+                stack.extend(entry.path for entry in it if entry.is_dir(follow_symlinks=False))
+        except OSError:
+            continue
+
+
+class Inotify_backend:
+    """One inotify watch per directory below the roots"""
+
+    name = "inotify"
+
+    def __init__(self, roots: list[str]):
+        if not hasattr(os, "O_CLOEXEC") or not os.uname().sysname == "Linux":
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._wake_read, self._wake_write = os.pipe()
+        self.roots = roots
+        self._paths: dict[int, str] = {}
+        self._watches: dict[str, int] = {}
+        try:
+            for root in roots:
+                self._watch_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch_tree(self, root: str) -> list[str]:
+        """Watch `root` and every directory below it; returns the directories found"""
+        found = []
+        for directory in _walk_directories(root):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                    continue  # gone, or not readable, since it was listed
+                hint = " (watch limit reached, see fs.inotify.max_user_watches)" if error == errno.ENOSPC else ""
+                raise OSError(error, f"inotify_add_watch failed for {directory}{hint}")
+            self._paths[wd] = directory
+            self._watches[directory] = wd
+            found.append(directory)
+        return found
+
+    def _unwatch_tree(self, root: str) -> None:
+        prefix = root.rstrip(os.sep) + os.sep
+        for directory in [d for d in self._watches if d == root or d.startswith(prefix)]:
+            wd = self._watches.pop(directory)
+            self._paths.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def wake(self) -> None:
+        os.write(self._wake_write, b"\0")
+
+    def read(self, timeout: Optional[float]) -> list[Change_event]:
+        readable, _, _ = select.select([self._fd, self._wake_read], [], [], timeout)
+        if self._wake_read in readable:
+            os.read(self._wake_read, 4096)
+        if self._fd not in readable:
+            return []
+        try:
+            data = os.read(self._fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+        events: list[Change_event] = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events += self._translate(wd, mask, name)
+        return events
+
+    def _translate(self, wd: int, mask: int, name: str) -> list[Change_event]:
+        if mask & IN_Q_OVERFLOW:
+            return [Change_event("rescan", root, True) for root in self.roots]
+        directory = self._paths.get(wd)
+        if mask & IN_IGNORED:
+            if directory is not None and self._watches.get(directory) == wd:
+                del self._watches[directory]
+            self._paths.pop(wd, None)
+            return []
+        if directory is None or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            return []  # reported by the parent directory's watch
+        path = os.path.join(directory, name) if name else directory
+        is_dir = bool(mask & IN_ISDIR)
+        if mask & (IN_DELETE | IN_MOVED_FROM):
+            if is_dir:
+                self._unwatch_tree(path)
+            return [Change_event("deleted", path, is_dir)]
+        if mask & (IN_CREATE | IN_MOVED_TO):
+            if not is_dir:
+                return [Change_event("created", path)]
+            # Entries made before the new watches were in place produce no events of their own
+            events = [Change_event("created", path, True)]
+            try:
+                directories = self._watch_tree(path)
+            except OSError:
+                logger.warning("cannot watch new directory", exc_info=True, extra={"path": path})
+                return events + [Change_event("rescan", path, True)]
+            for found in directories:
+                try:
+                    with os.scandir(found) as it:
+                        events += [Change_event("created", e.path, e.is_dir(follow_symlinks=False)) for e in it]
+                except OSError:
+                    continue
+            return events
+        return [Change_event("modified", path, is_dir)] if name else []
+
+    def close(self) -> None:
+        for fd in (self._fd, self._wake_read, self._wake_write):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class Polling_backend:
+    """Compares (kind, size, mtime) of every entry below the roots every `interval` seconds"""
+
+    name = "poll"
+
+    def __init__(self, roots: list[str], interval: float = 2.0):
+        self.roots = roots
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._snapshot = self._scan()
+        self._next_poll = time.monotonic() + interval
+
+    def _scan(self) -> dict[str, tuple[bool, int, int]]:
+        snapshot: dict[str, tuple[bool, int, int]] = {}
+        for root in self.roots:
+            for directory in _walk_directories(root):
+                try:
+                    with os.scandir(directory) as it:
+                        for entry in it:
+                            try:
+                                st = entry.stat(follow_symlinks=False)
+                            except OSError:
+                                continue
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                            snapshot[entry.path] = (is_dir, 0 if is_dir else st.st_size, 0 if is_dir else st.st_mtime_ns)
+                except OSError:
+                    continue
+        return snapshot
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def read(self, timeout: Optional[float]) -> list[Change_event]:
+        wait = self._next_poll - time.monotonic()
+        if timeout is not None:
+            wait = min(wait, timeout)
+        if wait > 0 and self._wakeup.wait(wait):
+            self._wakeup.clear()
+            return []
+        if time.monotonic() < self._next_poll:
+            return []
+        snapshot = self._scan()
+        self._next_poll = time.monotonic() + self.interval
+        previous, self._snapshot = self._snapshot, snapshot
+        events = [Change_event("deleted", path, state[0]) for path, state in previous.items() if path not in snapshot]
+        for path, state in snapshot.items():
+            before = previous.get(path)
+            if before is None:
+                events.append(Change_event("created", path, state[0]))
+            elif before != state:
+                events.append(Change_event("modified", path, state[0]))
+        return events
+
+    def close(self) -> None:
+        pass
+
+
+class Fs_watcher:
+    """Publishes debounced batches of changes below `roots` from a background thread.
+
+    `backend` is 'inotify', 'poll' or 'auto' (inotify where it is available;
+    start() raises OSError otherwise).
+    `stats` counts raw notifications, published batches and events.
+    """
+
+    def __init__(
+        self,
+        roots: Iterable[str],
+        backend: str = "auto",
+        debounce: float = 0.2,
+        max_delay: float = 1.0,
+        poll_interval: float = 2.0,
+    ):
+        self.roots = [os.path.normpath(os.path.realpath(os.path.expanduser(r))) for r in roots]
+        self.backend_name = backend
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.backend = None
+        self.stats = {"raw_events": 0, "batches": 0, "events": 0, "rescans": 0}
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _open_backend(self):
+        roots = [root for root in self.roots if os.path.isdir(root)]
+        if self.backend_name == "poll":
+            return Polling_backend(roots, self.poll_interval)
+        try:
+            return Inotify_backend(roots)
+        except AttributeError as e:  # os.uname() and friends on Windows
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux") from e
+
+    def start(self) -> "Fs_watcher":
+        if self.running:
+            return self
+        # The backend is ready before start() returns, so no change after it is missed
+        self.backend = self._open_backend()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="fs-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self.backend.wake()
+        self._thread.join(timeout)
+        self._thread = None
+        self.backend.close()
+
+    def _run(self) -> None:
+        pending: dict[str, Change_event] = {}
+        first = last = 0.0
+        while not self._stopping.is_set():
+            timeout = None
+            if pending:
+                now = time.monotonic()
+                timeout = max(0.0, min(last + self.debounce, first + self.max_delay) - now)
+            try:
+                events = self.backend.read(timeout)
+            except Exception:
+                logger.warning("watcher backend failed", exc_info=True)
+                events = [Change_event("rescan", root, True) for root in self.roots]
+                self._stopping.wait(self.poll_interval)
+            now = time.monotonic()
+            if events:
+                if not pending:
+                    first = now
+                last = now
+                self.stats["raw_events"] += len(events)
+                for event in events:
+                    merged = _merge(pending.get(event.path), event)
+                    if merged is None:
+                        pending.pop(event.path, None)
+                    else:
+                        pending[event.path] = merged
+            if pending and (now - last >= self.debounce or now - first >= self.max_delay):
+                batch = list(pending.values())
+                pending.clear()
+                self.stats["batches"] += 1
+                self.stats["events"] += len(batch)
+                self.stats["rescans"] += sum(event.kind == "rescan" for event in batch)
+                publish(batch)
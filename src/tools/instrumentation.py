@@ -0,0 +1,274 @@
+"""Per-tool metrics, structured logging and an opt-in profiler.
+
+Decorate a tool with `@instrumented` (above `@tool`) to record, for every call,
+its latency in a histogram plus the counters that the code it runs reports
+through `count()`: bytes read and written, stat and listdir syscalls, opened
+files, cache hits and misses, and seconds spent in Stata. Counters reach the
+call that caused them through a context variable, so work done in
+`asyncio.to_thread` workers is attributed correctly; functions handed to a
+thread pool of our own are wrapped with `in_context()` for the same reason.
+
+Metrics are dumped with `metrics_json()` or `metrics_prometheus()`; setting
+ERA_METRICS_FILE writes them at exit (Prometheus text if the name ends in
+.prom). Setting ERA_PROFILE_DIR profiles each `profiled()` block, one agent run,
+with cProfile and writes one .prof file per block, readable with pstats or
+snakeviz. Tool calls of a turn run concurrently on one thread, so they cannot be
+told apart by a profiler of their own. With the variable unset nothing is
+installed, so a sampling profiler such as py-spy can attach to the process
+without interference.
+"""
+import atexit
+import contextlib
+import contextvars
+import cProfile
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional
+
+logger = logging.getLogger("era.tools")
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+COUNTERS = (
+    "bytes_read", "bytes_written", "stat", "listdir", "open",
+    "cache_hits", "cache_misses", "stata_seconds",
+)
+
+_current: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("era_tool_counters", default=None)
+
+
+def count(name: str, amount: float = 1) -> None:
+    """Add to a counter of the tool call in progress; a no-op outside instrumented calls"""
+    counters = _current.get()
+    if counters is not None:
+        counters[name] = counters.get(name, 0) + amount
+
+
+def in_context(func: Callable) -> Callable:
+    """`func` running in a copy of the caller's context, so count() reaches the tool call from pool threads"""
+    context = contextvars.copy_context()
+    return lambda *args: context.copy().run(func, *args)
+
+
+def _audit(event: str, args: tuple) -> None:
+    # Audit hooks cannot be removed, so this stays cheap when no call is being measured
+    if event in ("os.scandir", "os.listdir", "open"):
+        counters = _current.get()
+        if counters is not None:
+            name = "open" if event == "open" else "listdir"
+            counters[name] = counters.get(name, 0) + 1
+
+
+_audit_installed = False
+
+
+def _install_audit_hook() -> None:
+    global _audit_installed
+    if not _audit_installed:
+        sys.addaudithook(_audit)
+        _audit_installed = True
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout"""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, number in enumerate(self.counts):
+            seen += number
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        total = 0
+        rows = []
+        for bound, number in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            total += number
+            rows.append((bound, total))
+        return rows
+
+
+class Tool_metrics:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.counters: dict[str, float] = dict.fromkeys(COUNTERS, 0)
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency_sum": self.latency.sum,
+            "latency_p50": self.latency.quantile(0.5),
+            "latency_p99": self.latency.quantile(0.99),
+            "latency_buckets": dict(self.latency.cumulative()),
+            **self.counters,
+        }
+
+
+class Metrics_registry:
+    def __init__(self):
+        self.tools: dict[str, Tool_metrics] = {}
+        self._lock = threading.Lock()
+
+    def record(self, tool_name: str, latency: float, ok: bool, counters: dict) -> None:
+        with self._lock:
+            metrics = self.tools.get(tool_name)
+            if metrics is None:
+                metrics = self.tools[tool_name] = Tool_metrics()
+            metrics.calls += 1
+            metrics.errors += not ok
+            metrics.latency.observe(latency)
+            for name, amount in counters.items():
+                metrics.counters[name] = metrics.counters.get(name, 0) + amount
+
+    def reset(self) -> None:
+        with self._lock:
+            self.tools.clear()
+
+
+registry = Metrics_registry()
+
+
+def _profile_dir() -> Optional[str]:
+    return os.environ.get("ERA_PROFILE_DIR") or None
+
+
+_profiling = threading.Lock()
+
+
+@contextlib.contextmanager
+def profiled(label: str) -> Iterator[None]:
+    """Profile the block with cProfile when ERA_PROFILE_DIR is set; one block at a time per process"""
+    profile_dir = _profile_dir()
+    if profile_dir is None or not _profiling.acquire(blocking=False):
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        yield
+    finally:
+        profiler.disable()
+        _profiling.release()
+        os.makedirs(profile_dir, exist_ok=True)
+        profiler.dump_stats(os.path.join(profile_dir, f"{label}-{time.time_ns()}.prof"))
+
+
+def instrumented(tool: Any) -> Any:
+    """Wrap the coroutine of a LangChain tool so that every call is measured"""
+    _install_audit_hook()
+    name = tool.name
+    coroutine = tool.coroutine
+
+    @functools.wraps(coroutine)
+    async def measured(*args, **kwargs):
+        counters: dict = {}
+        token = _current.set(counters)
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = await coroutine(*args, **kwargs)
+            ok = True
+            return result
+        except Exception:
+            logger.warning("tool failed", exc_info=True, extra={"tool": name})
+            raise
+        finally:
+            latency = time.perf_counter() - started
+            _current.reset(token)
+            registry.record(name, latency, ok, counters)
+            logger.debug("tool call", extra={"tool": name, "latency": round(latency, 6), "ok": ok, **counters})
+
+    tool.coroutine = measured
+    return tool
+
+
+def metrics_json() -> dict:
+    with registry._lock:
+        return {name: metrics.to_dict() for name, metrics in sorted(registry.tools.items())}
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def metrics_prometheus(prefix: str = "era_tool") -> str:
+    """Prometheus text exposition format"""
+    lines = [
+        f"# HELP {prefix}_latency_seconds Tool call latency",
+        f"# TYPE {prefix}_latency_seconds histogram",
+    ]
+    with registry._lock:
+        tools = sorted(registry.tools.items())
+        for name, metrics in tools:
+            label = f'tool="{_label(name)}"'
+            for bound, total in metrics.latency.cumulative():
+                lines.append(f'{prefix}_latency_seconds_bucket{{{label},le="{bound}"}} {total}')
+            lines.append(f"{prefix}_latency_seconds_sum{{{label}}} {metrics.latency.sum}")
+            lines.append(f"{prefix}_latency_seconds_count{{{label}}} {metrics.latency.count}")
+        for counter in ("calls", "errors", *COUNTERS):
+            lines.append(f"# TYPE {prefix}_{counter}_total counter")
+            for name, metrics in tools:
+                value = getattr(metrics, counter) if counter in ("calls", "errors") else metrics.counters.get(counter, 0)
+                lines.append(f'{prefix}_{counter}_total{{tool="{_label(name)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def dump_metrics(path: str) -> None:
+    """Write the metrics as Prometheus text (.prom) or JSON (anything else)"""
+    text = metrics_prometheus() if path.endswith(".prom") else json.dumps(metrics_json(), indent=2)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+class Json_log_formatter(logging.Formatter):
+    """One JSON object per record, including the fields passed with `extra=`"""
+
+    _STANDARD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in self._STANDARD})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = "INFO", json_format: bool = True) -> None:
+    handler = logging.StreamHandler()
+    handler.setFormatter(Json_log_formatter() if json_format else logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    root = logging.getLogger("era")
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+
+if os.environ.get("ERA_METRICS_FILE"):
+    atexit.register(dump_metrics, os.environ["ERA_METRICS_FILE"])
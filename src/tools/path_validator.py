@@ -0,0 +1,156 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+# What a cached resolution depends on: the parent directory's mtime and (device, inode, mode) of every ancestor
+Parent_signature = tuple[int, tuple[tuple[int, int, int], ...]]
+
+from tools.instrumentation import count
+
+
+def split_path(path: str) -> tuple[str, ...]:
+    """Case-normalised components of a normalised path, used for containment checks"""
+    return tuple(part for part in os.path.normcase(os.path.normpath(path)).split(os.sep) if part)
+
+
+class Path_validator:
+    """Authorizes paths against a fixed set of allowed directories.
+
+    The allowed roots are resolved once. Containment is checked on path
+    components, so '/data/projects2' is not accepted for the root
+    '/data/projects'. Resolved real paths are kept in an LRU cache keyed by the
+    requested absolute path. An entry stays valid while the mtime of its parent
+    directory is unchanged, because creating, deleting, renaming or re-pointing
+    the entry all touch that directory, and while every ancestor is still the
+    same directory or link (lstat device, inode and mode): replacing an ancestor
+    with a symlink leaves the parent's mtime alone but would move the resolved
+    path, possibly outside the allowed roots.
+    """
+
+    def __init__(self, allowed_directories: Iterable[str], cache_size: int = 4096):
+        self.allowed_directories = list(allowed_directories)
+        self.cache_size = cache_size
+        self._roots = {split_path(os.path.realpath(os.path.expanduser(d))) for d in self.allowed_directories}
+        self._root_lengths = sorted({len(r) for r in self._roots})
+        self._cache: OrderedDict[str, tuple[Parent_signature, str, bool]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def is_allowed(self, real_path: str) -> bool:
+        """True if an already resolved path lies inside one of the allowed roots"""
+        parts = split_path(real_path)
+        return any(parts[:n] in self._roots for n in self._root_lengths if n <= len(parts))
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """Drop the cached entry for `path` and everything below it, or the whole cache"""
+        with self._lock:
+            if path is None:
+                self._cache.clear()
+                return
+            absolute = os.path.normpath(os.path.abspath(os.path.expanduser(path)))
+            prefix = absolute.rstrip(os.sep) + os.sep
+            for key in [k for k in self._cache if k == absolute or k.startswith(prefix)]:
+                del self._cache[key]
+
+    def _lookup(self, absolute: str, parent_signature: Parent_signature) -> Optional[tuple[str, bool]]:
+        with self._lock:
+            cached = self._cache.get(absolute)
+            if cached is None or cached[0] != parent_signature:
+                self.misses += 1
+                count("cache_misses")
+                return None
+            self._cache.move_to_end(absolute)
+            self.hits += 1
+            count("cache_hits")
+            return cached[1], cached[2]
+
+    def _store(self, absolute: str, parent_signature: Parent_signature, real_path: str, exists: bool) -> None:
+        with self._lock:
+            self._cache[absolute] = (parent_signature, real_path, exists)
+            self._cache.move_to_end(absolute)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _check(self, requested_path: str, real_path: str, exists: bool) -> str:
+        if not self.is_allowed(real_path):
+            raise PermissionError(
+                f"Access denied - path outside allowed directories: {real_path} not in {self.allowed_directories}"
+            )
+        if not exists:
+            parent_dir = os.path.dirname(real_path)
+            if not self.is_allowed(parent_dir):
+                raise PermissionError(f"Access denied - parent directory outside allowed directories: {parent_dir}")
+        return real_path
+
+    def _validate(self, requested_path: str, absolute: str, parent_signature: Optional[Parent_signature]) -> str:
+        if parent_signature is None:
+            # The lexical parent is missing, so the path can be neither read nor created
+            real_path = os.path.realpath(absolute)
+            if not self.is_allowed(real_path):
+                self._check(requested_path, real_path, False)
+            raise FileNotFoundError(f"Parent directory does not exist: {os.path.dirname(real_path)}")
+        cached = self._lookup(absolute, parent_signature)
+        if cached is not None:
+            return self._check(requested_path, *cached)
+        try:
+            real_path = os.path.realpath(absolute)
+            exists = os.path.exists(real_path)
+            count("stat", 2)
+        except OSError as e:
+            raise PermissionError(f"Could not validate path {requested_path}: {e}")
+        if not exists and not os.path.isdir(os.path.dirname(real_path)):
+            raise FileNotFoundError(f"Parent directory does not exist: {os.path.dirname(real_path)}")
+        self._store(absolute, parent_signature, real_path, exists)
+        return self._check(requested_path, real_path, exists)
+
+    @staticmethod
+    def _parent_signature(absolute: str) -> Optional[Parent_signature]:
+        """The parent's mtime and the identity of each ancestor, or None if the parent is missing"""
+        parent = os.path.dirname(absolute)
+        ancestors = []
+        directory = parent
+        while True:
+            ancestors.append(directory)
+            up = os.path.dirname(directory)
+            if up == directory:
+                break
+            directory = up
+        count("stat", len(ancestors) + 1)
+        try:
+            chain = tuple((st.st_dev, st.st_ino, st.st_mode) for st in map(os.lstat, reversed(ancestors)))
+            return os.stat(parent).st_mtime_ns, chain
+        except OSError:
+            return None
+
+    def validate(self, requested_path: str) -> str:
+        """Return the real path for `requested_path` or raise PermissionError/FileNotFoundError.
+
+        Paths that do not exist yet are accepted when their parent directory exists
+        inside the allowed directories, so tools can create new files.
+        """
+        absolute = os.path.normpath(os.path.abspath(os.path.expanduser(requested_path)))
+        return self._validate(requested_path, absolute, self._parent_signature(absolute))
+
+    def validate_many(self, requested_paths: Iterable[str]) -> list[str | Exception]:
+        """Validate a batch of paths, returning the real path or the exception for each.
+
+        Parent directories and their ancestors are stat'ed once per batch, so a
+        whole directory listing costs one stat per path component plus one
+        realpath per cache miss.
+        """
+        absolutes = [
+            (p, os.path.normpath(os.path.abspath(os.path.expanduser(p)))) for p in requested_paths
+        ]
+        parent_signatures: dict[str, Optional[Parent_signature]] = {}
+        results: list[str | Exception] = []
+        for requested_path, absolute in absolutes:
+            parent = os.path.dirname(absolute)
+            if parent not in parent_signatures:
+                parent_signatures[parent] = self._parent_signature(absolute)
+            try:
+                results.append(self._validate(requested_path, absolute, parent_signatures[parent]))
+            except (PermissionError, FileNotFoundError) as e:
+                results.append(e)
+        return results
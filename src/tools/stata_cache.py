@@ -0,0 +1,306 @@
+import hashlib
+import json
+import os
+import re
+import shlex
+import threading
+import time
+from typing import Optional
+
+from tools.file_signature import file_signature
+from tools.instrumentation import count
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "economic-research-assistant", "stata_cache")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+CACHE_VERSION = 2
+
+# Commands whose file argument is read, and the ones whose file argument is written
+_INPUT_COMMANDS = ("use", "merge", "append", "joinby", "cross", "import", "insheet", "infile", "infix", "do", "run", "include")
+_OUTPUT_COMMANDS = ("save", "saveold", "export", "outsheet", "esttab", "estout", "outreg2", "putexcel", "graph", "estimates", "log")
+_NESTED_DO_COMMANDS = ("do", "run", "include")
+# Commands with effects on files or the system that a cached log cannot reproduce
+_SIDE_EFFECT_COMMANDS = ("file", "postfile", "putdocx", "putpdf", "copy", "erase", "rm", "mkdir", "rmdir", "shell", "winexec", "xshell", "unixexec")
+_MAX_NESTING = 5
+
+
+class Uncacheable(Exception):
+    """The do-file's inputs or outputs cannot be determined statically"""
+
+
+def _logical_lines(do_text: str) -> list[str]:
+    """Do-file commands with comments removed and /// continuations joined"""
+    do_text = re.sub(r"/\*.*?\*/", " ", do_text, flags=re.DOTALL)
+    do_text = re.sub(r"///[^\n]*\n", " ", do_text)
+    lines = []
+    for line in do_text.splitlines():
+        line = re.sub(r"(^|\s)//.*$", "", line).strip()
+        if line and not line.startswith("*"):
+            lines.append(line)
+    return lines
+
+
+def _command_word(line: str) -> tuple[str, str]:
+    # Prefixes that do not change which files a command touches
+    words = line.split(None, 1)
+    while words and words[0] in ("capture", "cap", "quietly", "qui", "noisily", "noi"):
+        words = words[1].split(None, 1) if len(words) > 1 else []
+    if words and words[0].endswith(":"):
+        words = words[1].split(None, 1) if len(words) > 1 else []
+    return (words[0], words[1] if len(words) > 1 else "") if words else ("", "")
+
+
+def _file_argument(command: str, rest: str) -> Optional[str]:
+    """The file a command reads or writes, or None if it does not name one"""
+    before_options = rest.split(",", 1)[0]
+    if re.search(r"(^|\s)using\s", f" {before_options} "):
+        target = re.split(r"(?:^|\s)using\s+", before_options, maxsplit=1)[1]
+    elif command in ("import", "export"):
+        # import delimited file / export excel file
+        parts = before_options.split(None, 1)
+        target = parts[1] if len(parts) > 1 else ""
+    elif command == "graph":
+        parts = before_options.split(None, 1)
+        if not parts or parts[0] != "export":
+            return None
+        target = parts[1] if len(parts) > 1 else ""
+    elif command in ("estimates", "putexcel"):
+        parts = before_options.split(None, 1)
+        if not parts or parts[0] not in ("save", "set"):
+            return None
+        target = parts[1] if len(parts) > 1 else ""
+    elif command in ("use", "save", "saveold", "do", "run", "include"):
+        target = before_options
+    else:
+        return None
+    target = target.strip()
+    if not target:
+        return None
+    try:
+        return shlex.split(target)[0]
+    except ValueError:
+        raise Uncacheable(f"cannot parse file name in: {command} {rest}")
+
+
+def _resolve(target: str, cwd: str, default_extension: Optional[str]) -> str:
+    if any(c in target for c in "$`'"):
+        raise Uncacheable(f"file name uses a macro: {target}")
+    path = os.path.normpath(os.path.join(cwd, os.path.expanduser(target)))
+    if default_extension and not os.path.splitext(path)[1]:
+        path += default_extension
+    return path
+
+
+def _default_extension(command: str, rest: str) -> Optional[str]:
+    if command in ("import", "export") and rest.split(None, 1)[:1] == ["excel"]:
+        return ".xlsx"
+    if command in _NESTED_DO_COMMANDS:
+        return ".do"
+    if command in ("use", "merge", "append", "joinby", "cross", "save", "saveold"):
+        return ".dta"
+    return None
+
+
+def _scan(do_file: str, inputs: list[str], outputs: list[str], depth: int, cwd: Optional[str] = None) -> str:
+    """Add the files read and written by `do_file` run from `cwd`; returns the working directory it leaves behind"""
+    with open(do_file, "r", encoding="utf-8", errors="ignore") as f:
+        lines = _logical_lines(f.read())
+    cwd = cwd or os.path.dirname(os.path.abspath(do_file))
+    for line in lines:
+        command, rest = _command_word(line)
+        if command == "cd":
+            cwd = _resolve(rest.strip().strip('"'), cwd, None)
+            continue
+        if command in _SIDE_EFFECT_COMMANDS or command.startswith("!"):
+            raise Uncacheable(f"{command} has side effects a cached run would skip")
+        if command not in _INPUT_COMMANDS and command not in _OUTPUT_COMMANDS:
+            continue
+        target = _file_argument(command, rest)
+        if target is None:
+            if command in ("save", "saveold"):
+                raise Uncacheable("save without a file name overwrites the file last used")
+            continue
+        path = _resolve(target, cwd, _default_extension(command, rest))
+        if command == "log":
+            continue
+        if command in _OUTPUT_COMMANDS:
+            if path in inputs:
+                raise Uncacheable(f"the do-file overwrites its own input {path}")
+            outputs.append(path)
+        elif path not in outputs:
+            # Files written earlier in the run are intermediate, not inputs
+            inputs.append(path)
+            if command in _NESTED_DO_COMMANDS and depth < _MAX_NESTING and os.path.exists(path):
+                # Stata resolves the nested file's paths against the current directory, and keeps its cd
+                cwd = _scan(path, inputs, outputs, depth + 1, cwd)
+    return cwd
+
+
+def scan_do_file(do_file: str, cwd: Optional[str] = None) -> tuple[list[str], list[str]]:
+    """Input and output files of a do-file, following nested do/run/include calls.
+
+    Raises Uncacheable when a file name depends on a macro, when the working
+    directory changes to something that is not a literal path, when the run
+    overwrites a file it read, since repeating it would not read the same data,
+    or when it copies, erases or opens files directly or runs shell commands.
+    """
+    inputs: list[str] = []
+    outputs: list[str] = []
+    _scan(do_file, inputs, outputs, 0, cwd)
+    return list(dict.fromkeys(inputs)), list(dict.fromkeys(outputs))
+
+
+def _replace_target(line: str, command: str, target: str, path: str) -> str:
+    """`line` with its file argument `target` replaced by the quoted `path`"""
+    start = re.search(rf"(?<!\S){re.escape(command)}(?!\S)", line).end()
+    end = line.find(",", start)
+    using = re.search(r"\susing\s", line[start:end if end >= 0 else len(line)])
+    if using:
+        start += using.end()
+    quoted = re.escape(f'"{target}"') + "|" + r"(?<![^\s\"])" + re.escape(target) + r"(?![^\s,\"])"
+    return line[:start] + re.sub(quoted, lambda _: f'"{path}"', line[start:], count=1)
+
+
+def localize_do_file(do_text: str, cwd: str, target_dir: str, written: Optional[set] = None, depth: int = 0) -> tuple[str, str]:
+    """A copy of a do-file to run from `target_dir` instead of `cwd`; returns (text, working directory it leaves).
+
+    Files it reads, and directories it changes to, become absolute paths
+    resolved against `cwd`, so a job in a directory of its own reads the same
+    data. Relative outputs stay relative and land in `target_dir`, as do files
+    the run reads back after writing them. Nested do-files are localized into
+    `target_dir` too. Comments are dropped and /// continuations joined.
+    """
+    written = set() if written is None else written
+    lines = []
+    for line in _logical_lines(do_text):
+        command, rest = _command_word(line)
+        try:
+            if command == "cd":
+                target = rest.strip().strip('"')
+                cwd = _resolve(target, cwd, None)
+                line = _replace_target(line, command, target, cwd)
+            elif command in _INPUT_COMMANDS or command in _OUTPUT_COMMANDS:
+                target = _file_argument(command, rest)
+                if target is not None:
+                    path = _resolve(target, cwd, _default_extension(command, rest))
+                    if command in _OUTPUT_COMMANDS:
+                        written.add(path)
+                    elif path not in written:
+                        if command in _NESTED_DO_COMMANDS and depth < _MAX_NESTING and os.path.exists(path):
+                            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                                nested, cwd = localize_do_file(f.read(), cwd, target_dir, written, depth + 1)
+                            digest = hashlib.sha1(path.encode("utf-8")).hexdigest()[:12]
+                            path = os.path.join(target_dir, f"nested_{digest}.do")
+                            with open(path, "w", encoding="utf-8") as f:
+                                f.write(nested)
+                        line = _replace_target(line, command, target, path)
+        except Uncacheable:
+            pass  # a macro path is left for Stata to resolve
+        lines.append(line)
+    return "\n".join(lines) + "\n", cwd
+
+
+class Stata_result_cache:
+    """On-disk cache of Stata logs keyed by the do-file, its inputs and the Stata version.
+
+    The key hashes the do-file's absolute path, its working directory and text,
+    the size and mtime (or the content hash with `hash_inputs`) of every file it
+    reads, the resolved paths of the files it writes, and `stata_version`, so the
+    same do-file in another directory is a different run. Files the run writes
+    are recorded too; a hit is only served while they are still as the run left
+    them and are the files the current run would write. Entries are evicted
+    least recently used once the cache exceeds `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES, hash_inputs: bool = False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hash_inputs = hash_inputs
+        self.stats = {"hits": 0, "misses": 0, "uncacheable": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+    def key_for(self, do_file: str, stata_version: str, cwd: Optional[str] = None) -> Optional[tuple[str, list[str]]]:
+        """(cache key, output files) for a do-file run from `cwd` (its own directory by default), or None if it cannot be cached"""
+        do_file = os.path.abspath(do_file)
+        cwd = os.path.abspath(cwd or os.path.dirname(do_file))
+        try:
+            inputs, outputs = scan_do_file(do_file, cwd)
+        except (Uncacheable, OSError):
+            with self._lock:
+                self.stats["uncacheable"] += 1
+            return None
+        digest = hashlib.sha256()
+        digest.update(json.dumps([CACHE_VERSION, stata_version, do_file, cwd, sorted(outputs)]).encode("utf-8"))
+        digest.update(json.dumps(file_signature(do_file, hash_contents=True)[3:]).encode("utf-8"))
+        for path in sorted(inputs):
+            if path.endswith(".do"):
+                # Nested do-files are small and often regenerated, so key them by content
+                signature = file_signature(path, hash_contents=True)
+                signature = [path, signature[3] if len(signature) > 3 else None]
+            else:
+                signature = file_signature(path, self.hash_inputs)
+            digest.update(json.dumps(signature).encode("utf-8"))
+        return digest.hexdigest(), outputs
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str, outputs: Optional[list[str]] = None) -> Optional[dict]:
+        """The entry for `key`, or None; with `outputs`, an entry that wrote other files is a miss"""
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        if entry is not None and any(file_signature(path) != signature for path, signature in entry["outputs"]):
+            entry = None  # an output was deleted or changed since the run
+        if entry is not None and outputs is not None and sorted(path for path, _ in entry["outputs"]) != sorted(outputs):
+            entry = None  # written by a run elsewhere; serving it would leave this run's outputs unwritten
+        with self._lock:
+            self.stats["hits" if entry is not None else "misses"] += 1
+        count("cache_hits" if entry is not None else "cache_misses")
+        if entry is not None:
+            os.utime(entry_path)  # mtime doubles as the LRU timestamp
+        return entry
+
+    def put(self, key: str, log: str, outputs: list[str]) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = {
+            "version": CACHE_VERSION,
+            "created": time.time(),
+            "log": log,
+            "outputs": [[path, file_signature(path)] for path in outputs],
+        }
+        target = self._entry_path(key)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, target)
+        with self._lock:
+            self.stats["stores"] += 1
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for item in it:
+                if item.name.endswith(".json"):
+                    st = item.stat()
+                    entries.append((st.st_mtime, st.st_size, item.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            with self._lock:
+                self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.cache_dir, name))
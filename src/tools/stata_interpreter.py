@@ -1,46 +1,328 @@
 import subprocess
 from langchain_core.tools import tool
-from schema import Stata_interpreter_schema
+from schema import Stata_interpreter_schema,Stata_batch_schema,Stata_batch_job_result,Stata_batch_result
+from tools.stata_pool import Stata_pool,read_log
+from tools.stata_cache import Stata_result_cache,localize_do_file
+from tools.instrumentation import instrumented,count
+from tools.stata_log import Log_chunk,Log_chunker,tail_file,parse_log,render_summary
+from core.config import get_settings
+from typing import AsyncIterator
 import os
 import asyncio
+import hashlib
+import itertools
+import json
+import re
+import time
 
-stata_path = r"C:\Program Files\Stata17\StataMP-64.exe"
-do_file = r"D:\projects\test\test_script.do"
+settings = get_settings()
+stata_path = settings.stata_path
+do_file = settings.do_file
 
-@tool("stata_interpreter_tool", args_schema=Stata_interpreter_schema)
-async def stata_interpreter(file_path: str) -> str:
-    """Execute stata code and return the output"""
+# Long-lived pystata sessions; set stata_pool_size to 0 to launch StataMP in batch mode per call
+stata_pool_size = settings.stata_pool_size
+stata_backend = settings.stata_backend
+stata_edition = settings.stata_edition
+# Cores covered by the StataMP license, shared between the processes of a batch
+stata_licensed_cores = settings.stata_licensed_cores
+batch_log_tail_lines = 20
+# Log lines returned in compact mode when the log has no table to summarize
+compact_fallback_lines = 40
+
+_ERROR_LINE = re.compile(r"^r\(\d+\);", re.MULTILINE)
+
+_stata_pool: Stata_pool | None = None
+
+# Logs of completed runs keyed by the do-file, the files it reads and the Stata build
+stata_cache_enabled = settings.stata_cache_enabled
+stata_result_cache = Stata_result_cache()
+
+def get_stata_pool() -> Stata_pool:
+    global _stata_pool
+    if _stata_pool is None:
+        _stata_pool = Stata_pool(
+            size=stata_pool_size,
+            backend=stata_backend,
+            stata_dir=os.path.dirname(stata_path),
+            edition=stata_edition,
+        )
+    return _stata_pool
+
+def stata_version() -> str:
+    """Identifies the Stata build so a Stata update invalidates cached runs"""
+    try:
+        st = os.stat(stata_path)
+        return f"{stata_path}:{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        return stata_path
+
+def write_log(log_path: str, log_content: str) -> None:
+    with open(log_path, "w", encoding="utf-8") as file:
+        file.write(log_content)
+
+def log_path_for(file_path: str) -> str:
+    """Stata writes <do-file name>.log next to the do-file"""
     working_dir = os.path.dirname(file_path)
     log_file = os.path.splitext(os.path.basename(file_path))[0] + ".log"
-    log_path = os.path.join(working_dir, log_file)
+    return os.path.join(working_dir, log_file)
 
+async def start_stata_batch(file_path: str, working_dir: str | None = None) -> asyncio.subprocess.Process:
+    """Launch a do-file in a fresh StataMP batch process"""
+    working_dir = working_dir or os.path.dirname(file_path)
     # Use asyncio.create_subprocess_exec for async execution
-    process = await asyncio.create_subprocess_exec(
+    return await asyncio.create_subprocess_exec(
         stata_path,
         "/e",
         "/b",
         "do",
         file_path,
         cwd=working_dir,
-        creationflags=subprocess.CREATE_NO_WINDOW,  # Mantén esto si no quieres ventana
-        stdout=subprocess.PIPE,  # Captura la salida estándar
-        stderr=subprocess.PIPE,  # Captura errores estándar
+        creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),  # Mantén esto si no quieres ventana
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
     )
 
-    # Wait for the process to complete
-    stdout, stderr = await process.communicate()
+async def stream_stata(
+    file_path: str,
+    timeout: float | None = None,
+    idle_timeout: float | None = None,
+    stop_on_error: bool = False,
+    poll_interval: float = 0.2,
+) -> AsyncIterator[Log_chunk]:
+    """Run a do-file and yield parsed log chunks while Stata writes them.
+
+    The run is killed when it exceeds `timeout` seconds, when the log does not grow
+    for `idle_timeout` seconds, or at the first r(###) error if `stop_on_error` is
+    set. The last chunk always has kind 'end' and says how the run finished.
+    """
+    log_path = log_path_for(file_path)
+    try:
+        os.remove(log_path)  # never tail the log of a previous run
+    except FileNotFoundError:
+        pass
 
-    # Check for errors
-    if process.returncode != 0:
-        error_message = f"Stata execution failed with return code {process.returncode}.  Stderr: {stderr.decode(errors='ignore')}"
-        print(error_message) #Important, the program will crash without this
-        # Consider logging the error or raising an exception
-        return error_message  # Or raise an exception
+    if stata_pool_size > 0:
+        pool = get_stata_pool()
+        runner = asyncio.create_task(pool.submit(file_path, log_path=log_path))
+        def stop_run():
+            if not pool.cancel_running(log_path):
+                runner.cancel()
+    else:
+        process = await start_stata_batch(file_path)
+        runner = asyncio.create_task(process.wait())
+        def stop_run():
+            if process.returncode is None:
+                process.kill()
 
+    finished = asyncio.Event()
+    runner.add_done_callback(lambda _: finished.set())
+    chunker = Log_chunker()
+    loop = asyncio.get_running_loop()
+    started = last_output = loop.time()
+    reason = None
     try:
-        with open(log_path, "r", encoding="utf-8", errors="ignore") as file:
-            log_content = file.read()
-    except Exception as e:
-        log_content = f"Error reading log file: {e}"
+        async for text in tail_file(log_path, finished, poll_interval):
+            now = loop.time()
+            if text:
+                last_output = now
+            for chunk in chunker.feed(text):
+                yield chunk
+                if stop_on_error and chunk.kind == 'error' and reason is None:
+                    reason = f"stopped at error r({chunk.code})"
+            if reason is None and timeout is not None and now - started > timeout:
+                reason = f"timed out after {timeout:g}s"
+            if reason is None and idle_timeout is not None and now - last_output > idle_timeout:
+                reason = f"no log output for {idle_timeout:g}s"
+            if reason is not None and not finished.is_set():
+                stop_run()
+        for chunk in chunker.close():
+            yield chunk
+    finally:
+        if not finished.is_set():
+            stop_run()
+
+    if reason is None and not runner.cancelled():
+        outcome = runner.result()
+        if stata_pool_size > 0 and not outcome.ok:
+            reason = f"failed: {outcome.error}"
+        elif stata_pool_size <= 0 and outcome != 0:
+            reason = f"failed with return code {outcome}"
+    yield Log_chunk('end', reason or 'completed', 0)
+
+async def run_do_file(
+    file_path: str,
+    timeout: float | None = None,
+    idle_timeout: float | None = None,
+    stop_on_error: bool = False,
+    use_cache: bool = True
+) -> tuple[str, str]:
+    """Run a do-file through the result cache and the streaming runner; returns (status, log)"""
+    cache_key = None
+    if use_cache and stata_cache_enabled:
+        cache_key = await asyncio.to_thread(stata_result_cache.key_for, file_path, stata_version())
+        if cache_key is not None:
+            entry = await asyncio.to_thread(stata_result_cache.get, *cache_key)
+            if entry is not None:
+                # Leave the log on disk as a real run would
+                await asyncio.to_thread(write_log, log_path_for(file_path), entry["log"])
+                return 'completed', entry["log"]
+
+    status = 'completed'
+    started = time.perf_counter()
+    async for chunk in stream_stata(file_path, timeout, idle_timeout, stop_on_error):
+        if chunk.kind == 'end':
+            status = chunk.text
+    count("stata_seconds", time.perf_counter() - started)
+    log_content = await asyncio.to_thread(read_log, log_path_for(file_path))
+    if status == 'completed' and cache_key is not None:
+        await asyncio.to_thread(stata_result_cache.put, cache_key[0], log_content, cache_key[1])
+    return status, log_content
 
-    return log_content
\ No newline at end of file
+def summarize_log(log_content: str, log_path: str) -> str:
+    """Compact rendering of a log; falls back to its last lines when no table was recognised"""
+    summary = parse_log(log_content)
+    if summary.estimations or summary.summaries or summary.tabulations:
+        return render_summary(summary)
+    tail = "\n".join(log_content.rstrip().splitlines()[-compact_fallback_lines:])
+    rendered = render_summary(summary)
+    return f"{tail}\n{rendered}\nFull log: {log_path}"
+
+@instrumented
+@tool("stata_interpreter_tool", args_schema=Stata_interpreter_schema)
+async def stata_interpreter(
+    file_path: str,
+    timeout: float | None = 1800,
+    idle_timeout: float | None = None,
+    stop_on_error: bool = False,
+    use_cache: bool = True,
+    output_format: str = 'compact'
+) -> str | dict:
+    """Execute stata code and return the estimation tables, summaries and errors of the log"""
+    status, log_content = await run_do_file(file_path, timeout, idle_timeout, stop_on_error, use_cache)
+    if output_format == 'json':
+        result = (await asyncio.to_thread(parse_log, log_content)).model_dump()
+        result["status"] = status
+        return result
+    if output_format == 'compact':
+        log_content = await asyncio.to_thread(summarize_log, log_content, log_path_for(file_path))
+    if status != 'completed':
+        return f"{log_content}\nStata run {status}"
+    return log_content
+
+def render_template(template_text: str, params: dict[str, str]) -> str:
+    """Substitute {{name}} placeholders; other braces are Stata syntax and stay as they are"""
+    return re.sub(
+        r"\{\{\s*(\w+)\s*\}\}",
+        lambda m: str(params[m.group(1)]) if m.group(1) in params else m.group(0),
+        template_text,
+    )
+
+def write_if_changed(path: str, content: str) -> None:
+    """Keep the mtime of generated do-files stable when their content is unchanged"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return
+    except FileNotFoundError:
+        pass
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+def prepare_batch_jobs(
+    do_files: list[str] | None,
+    template: str | None,
+    param_grid: dict[str, list[str]] | None,
+    processors: int
+) -> list[dict]:
+    """Write one wrapper do-file per job into its own directory, which is also the job's working directory.
+
+    The do-file (or rendered template) is copied into the job directory with
+    the paths it reads made absolute against its own directory, so every job
+    reads the same data while relative outputs such as `save out` and `log
+    using` land in the job directory instead of overwriting each other. The
+    wrapper limits Stata to its share of the licensed cores, changes to the job
+    directory and runs the copy; Stata writes the job's log next to the wrapper.
+    """
+    if template:
+        with open(template, "r", encoding="utf-8", errors="ignore") as f:
+            template_text = f.read()
+        names = list(param_grid or {})
+        combinations = [dict(zip(names, values)) for values in itertools.product(*(param_grid or {}).values())]
+        sources = [(template, combination) for combination in combinations]
+    else:
+        sources = [(path, {}) for path in do_files or []]
+    if not sources:
+        raise ValueError("Provide do_files, or a template with a non-empty param_grid")
+
+    base_dir = os.path.dirname(os.path.abspath(sources[0][0]))
+    jobs = []
+    for number, (source, params) in enumerate(sources):
+        source = os.path.abspath(source)
+        # Job directories are named after their content so a rerun reuses them and can hit the result cache
+        job_id = hashlib.sha1(json.dumps([source, params, processors], sort_keys=True).encode("utf-8")).hexdigest()[:12]
+        job_dir = os.path.join(base_dir, ".stata_batch", f"job_{job_id}")
+        os.makedirs(job_dir, exist_ok=True)
+        if template:
+            source_text = render_template(template_text, params)
+        else:
+            with open(source, "r", encoding="utf-8", errors="ignore") as f:
+                source_text = f.read()
+        target = os.path.join(job_dir, "spec.do")
+        write_if_changed(target, localize_do_file(source_text, os.path.dirname(source), job_dir)[0])
+        wrapper = os.path.join(job_dir, f"job_{job_id}.do")
+        write_if_changed(
+            wrapper,
+            f"capture set processors {processors}\n"
+            f'cd "{job_dir}"\n'
+            f'do "{target}"\n'
+        )
+        jobs.append({
+            "job": number, "do_file": source, "params": {k: str(v) for k, v in params.items()},
+            "wrapper": wrapper, "work_dir": job_dir,
+        })
+    return jobs
+
+@instrumented
+@tool("stata_batch_tool", args_schema=Stata_batch_schema)
+async def stata_batch(
+    do_files: list[str] | None = None,
+    template: str | None = None,
+    param_grid: dict[str, list[str]] | None = None,
+    max_workers: int | None = None,
+    timeout: float | None = 1800,
+    use_cache: bool = True
+) -> dict:
+    """Run several independent .do files, or a template over a parameter grid, in parallel and summarize their logs"""
+    workers = max(1, min(max_workers or stata_licensed_cores, stata_licensed_cores))
+    if stata_pool_size > 0:
+        workers = min(workers, stata_pool_size)
+    processors = max(1, stata_licensed_cores // workers)
+    jobs = await asyncio.to_thread(prepare_batch_jobs, do_files, template, param_grid, processors)
+    semaphore = asyncio.Semaphore(workers)
+    started = time.perf_counter()
+
+    async def _run_job(job: dict) -> Stata_batch_job_result:
+        async with semaphore:
+            job_started = time.perf_counter()
+            status, log_content = await run_do_file(job["wrapper"], timeout, use_cache=use_cache)
+            return Stata_batch_job_result(
+                job=job["job"],
+                do_file=job["do_file"],
+                params=job["params"],
+                log_path=log_path_for(job["wrapper"]),
+                work_dir=job["work_dir"],
+                ok=status == 'completed' and not _ERROR_LINE.search(log_content),
+                status=status,
+                elapsed=time.perf_counter() - job_started,
+                log_tail="\n".join(log_content.rstrip().splitlines()[-batch_log_tail_lines:]),
+                summary=render_summary(parse_log(log_content)),
+            )
+
+    results = await asyncio.gather(*(_run_job(job) for job in jobs))
+    summary = Stata_batch_result(
+        jobs=sorted(results, key=lambda r: r.job),
+        succeeded=sum(r.ok for r in results),
+        failed=sum(not r.ok for r in results),
+        elapsed=time.perf_counter() - started,
+    )
+    return summary.model_dump()
@@ -0,0 +1,339 @@
+import asyncio
+import codecs
+import os
+import re
+from typing import AsyncIterator, Iterator, NamedTuple, Optional
+
+from schema import (
+    Stata_coefficient,
+    Stata_error,
+    Stata_estimation,
+    Stata_log_summary,
+    Stata_summary_row,
+    Stata_summary_table,
+    Stata_tabulation,
+    Stata_tabulation_row,
+)
+
+_ERROR_LINE = re.compile(r"^r\((\d+)\);\s*$")
+_COMMAND_PREFIX = re.compile(r"^(\d+\.|\.) ")
+
+
+class Log_chunk(NamedTuple):
+    kind: str  # 'command', 'output', 'error' or 'end'
+    text: str
+    line: int  # 1-based line of the log where the chunk starts
+    code: Optional[int] = None  # Stata return code for 'error' chunks
+
+
+class Log_chunker:
+    """Splits a Stata log into command, output and error chunks as text arrives.
+
+    Commands are lines echoed as '. cmd' (or 'N. ' inside loops and programs)
+    together with their '> ' continuation lines; everything up to the next command
+    is output, and an 'r(###);' line turns the output before it into an error.
+    Feed it arbitrary pieces of text; only complete lines are consumed.
+    """
+
+    def __init__(self):
+        self._partial = ""
+        self._line = 0
+        self._kind: Optional[str] = None
+        self._lines: list[str] = []
+        self._start = 1
+
+    def _flush(self) -> Iterator[Log_chunk]:
+        if self._kind is not None:
+            text = "\n".join(self._lines).strip("\n")
+            if self._kind == "command" or text.strip():
+                yield Log_chunk(self._kind, text, self._start)
+        self._kind = None
+        self._lines = []
+
+    def _begin(self, kind: str, line: str) -> None:
+        self._kind = kind
+        self._lines = [line]
+        self._start = self._line
+
+    def feed(self, text: str) -> Iterator[Log_chunk]:
+        data = self._partial + text
+        lines = data.split("\n")
+        self._partial = lines.pop()
+        for raw in lines:
+            line = raw.rstrip("\r")
+            self._line += 1
+            if self._kind == "command" and line.startswith("> "):
+                self._lines.append(line)
+                continue
+            if _COMMAND_PREFIX.match(line):
+                yield from self._flush()
+                self._begin("command", line)
+                continue
+            error = _ERROR_LINE.match(line)
+            if error:
+                if self._kind == "command":
+                    yield from self._flush()  # the command failed without printing anything
+                message = "\n".join(self._lines).strip() if self._kind == "output" else ""
+                start = self._start if self._kind == "output" else self._line
+                self._kind, self._lines = None, []
+                yield Log_chunk("error", f"{message}\n{line}".strip(), start, int(error.group(1)))
+                continue
+            if self._kind != "output":
+                yield from self._flush()
+                self._begin("output", line)
+            else:
+                self._lines.append(line)
+
+    def close(self) -> Iterator[Log_chunk]:
+        """Flush whatever is buffered, including an unterminated last line"""
+        if self._partial:
+            partial, self._partial = self._partial, ""
+            yield from self.feed(partial + "\n")
+        yield from self._flush()
+
+
+def iter_log_chunks(text: str) -> Iterator[Log_chunk]:
+    chunker = Log_chunker()
+    yield from chunker.feed(text)
+    yield from chunker.close()
+
+
+async def tail_file(path: str, stop: asyncio.Event, poll_interval: float = 0.2) -> AsyncIterator[str]:
+    """Yield the text appended to `path` once per poll until `stop` is set.
+
+    An empty string is yielded when nothing was appended, so the consumer wakes up
+    regularly to check its timeouts. The file may not exist yet when tailing
+    starts; if it shrinks it was replaced and is read again from the start.
+    """
+    position = 0
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    while True:
+        stopping = stop.is_set()
+        text = ""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        if size is not None:
+            if size < position:
+                position = 0
+                decoder.reset()
+            if size > position:
+                with open(path, "rb") as f:
+                    f.seek(position)
+                    data = f.read(size - position)
+                position += len(data)
+                text = decoder.decode(data, final=stopping)
+        yield text
+        if stopping:
+            return
+        try:
+            await asyncio.wait_for(stop.wait(), poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+_NUMBER = r"[-+]?(?:\d[\d,]*\.?\d*|\.\d+)(?:e[-+]?\d+)?"
+_NUMBER_TOKEN = re.compile(rf"^(?:{_NUMBER}|\.)$", re.IGNORECASE)
+_HEADER_STAT = re.compile(rf"([A-Za-z](?:[\w()>,.\-/]| (?! ))*)\s*=\s*({_NUMBER})", re.IGNORECASE)
+_SEPARATOR = re.compile(r"^\s*-+(\+-*)*\s*$")
+
+
+def _to_float(token: str) -> Optional[float]:
+    if token == ".":
+        return None  # Stata's missing value
+    try:
+        return float(token.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _split_row(line: str) -> tuple[str, list[str]]:
+    """Label left of the first '|' and the tokens right of it, ignoring further bars"""
+    label, _, rest = line.partition("|")
+    return label.strip(), [t for t in rest.replace("|", " ").split()]
+
+
+def _numeric(tokens: list[str]) -> Optional[list[Optional[float]]]:
+    if not tokens or not all(_NUMBER_TOKEN.match(t) for t in tokens):
+        return None
+    return [_to_float(t) for t in tokens]
+
+
+def _command_text(chunk_text: str) -> str:
+    lines = chunk_text.split("\n")
+    first = _COMMAND_PREFIX.sub("", lines[0], count=1)
+    return " ".join([first] + [line[2:] for line in lines[1:]]).strip()
+
+
+class Stata_log_parser:
+    """Incrementally extracts estimation, summarize and tabulate tables and errors.
+
+    Text is fed through a Log_chunker and every output chunk is classified by its
+    table header, so estimation tables are found under any estimation command or
+    prefix (quietly, bootstrap:, xi:, ...). Only typed results are kept, never the
+    log itself, so memory stays flat on very large logs.
+    """
+
+    def __init__(self):
+        self.chunker = Log_chunker()
+        self.summary = Stata_log_summary()
+        self._command = ""
+
+    def feed(self, text: str) -> None:
+        for chunk in self.chunker.feed(text):
+            self.add(chunk)
+
+    def close(self) -> Stata_log_summary:
+        for chunk in self.chunker.close():
+            self.add(chunk)
+        self.summary.lines = self.chunker._line
+        return self.summary
+
+    def add(self, chunk: Log_chunk) -> None:
+        if chunk.kind == "command":
+            self._command = _command_text(chunk.text)
+            self.summary.commands += 1
+        elif chunk.kind == "error":
+            message = chunk.text.rsplit("\n", 1)[0] if "\n" in chunk.text else ""
+            self.summary.errors.append(
+                Stata_error(command=self._command or None, code=chunk.code, message=message.strip(), line=chunk.line)
+            )
+        elif chunk.kind == "output" and "|" in chunk.text:
+            self._parse_output(chunk.text.split("\n"))
+
+    def _parse_output(self, lines: list[str]) -> None:
+        for number, line in enumerate(lines):
+            if "|" not in line:
+                continue
+            right = line.partition("|")[2].lower()
+            if ("coef" in right or "odds ratio" in right or "irr" in right) and "std. err" in right:
+                self._parse_estimation(lines, number)
+                return
+            if "obs" in right and "mean" in right and line.partition("|")[0].strip().lower() == "variable":
+                self._parse_summary(lines, number)
+                return
+            # One-way tables have a Freq. column; two-way tables only a header over a rule
+            below = lines[number + 1] if number + 1 < len(lines) else ""
+            if "freq." in right or (self._command.startswith("tab") and _SEPARATOR.match(below)):
+                self._parse_tabulation(lines, number)
+                return
+
+    def _parse_estimation(self, lines: list[str], header: int) -> None:
+        estimation = Stata_estimation(command=self._command, depvar=lines[header].partition("|")[0].strip() or None)
+        for line in lines[:header]:
+            for key, value in _HEADER_STAT.findall(line.partition("|")[2] if "|" in line else line):
+                key = " ".join(key.split())
+                number = _to_float(value)
+                if number is None:
+                    continue
+                if key == "Number of obs":
+                    estimation.n = int(number)
+                elif key in ("R-squared", "Pseudo R2"):
+                    estimation.r2 = number
+                else:
+                    estimation.stats[key] = number
+        group = ""
+        started = False
+        for line in lines[header + 1:]:
+            if _SEPARATOR.match(line):
+                if started and "+" not in line:
+                    break  # closing rule of the table
+                group = ""
+                continue
+            if "|" not in line:
+                if started:
+                    break
+                continue
+            started = True
+            name, tokens = _split_row(line)
+            values = _numeric(tokens)
+            if values is None:
+                # Factor-variable or equation label; an empty label ends the group
+                group = name if not tokens or tokens[0].startswith("(") else group
+                continue
+            values += [None] * (6 - len(values))
+            estimation.coefficients.append(Stata_coefficient(
+                name=f"{group}: {name}" if group else name,
+                coef=values[0] if values[0] is not None else float("nan"),
+                std_err=values[1], stat=values[2], p_value=values[3], ci_low=values[4], ci_high=values[5],
+            ))
+        self.summary.estimations.append(estimation)
+
+    def _parse_summary(self, lines: list[str], header: int) -> None:
+        table = Stata_summary_table(command=self._command)
+        for line in lines[header + 1:]:
+            if _SEPARATOR.match(line) or "|" not in line:
+                continue
+            name, tokens = _split_row(line)
+            values = _numeric(tokens)
+            if values is None:
+                continue
+            values += [None] * (5 - len(values))
+            table.rows.append(Stata_summary_row(
+                variable=name, obs=values[0], mean=values[1], std_dev=values[2], min=values[3], max=values[4],
+            ))
+        self.summary.summaries.append(table)
+
+    def _parse_tabulation(self, lines: list[str], header: int) -> None:
+        table = Stata_tabulation(command=self._command, columns=_split_row(lines[header])[1])
+        for line in lines[header + 1:]:
+            if _SEPARATOR.match(line) or "|" not in line:
+                continue
+            label, tokens = _split_row(line)
+            values = _numeric(tokens)
+            if values is None:
+                continue
+            table.rows.append(Stata_tabulation_row(label=label, values=values))
+        self.summary.tabulations.append(table)
+
+
+def parse_log(text: str) -> Stata_log_summary:
+    """Stata_log_summary of a complete log"""
+    parser = Stata_log_parser()
+    parser.feed(text)
+    return parser.close()
+
+
+def parse_log_file(path: str, block_size: int = 1024 * 1024) -> Stata_log_summary:
+    """Stata_log_summary of a log file, read in blocks so large logs are never loaded whole"""
+    parser = Stata_log_parser()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            parser.feed(decoder.decode(block))
+    parser.feed(decoder.decode(b"", final=True))
+    return parser.close()
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "." if value is None else f"{value:.4g}"
+
+
+def render_summary(summary: Stata_log_summary, max_coefficients: int = 40) -> str:
+    """Compact text rendering of a Stata_log_summary for the model"""
+    out: list[str] = []
+    for estimation in summary.estimations:
+        header = [f"N={estimation.n}"] if estimation.n is not None else []
+        if estimation.r2 is not None:
+            header.append(f"R2={_fmt(estimation.r2)}")
+        header += [f"{key}={_fmt(value)}" for key, value in estimation.stats.items()]
+        out.append(f"[{estimation.command}] " + ", ".join(header))
+        out.append("  term: coef (se) p")
+        for coefficient in estimation.coefficients[:max_coefficients]:
+            out.append(f"  {coefficient.name}: {_fmt(coefficient.coef)} ({_fmt(coefficient.std_err)}) {_fmt(coefficient.p_value)}")
+        if len(estimation.coefficients) > max_coefficients:
+            out.append(f"  ... {len(estimation.coefficients) - max_coefficients} more terms")
+    for table in summary.summaries:
+        out.append(f"[{table.command}] variable: obs mean sd min max")
+        for row in table.rows:
+            out.append(f"  {row.variable}: {_fmt(row.obs)} {_fmt(row.mean)} {_fmt(row.std_dev)} {_fmt(row.min)} {_fmt(row.max)}")
+    for table in summary.tabulations:
+        out.append(f"[{table.command}] " + " ".join(table.columns))
+        for row in table.rows:
+            out.append(f"  {row.label}: " + " ".join(_fmt(v) for v in row.values))
+    for error in summary.errors:
+        message = f": {error.message}" if error.message else ""
+        out.append(f"[error r({error.code}) at log line {error.line}] {error.command or ''}{message}")
+    out.append(f"({summary.commands} commands, {summary.lines} log lines)")
+    return "\n".join(out)
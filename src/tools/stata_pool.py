@@ -0,0 +1,389 @@
+import asyncio
+import itertools
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import deque
+from typing import Optional
+
+from schema import Stata_run_result
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stata_worker.py")
+
+CACHE_FRAME = "__era_cache"
+
+# `clear all` would drop the cached frame; this keeps everything else it clears
+_CLEAR_ALL_WITHOUT_FRAMES = "\n".join([
+    "capture frame change default",
+    "clear",
+    "label drop _all",
+    "matrix drop _all",
+    "scalar drop _all",
+    "estimates clear",
+    "program drop _all",
+    "mata: mata clear",
+    "capture file close _all",
+])
+# Falls back to loading the file should the cached frame be gone after all
+_RESTORE_CACHED_DATASET = "\n".join([
+    f"capture confirm frame {CACHE_FRAME}",
+    "if _rc {{",
+    '    use "{path}", clear',
+    f"    frame copy default {CACHE_FRAME}, replace",
+    "}}",
+    "else {{",
+    f"    frame change {CACHE_FRAME}",
+    "    frame drop default",
+    f"    frame copy {CACHE_FRAME} default",
+    "    frame change default",
+    "}}",
+])
+
+_USE_LINE = re.compile(r'^\s*use\s+("([^"]+)"|(\S+))\s*(,\s*clear\s*)?$', re.IGNORECASE)
+_CLEAR_ALL_LINE = re.compile(r"^\s*clear\s+(all|\*)\s*$", re.IGNORECASE)
+_PREFIXES = r"^\s*(?:(?:capture|cap|quietly|qui|noisily|noi)\s+)*"
+# Anything that may drop the cached frame; dropping the default frame while restoring does not
+_DROPS_FRAMES = re.compile(
+    _PREFIXES + r"(clear\s+(all|\*|frames)|frames?\s+reset|frames?\s+drop\s+(?!default\s*$))", re.IGNORECASE | re.MULTILINE
+)
+_NESTED_DO_LINE = re.compile(_PREFIXES + r'(?:do|run|include)\s+("([^"]+)"|(\S+))', re.IGNORECASE | re.MULTILINE)
+_MAX_NESTING = 5
+
+
+def read_log(log_path: str) -> str:
+    try:
+        with open(log_path, "r", encoding="utf-8", errors="ignore") as file:
+            return file.read()
+    except Exception as e:
+        return f"Error reading log file: {e}"
+
+
+def find_dataset_load(do_text: str, cwd: str) -> Optional[tuple[int, str]]:
+    """Line number and absolute path of the first plain `use file[, clear]` of a do-file.
+
+    Only a load that comes before any other data command can be served from a cached
+    frame, so anything other than comments, `clear all`, `set` and `version` before
+    it disables reuse.
+    """
+    for number, line in enumerate(do_text.splitlines()):
+        stripped = line.split("//")[0].strip()
+        if not stripped or stripped.startswith("*"):
+            continue
+        match = _USE_LINE.match(stripped)
+        if match:
+            target = match.group(2) or match.group(3)
+            path = os.path.normpath(os.path.join(cwd, target))
+            if not os.path.splitext(path)[1]:
+                path += ".dta"
+            return number, path
+        if _CLEAR_ALL_LINE.match(stripped) or stripped.split()[0] in ("clear", "set", "version", "capture", "cap"):
+            continue
+        return None
+    return None
+
+
+def drops_frames(do_file: str, cwd: str, depth: int = 0) -> bool:
+    """Whether a do-file, or one it calls, may drop the cached frame; unreadable or macro-named calls count as yes"""
+    try:
+        with open(do_file, "r", encoding="utf-8", errors="ignore") as f:
+            do_text = f.read()
+    except OSError:
+        return True
+    if _DROPS_FRAMES.search(do_text):
+        return True
+    for match in _NESTED_DO_LINE.finditer(do_text):
+        target = match.group(2) or match.group(3)
+        if depth >= _MAX_NESTING or any(c in target for c in "$`'"):
+            return True
+        path = os.path.normpath(os.path.join(cwd, target))
+        if not os.path.splitext(path)[1]:
+            path += ".do"
+        if drops_frames(path, cwd, depth + 1):
+            return True
+    return False
+
+
+def dataset_signature(path: str) -> Optional[tuple[str, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return path, st.st_mtime_ns, st.st_size
+
+
+class Stata_session:
+    """One long-lived worker process and the dataset it has cached in memory"""
+
+    def __init__(self, worker_id: int, command: list[str]):
+        self.worker_id = worker_id
+        self.command = command
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.started_at = 0.0
+        self.last_used = 0.0
+        self.jobs_done = 0
+        self.dataset: Optional[tuple[str, int, int]] = None
+        self._ids = itertools.count(1)
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self, timeout: float) -> None:
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        self.started_at = self.last_used = time.monotonic()
+        self.jobs_done = 0
+        self.dataset = None
+        ready = await asyncio.wait_for(self.process.stdout.readline(), timeout)
+        if not ready:
+            raise RuntimeError(f"Stata worker {self.worker_id} exited during startup")
+
+    async def request(self, message: dict, timeout: Optional[float]) -> dict:
+        message = {"id": next(self._ids), **message}
+        self.process.stdin.write((json.dumps(message) + "\n").encode("utf-8"))
+        await self.process.stdin.drain()
+        while True:
+            line = await asyncio.wait_for(self.process.stdout.readline(), timeout)
+            if not line:
+                raise RuntimeError(f"Stata worker {self.worker_id} exited")
+            reply = json.loads(line)
+            if reply.get("id") == message["id"]:
+                self.last_used = time.monotonic()
+                return reply
+
+    async def ping(self, timeout: float) -> bool:
+        if not self.alive:
+            return False
+        try:
+            return (await self.request({"op": "ping"}, timeout)).get("ok", False)
+        except Exception:
+            return False
+
+    async def kill(self) -> None:
+        if self.alive:
+            self.process.kill()
+            await self.process.wait()
+        self.process = None
+        self.dataset = None
+
+    async def close(self, timeout: float = 5.0) -> None:
+        if self.alive:
+            try:
+                await self.request({"op": "exit"}, timeout)
+                await asyncio.wait_for(self.process.wait(), timeout)
+            except Exception:
+                pass
+        await self.kill()
+
+
+class Stata_pool:
+    """Pool of long-lived Stata sessions that run .do files from a shared queue.
+
+    Jobs are dispatched to idle sessions, preferring one that already holds the
+    job's dataset in memory. Sessions are pinged after being idle for
+    `health_check_interval` seconds and replaced when they fail, time out, or
+    reach `max_jobs_per_session` jobs or `max_session_age` seconds.
+    With backend='echo' the sessions run the stand-in interpreter from
+    stata_worker.py, so the pool can be exercised without Stata installed.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        backend: str = "pystata",
+        stata_dir: str = "",
+        edition: str = "mp",
+        max_jobs_per_session: int = 100,
+        max_session_age: float = 3600.0,
+        health_check_interval: float = 30.0,
+        startup_timeout: float = 120.0,
+        reuse_datasets: bool = True,
+    ):
+        self.size = size
+        self.command = [sys.executable, WORKER_SCRIPT, "--backend", backend, "--stata-dir", stata_dir, "--edition", edition]
+        self.max_jobs_per_session = max_jobs_per_session
+        self.max_session_age = max_session_age
+        self.health_check_interval = health_check_interval
+        self.startup_timeout = startup_timeout
+        self.reuse_datasets = reuse_datasets
+        self._sessions = [Stata_session(i, self.command) for i in range(size)]
+        self._idle: list[Stata_session] = []
+        self._pending: deque[tuple[dict, asyncio.Future]] = deque()
+        self._running: set[asyncio.Task] = set()
+        self._started = False
+        self._closed = False
+        self._start_lock = asyncio.Lock()
+        self._scratch_dir = tempfile.mkdtemp(prefix="era_stata_pool_")
+        self.stats = {"jobs": 0, "failures": 0, "restarts": 0, "dataset_reuses": 0}
+
+    async def start(self) -> None:
+        async with self._start_lock:
+            if self._started:
+                return
+            await asyncio.gather(*(s.start(self.startup_timeout) for s in self._sessions))
+            self._idle = list(self._sessions)
+            self._started = True
+
+    async def close(self) -> None:
+        self._closed = True
+        for _, future in self._pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Stata pool closed"))
+        self._pending.clear()
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*(s.close() for s in self._sessions), return_exceptions=True)
+
+    async def submit(
+        self,
+        do_file: str,
+        cwd: Optional[str] = None,
+        log_path: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> Stata_run_result:
+        """Queue a .do file and wait for its result; the log goes next to the do-file by default"""
+        if self._closed:
+            raise RuntimeError("Stata pool closed")
+        await self.start()
+        do_file = os.path.abspath(do_file)
+        cwd = cwd or os.path.dirname(do_file)
+        if log_path is None:
+            log_path = os.path.join(cwd, os.path.splitext(os.path.basename(do_file))[0] + ".log")
+        job = {"do_file": do_file, "cwd": cwd, "log_path": log_path, "timeout": timeout}
+        job["dataset"] = self._job_dataset(job) if self.reuse_datasets else None
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((job, future))
+        self._dispatch()
+        return await future
+
+    def cancel_running(self, log_path: str) -> bool:
+        """Stop the job writing `log_path`; its session is killed and replaced"""
+        for task in self._running:
+            if getattr(task, "log_path", None) == log_path:
+                task.cancel()
+                return True
+        return False
+
+    # -- scheduling --------------------------------------------------------
+
+    def _job_dataset(self, job: dict) -> Optional[tuple[int, tuple[str, int, int]]]:
+        try:
+            with open(job["do_file"], "r", encoding="utf-8", errors="ignore") as f:
+                do_text = f.read()
+        except OSError:
+            return None
+        found = find_dataset_load(do_text, job["cwd"])
+        if found is None:
+            return None
+        signature = dataset_signature(found[1])
+        return (found[0], signature) if signature else None
+
+    def _pick_session(self, job: dict) -> Stata_session:
+        if job["dataset"] is not None:
+            for session in self._idle:
+                if session.dataset == job["dataset"][1]:
+                    return session
+        # Otherwise the least recently used session, leaving warm ones for their datasets
+        return min(self._idle, key=lambda s: (s.dataset is not None, s.last_used))
+
+    def _dispatch(self) -> None:
+        while self._pending and self._idle:
+            job, future = self._pending.popleft()
+            if future.done():
+                continue
+            session = self._pick_session(job)
+            self._idle.remove(session)
+            task = asyncio.create_task(self._run(session, job, future))
+            task.log_path = job["log_path"]
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _ensure_healthy(self, session: Stata_session) -> None:
+        now = time.monotonic()
+        recycle = (
+            not session.alive
+            or session.jobs_done >= self.max_jobs_per_session
+            or now - session.started_at >= self.max_session_age
+        )
+        if not recycle and now - session.last_used >= self.health_check_interval:
+            recycle = not await session.ping(timeout=10.0)
+        if recycle:
+            await session.close()
+            await session.start(self.startup_timeout)
+            self.stats["restarts"] += 1
+
+    def _prepare_do_file(self, session: Stata_session, job: dict) -> str:
+        """Rewrite the do-file so a dataset already held by the session is not reloaded"""
+        if job["dataset"] is None:
+            return job["do_file"]
+        line_number, signature = job["dataset"]
+        with open(job["do_file"], "r", encoding="utf-8", errors="ignore") as f:
+            lines = f.read().splitlines()
+        reuse = session.dataset == signature
+        for number in range(line_number):
+            if _CLEAR_ALL_LINE.match(lines[number].split("//")[0]):
+                lines[number] = _CLEAR_ALL_WITHOUT_FRAMES
+        if reuse:
+            lines[line_number] = _RESTORE_CACHED_DATASET.format(path=signature[0])
+            self.stats["dataset_reuses"] += 1
+        else:
+            lines[line_number] += f"\nframe copy default {CACHE_FRAME}, replace"
+        rewritten = os.path.join(self._scratch_dir, f"worker{session.worker_id}_{os.path.basename(job['do_file'])}")
+        with open(rewritten, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return rewritten
+
+    async def _run(self, session: Stata_session, job: dict, future: asyncio.Future) -> None:
+        started = time.perf_counter()
+        try:
+            await self._ensure_healthy(session)
+            do_file = self._prepare_do_file(session, job)
+            reply = await session.request(
+                {"op": "run", "do_file": do_file, "cwd": job["cwd"], "log_path": job["log_path"]},
+                job["timeout"],
+            )
+            session.jobs_done += 1
+            # The rewritten file, since `clear all` before the load has been made to keep the frames
+            if job["dataset"] is None or await asyncio.to_thread(drops_frames, do_file, job["cwd"]):
+                session.dataset = None
+            else:
+                session.dataset = job["dataset"][1]
+            result = Stata_run_result(
+                do_file=job["do_file"],
+                log_path=job["log_path"],
+                log=await asyncio.to_thread(read_log, job["log_path"]),
+                ok=reply.get("ok", False),
+                error=reply.get("error"),
+                elapsed=time.perf_counter() - started,
+                worker=session.worker_id,
+            )
+            if not result.ok:
+                self.stats["failures"] += 1
+        except BaseException as e:
+            # A timed out, cancelled or broken session is in an unknown state
+            await session.kill()
+            self.stats["failures"] += 1
+            message = "timed out" if isinstance(e, asyncio.TimeoutError) else (
+                "cancelled" if isinstance(e, asyncio.CancelledError) else str(e))
+            result = Stata_run_result(
+                do_file=job["do_file"],
+                log_path=job["log_path"],
+                log=await asyncio.to_thread(read_log, job["log_path"]),
+                ok=False,
+                error=f"Stata job {message}",
+                elapsed=time.perf_counter() - started,
+                worker=session.worker_id,
+            )
+        finally:
+            self.stats["jobs"] += 1
+            if not self._closed:
+                self._idle.append(session)
+                self._dispatch()
+        if not future.done():
+            future.set_result(result)
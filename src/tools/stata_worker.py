@@ -0,0 +1,143 @@
+"""Long-lived Stata worker process driven by Stata_pool.
+
+The pool talks to this script over stdin/stdout with one JSON object per line:
+
+    {"id": 1, "op": "run", "do_file": "...", "cwd": "...", "log_path": "..."}
+    {"id": 2, "op": "ping"}
+    {"id": 3, "op": "exit"}
+
+and gets back {"id": ..., "ok": bool, "error": str | null, "elapsed": float}.
+The 'pystata' backend keeps one Stata session alive for the life of the process;
+the 'echo' backend is a stand-in interpreter for machines without Stata. This file
+only uses the standard library so it can be started with any interpreter.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+
+class Pystata_backend:
+    def __init__(self, stata_dir: str, edition: str):
+        import stata_setup
+
+        stata_setup.config(stata_dir, edition, splash=False)
+        from pystata import stata
+
+        self.stata = stata
+
+    def run(self, do_file: str, cwd: str, log_path: str) -> str | None:
+        stata = self.stata
+        stata.run(f'cd "{cwd}"', quietly=True)
+        stata.run("capture log close _era", quietly=True)
+        stata.run(f'log using "{log_path}", text replace name(_era)', quietly=True)
+        try:
+            stata.run(f'do "{do_file}"', echo=True)
+            return None
+        except SystemError as e:
+            return str(e).strip() or "Stata returned an error"
+        finally:
+            stata.run("capture log close _era", quietly=True)
+
+
+class Echo_backend:
+    """Stand-in interpreter that writes a Stata-style log of the do-file.
+
+    Each command is echoed as '. command'. `display` prints its argument, `cd`
+    and `do`/`run` behave as in Stata, `use` fails with r(601) for missing files,
+    `sleep` waits the given milliseconds and `error #` stops the run with r(#),
+    which is enough to exercise the pool, streaming and parsing code without Stata.
+    """
+
+    def run(self, do_file: str, cwd: str, log_path: str) -> str | None:
+        with open(log_path, "w", encoding="utf-8") as log:
+            log.write(f"      name:  <unnamed>\n       log:  {log_path}\n  log type:  text\n\n")
+            log.flush()
+            error = self._run_file(do_file, {"cwd": cwd}, log)
+            log.write("\n")
+        return error
+
+    def _run_file(self, do_file: str, state: dict, log) -> str | None:
+        with open(do_file, "r", encoding="utf-8", errors="ignore") as f:
+            lines = f.read().splitlines()
+        for line in lines:
+            command = line.split("//")[0].strip()
+            if not command or command.startswith("*"):
+                continue
+            log.write(f". {command}\n")
+            error = self._execute(command, state, log)
+            log.flush()
+            if error is not None:
+                return error
+        return None
+
+    def _execute(self, command: str, state: dict, log) -> str | None:
+        word, _, rest = command.partition(" ")
+        target = re.sub(r",.*$", "", rest).strip().strip('"')
+        if word in ("display", "di"):
+            log.write(rest.strip().strip('"') + "\n")
+        elif word == "cd":
+            state["cwd"] = os.path.join(state["cwd"], target)
+            log.write(state["cwd"] + "\n")
+        elif word in ("do", "run"):
+            path = os.path.join(state["cwd"], target)
+            if not os.path.splitext(path)[1]:
+                path += ".do"
+            if not os.path.exists(path):
+                log.write(f"file {target} not found\nr(601);\n")
+                return "r(601)"
+            return self._run_file(path, state, log)
+        elif word == "use":
+            path = os.path.join(state["cwd"], target)
+            if not os.path.exists(path) and not os.path.exists(path + ".dta"):
+                log.write(f"file {target} not found\nr(601);\n")
+                return "r(601)"
+        elif word == "sleep":
+            time.sleep(int(rest.strip() or 0) / 1000)
+        elif word == "error":
+            code = rest.strip() or "198"
+            log.write(f"r({code});\n")
+            return f"r({code})"
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stata worker for Stata_pool")
+    parser.add_argument("--backend", choices=["pystata", "echo"], default="pystata")
+    parser.add_argument("--stata-dir", default="")
+    parser.add_argument("--edition", default="mp")
+    args = parser.parse_args()
+
+    # Stata prints results to stdout; keep the real stdout for the protocol only
+    protocol = sys.stdout
+    sys.stdout = sys.stderr
+    backend = Echo_backend() if args.backend == "echo" else Pystata_backend(args.stata_dir, args.edition)
+    protocol.write(json.dumps({"id": 0, "ok": True, "ready": True}) + "\n")
+    protocol.flush()
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        message = json.loads(line)
+        reply = {"id": message.get("id"), "ok": True, "error": None}
+        started = time.perf_counter()
+        op = message.get("op")
+        if op == "run":
+            try:
+                reply["error"] = backend.run(message["do_file"], message["cwd"], message["log_path"])
+            except Exception as e:
+                reply["error"] = f"{type(e).__name__}: {e}"
+            reply["ok"] = reply["error"] is None
+        elif op == "exit":
+            protocol.write(json.dumps(reply) + "\n")
+            protocol.flush()
+            break
+        reply["elapsed"] = time.perf_counter() - started
+        protocol.write(json.dumps(reply) + "\n")
+        protocol.flush()
+
+
+if __name__ == "__main__":
+    main()
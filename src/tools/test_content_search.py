@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+import tools.filesystem_manager as fm
+from tools import content_search
+
+
+@pytest.fixture
+def project(tmp_path):
+    """The file index and validator pointed at a fresh directory, without a watcher"""
+    root = str(tmp_path)
+    fm.path_validator.__init__([root])
+    fm.file_index.__init__([root], index_dir=None)
+    content_search.no_match_cache.clear()
+    yield root
+    content_search.no_match_cache.clear()
+
+
+def test_file_edited_after_a_no_match_search_is_searched_again(project):
+    path = os.path.join(project, "clean.do")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("gen wage = 1\n")
+
+    first = content_search.search_content(project, "wage = 2")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("gen wage = 2\n")  # in place: the directory's mtime stays the same
+    second = content_search.search_content(project, "wage = 2")
+
+    assert first.matching_lines == 0
+    assert second.stats["unchanged"] == 0
+    assert second.matching_lines == 1
+    assert "2:gen wage = 2" in second.files[0].text
+
+
+def test_unchanged_file_is_skipped_by_a_repeated_search(project):
+    with open(os.path.join(project, "clean.do"), "w", encoding="utf-8") as f:
+        f.write("gen wage = 1\n")
+
+    content_search.search_content(project, "salary")
+    repeated = content_search.search_content(project, "salary")
+
+    assert repeated.stats["unchanged"] == 1
+    assert repeated.stats["searched"] == 0
+
+
+def test_size_limit_uses_the_current_size(project):
+    path = os.path.join(project, "big.log")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("wage\n")
+    content_search.search_content(project, "wage", max_file_bytes=100)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("x" * 200 + "\n")
+
+    result = content_search.search_content(project, "wage", max_file_bytes=100)
+
+    assert result.stats["too_large"] == 1
+    assert result.matching_lines == 0
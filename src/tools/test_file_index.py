@@ -0,0 +1,33 @@
+import os
+import time
+
+from tools.file_index import File_index
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def test_watched_index_still_picks_up_unreported_changes_after_max_age(tmp_path):
+    root = str(tmp_path)
+    write(os.path.join(root, "data", "a.csv"), "x")
+    index = File_index([root], index_dir=None, max_age=0.05)
+    index.watched = True
+    assert [e.name for e in index.query(root)] == ["a.csv"]
+
+    # A change on a network mount that never reaches the watcher
+    write(os.path.join(root, "data", "b.csv"), "y")
+    time.sleep(0.1)
+    assert sorted(e.name for e in index.query(root)) == ["a.csv", "b.csv"]
+    assert sorted(e.name for e in index.list_dir(os.path.join(root, "data"))) == ["a.csv", "b.csv"]
+
+
+def test_query_for_files_skips_links_to_directories(tmp_path):
+    root = str(tmp_path)
+    write(os.path.join(root, "data", "a.csv"), "x")
+    os.symlink(os.path.join(root, "data"), os.path.join(root, "data_link"))
+    os.symlink(os.path.join(root, "data", "a.csv"), os.path.join(root, "a_link.csv"))
+    index = File_index([root], index_dir=None)
+    assert sorted(e.name for e in index.query(root)) == ["a.csv", "a_link.csv"]
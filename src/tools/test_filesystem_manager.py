@@ -0,0 +1,16 @@
+import os
+
+import tools.filesystem_manager as fm
+
+
+def test_listing_shows_a_symlinked_directory_as_a_directory(tmp_path):
+    root = str(tmp_path)
+    os.makedirs(os.path.join(root, "data"))
+    with open(os.path.join(root, "notes.txt"), "w") as f:
+        f.write("x")
+    os.symlink(os.path.join(root, "data"), os.path.join(root, "data_link"))
+    os.symlink(os.path.join(root, "notes.txt"), os.path.join(root, "notes_link.txt"))
+    fm.path_validator.__init__([root])
+    fm.file_index.__init__([root], index_dir=None)
+    lines = sorted(fm.format_directory_listing(root).splitlines())
+    assert lines == ["[DIR] data", "[DIR] data_link", "[FILE] notes.txt", "[FILE] notes_link.txt"]
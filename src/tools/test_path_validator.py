@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from tools.path_validator import Path_validator
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def test_ancestor_replaced_by_symlink_outside_the_root_is_denied(tmp_path):
+    root = tmp_path / "root"
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    write(str(root / "a" / "b" / "f.txt"), "secret")
+    validator = Path_validator([str(root)])
+    requested = str(root / "a" / "b" / "f.txt")
+    assert validator.validate(requested) == os.path.realpath(requested)
+    assert validator.validate(requested) == os.path.realpath(requested)
+    assert validator.hits == 1
+
+    # The parent 'b' moves along with 'a', so its own mtime is unchanged
+    os.rename(root / "a", outside / "a")
+    os.symlink(outside / "a", root / "a")
+
+    with pytest.raises(PermissionError):
+        validator.validate(requested)
+    assert validator.validate_many([requested])[0].__class__ is PermissionError
+
+
+def test_cached_resolution_survives_unrelated_changes(tmp_path):
+    root = tmp_path / "root"
+    write(str(root / "a" / "f.txt"), "text")
+    validator = Path_validator([str(root)])
+    requested = str(root / "a" / "f.txt")
+    validator.validate(requested)
+    write(str(root / "a" / "f.txt"), "edited")
+    write(str(root / "other" / "g.txt"), "text")
+    assert validator.validate(requested) == os.path.realpath(requested)
+    assert validator.hits == 1
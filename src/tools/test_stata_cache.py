@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from tools.stata_cache import Stata_result_cache, scan_do_file
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_nested_do_file_resolves_against_the_working_directory(tmp_path):
+    project = str(tmp_path / "proj")
+    write(os.path.join(project, "main.do"), 'do "sub/x.do"\nsave out, replace\n')
+    write(os.path.join(project, "sub", "x.do"), 'use "panel.dta", clear\n')
+    write(os.path.join(project, "panel.dta"), "v1")
+
+    inputs, outputs = scan_do_file(os.path.join(project, "main.do"))
+
+    assert os.path.join(project, "panel.dta") in inputs
+    assert os.path.join(project, "sub", "panel.dta") not in inputs
+    assert outputs == [os.path.join(project, "out.dta")]
+
+
+def test_nested_cd_carries_over_to_the_caller(tmp_path):
+    project = str(tmp_path / "proj")
+    write(os.path.join(project, "main.do"), 'do setup\nuse panel\n')
+    write(os.path.join(project, "setup.do"), 'cd data\n')
+
+    inputs, _ = scan_do_file(os.path.join(project, "main.do"))
+
+    assert os.path.join(project, "data", "panel.dta") in inputs
+
+
+def test_key_changes_when_a_nested_input_changes(tmp_path):
+    project = str(tmp_path / "proj")
+    write(os.path.join(project, "main.do"), 'do "sub/x.do"\n')
+    write(os.path.join(project, "sub", "x.do"), 'use "panel.dta", clear\n')
+    data = os.path.join(project, "panel.dta")
+    write(data, "v1")
+    cache = Stata_result_cache(cache_dir=str(tmp_path / "cache"))
+
+    before = cache.key_for(os.path.join(project, "main.do"), "17")
+    write(data, "version 2")
+    os.utime(data, ns=(os.stat(data).st_atime_ns, os.stat(data).st_mtime_ns + 10**9))
+    after = cache.key_for(os.path.join(project, "main.do"), "17")
+
+    assert before is not None and after is not None
+    assert before[0] != after[0]
+
+
+def test_same_do_file_in_another_directory_is_a_different_run(tmp_path):
+    for name in ("A", "B"):
+        write(str(tmp_path / name / "run.do"), "sysuse auto\nsave out, replace\n")
+    cache = Stata_result_cache(cache_dir=str(tmp_path / "cache"))
+    key_a = cache.key_for(str(tmp_path / "A" / "run.do"), "17")
+    key_b = cache.key_for(str(tmp_path / "B" / "run.do"), "17")
+    write(str(tmp_path / "A" / "out.dta"), "x")
+    cache.put(key_a[0], "log of A", key_a[1])
+
+    assert key_a[0] != key_b[0]
+    assert cache.get(*key_a) is not None
+    assert cache.get(key_a[0], key_b[1]) is None
+
+
+@pytest.mark.parametrize("command", [
+    'file open handle using "notes.txt", write',
+    'postfile handle x using results',
+    'putdocx save report.docx',
+    'copy a.csv b.csv',
+    'erase old.dta',
+    'shell rm -f tmp.csv',
+    '!del tmp.csv',
+])
+def test_side_effect_commands_are_uncacheable(tmp_path, command):
+    do_file = str(tmp_path / "run.do")
+    write(do_file, f"sysuse auto\n{command}\n")
+    cache = Stata_result_cache(cache_dir=str(tmp_path / "cache"))
+
+    assert cache.key_for(do_file, "17") is None
+    assert cache.stats["uncacheable"] == 1
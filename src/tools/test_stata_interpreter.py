@@ -0,0 +1,85 @@
+import asyncio
+import os
+
+from tools.stata_cache import Stata_result_cache, scan_do_file
+from tools.stata_interpreter import prepare_batch_jobs
+from tools.stata_pool import Stata_pool
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def make_project(tmp_path):
+    project = str(tmp_path / "proj")
+    write(os.path.join(project, "panel.dta"), "v1")
+    write(os.path.join(project, "model.do"), (
+        'use "panel.dta", clear\n'
+        "display {{spec}}\n"
+        "save out, replace\n"
+        "log using results, replace\n"
+    ))
+    return project
+
+
+def test_batch_jobs_run_in_their_own_working_directories(tmp_path):
+    project = make_project(tmp_path)
+    jobs = prepare_batch_jobs(None, os.path.join(project, "model.do"), {"spec": ["1", "2"]}, 2)
+
+    work_dirs = [job["work_dir"] for job in jobs]
+    assert len(set(work_dirs)) == 2
+    outputs = []
+    for job in jobs:
+        assert os.path.dirname(job["wrapper"]) == job["work_dir"]
+        with open(job["wrapper"], encoding="utf-8") as f:
+            assert f'cd "{job["work_dir"]}"' in f.read()
+        inputs, written = scan_do_file(job["wrapper"])
+        assert os.path.join(project, "panel.dta") in inputs
+        assert written == [os.path.join(job["work_dir"], "out.dta")]
+        outputs += written
+    assert len(set(outputs)) == 2
+
+
+def test_batch_job_cache_key_follows_the_real_data(tmp_path):
+    project = make_project(tmp_path)
+    job = prepare_batch_jobs(None, os.path.join(project, "model.do"), {"spec": ["1"]}, 1)[0]
+    cache = Stata_result_cache(cache_dir=str(tmp_path / "cache"))
+
+    before = cache.key_for(job["wrapper"], "17")
+    data = os.path.join(project, "panel.dta")
+    write(data, "version 2")
+    os.utime(data, ns=(os.stat(data).st_atime_ns, os.stat(data).st_mtime_ns + 10**9))
+    after = cache.key_for(job["wrapper"], "17")
+
+    assert before is not None and after is not None
+    assert before[0] != after[0]
+
+
+def test_nested_do_files_keep_reading_from_the_project(tmp_path):
+    project = str(tmp_path / "proj")
+    write(os.path.join(project, "panel.dta"), "v1")
+    write(os.path.join(project, "sub", "load.do"), "use panel\n")
+    write(os.path.join(project, "main.do"), 'do "sub/load.do"\nsave out, replace\n')
+    job = prepare_batch_jobs([os.path.join(project, "main.do")], None, None, 1)[0]
+
+    inputs, written = scan_do_file(job["wrapper"])
+
+    assert os.path.join(project, "panel.dta") in inputs
+    assert written == [os.path.join(job["work_dir"], "out.dta")]
+
+
+def test_batch_jobs_find_their_data_when_run(tmp_path):
+    project = make_project(tmp_path)
+    jobs = prepare_batch_jobs(None, os.path.join(project, "model.do"), {"spec": ["1", "2"]}, 1)
+
+    async def run_all():
+        pool = Stata_pool(size=2, backend="echo")
+        try:
+            return await asyncio.gather(*(pool.submit(job["wrapper"]) for job in jobs))
+        finally:
+            await pool.close()
+
+    results = asyncio.run(run_all())
+    assert all(result.ok for result in results), [result.log for result in results]
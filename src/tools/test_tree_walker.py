@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+from tools import tree_walker
+from tools.tree_walker import iter_tree, walk_tree
+
+
+def make_lister(fanout, depth):
+    """A synthetic tree `fanout` wide and `depth` deep that records every listed directory"""
+    listed = []
+    lock = threading.Lock()
+
+    def lister(dir_path):
+        with lock:
+            listed.append(dir_path)
+        level = 0 if dir_path == "root" else dir_path.count("/")
+        is_dir = level + 1 < depth
+        return [(f"n{i:03d}", f"{dir_path}/n{i:03d}", is_dir) for i in range(fanout)]
+
+    return lister, listed
+
+
+def test_cursor_pages_continue_the_walk_without_starting_over():
+    lister, listed = make_lister(fanout=5, depth=3)
+    expected = list(iter_tree("root", lister=lister))
+    listed.clear()
+
+    pages = []
+    page, cursor = walk_tree("root", max_entries=7, lister=lister)
+    pages.extend(page)
+    while cursor is not None:
+        page, cursor = walk_tree("root", max_entries=7, lister=lister, cursor=cursor)
+        pages.extend(page)
+    assert pages == expected
+    assert listed.count("root") == 1
+    assert len(listed) == len(set(listed))
+
+
+def test_first_page_lists_a_bounded_number_of_directories(monkeypatch):
+    monkeypatch.setattr(tree_walker, "LISTING_WINDOW", 4)
+    lister, listed = make_lister(fanout=200, depth=2)
+    page, cursor = walk_tree("root", max_entries=250, lister=lister)
+    assert len(page) == 250 and cursor is not None
+    # the root, the directory being consumed and at most a window of listings ahead of it
+    assert len(listed) <= 1 + 1 + 4
+
+
+def test_cursor_is_single_use_and_bound_to_its_walk():
+    lister, _ = make_lister(fanout=5, depth=2)
+    _, cursor = walk_tree("root", max_entries=2, lister=lister)
+    with pytest.raises(ValueError):
+        walk_tree("root", max_depth=1, max_entries=2, lister=lister, cursor=cursor)
+    with pytest.raises(ValueError):
+        walk_tree("root", max_entries=2, lister=lister, cursor=cursor)
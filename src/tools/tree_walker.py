@@ -0,0 +1,173 @@
+import fnmatch
+import json
+import os
+import re
+import secrets
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from typing import Callable, Iterator, NamedTuple, Optional
+
+from tools.instrumentation import in_context
+
+DEFAULT_MAX_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# Directory listings in flight per walk; a walk abandoned after one page leaves at most this many behind
+LISTING_WINDOW = DEFAULT_MAX_WORKERS * 2
+MAX_CURSORS = 64
+
+
+class Tree_node(NamedTuple):
+    relative_path: str  # '/'-separated path relative to the walked root
+    name: str
+    is_dir: bool
+    depth: int  # 0 for direct children of the root
+
+
+# A lister returns (name, full_path, is_dir) for every entry of a directory
+Lister = Callable[[str], list[tuple[str, str, bool]]]
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Shared bounded pool so concurrent tree calls cannot oversubscribe the machine"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DEFAULT_MAX_WORKERS, thread_name_prefix="tree_walker")
+        return _executor
+
+
+def scandir_lister(dir_path: str) -> list[tuple[str, str, bool]]:
+    """List a directory with os.scandir without following symlinks"""
+    try:
+        with os.scandir(dir_path) as it:
+            return [(entry.name, entry.path, entry.is_dir(follow_symlinks=False)) for entry in it]
+    except OSError:
+        return []
+
+
+def compile_exclude_patterns(exclude_patterns: Optional[list[str]]) -> Optional[re.Pattern]:
+    patterns = [p.strip() for p in exclude_patterns or [] if p.strip()]
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(p)})" for p in patterns))
+
+
+def iter_tree(
+    root: str,
+    max_depth: Optional[int] = None,
+    exclude_patterns: Optional[list[str]] = None,
+    lister: Lister = scandir_lister,
+) -> Iterator[Tree_node]:
+    """Yield the entries below `root` level by level.
+
+    Every level is listed in parallel on the shared thread pool and yielded in a
+    stable order (parents first, names sorted), so a consumer that stops early
+    still sees the shallowest part of the tree. At most LISTING_WINDOW listings
+    run ahead of the consumer, so stopping early also stops the listing.
+    Excluded directories are not descended into; patterns are matched against
+    both the name and the relative path.
+    """
+    excluded = compile_exclude_patterns(exclude_patterns)
+    executor = _get_executor()
+    frontier: list[tuple[str, str]] = [(root, "")]
+    depth = 0
+    while frontier and (max_depth is None or depth < max_depth):
+        next_frontier: list[tuple[str, str]] = []
+        remaining = iter(frontier)
+        pending = deque(
+            (parent_rel, executor.submit(in_context(lister), full_path))
+            for full_path, parent_rel in islice(remaining, LISTING_WINDOW)
+        )
+        while pending:
+            parent_rel, future = pending.popleft()
+            for full_path, rel in islice(remaining, 1):
+                pending.append((rel, executor.submit(in_context(lister), full_path)))
+            for name, full_path, is_dir in sorted(future.result()):
+                rel = f"{parent_rel}/{name}" if parent_rel else name
+                if excluded is not None and (excluded.match(name) or excluded.match(rel)):
+                    continue
+                yield Tree_node(rel, name, is_dir, depth)
+                if is_dir:
+                    next_frontier.append((full_path, rel))
+        frontier = next_frontier
+        depth += 1
+
+
+class _Open_walk(NamedTuple):
+    key: tuple  # the walk's arguments, so a cursor cannot continue a different walk
+    nodes: Iterator[Tree_node]
+
+
+_cursors: OrderedDict[str, _Open_walk] = OrderedDict()
+_cursors_lock = threading.Lock()
+
+
+def walk_tree(
+    root: str,
+    max_depth: Optional[int] = None,
+    max_entries: Optional[int] = None,
+    exclude_patterns: Optional[list[str]] = None,
+    offset: int = 0,
+    lister: Lister = scandir_lister,
+    cursor: Optional[str] = None,
+) -> tuple[list[Tree_node], Optional[str]]:
+    """Return one page of `iter_tree` and a cursor for the next page, None after the last.
+
+    The walk behind a cursor is kept open (up to MAX_CURSORS of them), so the next
+    page continues where this one stopped instead of walking again from `root`;
+    `offset` skips entries of a fresh walk when no cursor is given.
+    """
+    key = (root, max_depth, tuple(exclude_patterns or ()), lister)
+    if cursor is not None:
+        with _cursors_lock:
+            walk = _cursors.pop(cursor, None)
+        if walk is None or walk.key != key:
+            raise ValueError(f"Unknown or expired cursor {cursor!r}, start again from the offset instead")
+        nodes = walk.nodes
+    else:
+        nodes = islice(iter_tree(root, max_depth, exclude_patterns, lister), offset, None)
+    if max_entries is None:
+        return list(nodes), None
+    page = list(islice(nodes, max_entries + 1))
+    if len(page) <= max_entries:
+        return page, None
+    next_cursor = secrets.token_hex(8)
+    with _cursors_lock:
+        _cursors[next_cursor] = _Open_walk(key, chain([page[-1]], nodes))
+        while len(_cursors) > MAX_CURSORS:
+            _cursors.popitem(last=False)
+    return page[:-1], next_cursor
+
+
+def nest_nodes(nodes: list[Tree_node]) -> list[dict]:
+    """Turn flat nodes into {name, type, children} dicts; nodes whose parent is not in
+    the page are attached at the top level under their relative path"""
+    by_path: dict[str, dict] = {}
+    top: list[dict] = []
+    for node in nodes:
+        item = {"name": node.name, "type": "directory" if node.is_dir else "file"}
+        if node.is_dir:
+            item["children"] = []
+        by_path[node.relative_path] = item
+        parent = by_path.get(node.relative_path.rpartition("/")[0]) if node.depth else None
+        if node.depth == 0:
+            top.append(item)
+        elif parent is not None:
+            parent["children"].append(item)
+        else:
+            item["name"] = node.relative_path
+            top.append(item)
+    return top
+
+
+def render_compact(nodes: list[Tree_node]) -> str:
+    """One relative path per line, directories marked with a trailing '/'"""
+    return "\n".join(f"{node.relative_path}/" if node.is_dir else node.relative_path for node in nodes)
+
+
+def render_json(nodes: list[Tree_node]) -> str:
+    return json.dumps(nest_nodes(nodes), separators=(",", ":"))